@@ -0,0 +1,189 @@
+"""
+异步batch模式
+多家公司并发处理，所有SEC请求共享 sec_client 里的同一个令牌桶限速器，
+这样整体请求速率正好贴着限额跑，而不是串行 + sleep(0.1) 远低于限额
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import sec_client
+from company_context import CompanyContext
+from task1_filings import get_filings_for_company
+from task1_financial_data import process_company_facts
+from task2_segment_geo import fetch_10k_html, extract_segment_geo_from_html, record_parse_metrics
+from main import quality_report_to_frame, save_company_csv
+from dataset_store import save_company_dataset
+from job_ledger import finish_job
+
+
+async def process_company_async(executor, ticker, cik, company_name, years_back=5,
+                                save_to_csv=True, include_segments=False, dataset_writer=None):
+    """
+    单个公司的异步处理流程（阻塞的requests调用放在线程池里跑）
+
+    Returns:
+        和 process_company 相同结构的结果字典
+    """
+    loop = asyncio.get_running_loop()
+    context = CompanyContext(cik, years_back)
+
+    # 1. filings列表和companyfacts同时下载
+    df_filings, company_facts = await asyncio.gather(
+        loop.run_in_executor(executor, get_filings_for_company, cik, years_back, context),
+        loop.run_in_executor(executor, lambda: context.company_facts),
+    )
+
+    # 2. 提取财务数据 + 质量检查
+    df_financial, quality_report, _, _ = await loop.run_in_executor(
+        executor, process_company_facts, company_facts, cik, years_back
+    )
+
+    # 3. （可选）10-K HTML并发下载，逐份解析
+    df_segment = pd.DataFrame()
+    df_geo = pd.DataFrame()
+    missing_reports = []
+    parse_timings = []
+    if include_segments and len(df_filings) > 0:
+        df_10k = df_filings[df_filings["form"].isin(["10-K", "10-K/A"])]
+        html_list = await asyncio.gather(
+            *[loop.run_in_executor(executor, fetch_10k_html, url) for url in df_10k["filing_url"]],
+            return_exceptions=True,
+        )
+        all_segment_data = []
+        all_geo_data = []
+        for (_, filing), html_content in zip(df_10k.iterrows(), html_list):
+            if isinstance(html_content, Exception):
+                missing_reports.append({
+                    "filing_date": filing["filing_date"],
+                    "type": "error",
+                    "url": filing["filing_url"],
+                    "error": str(html_content),
+                })
+                continue
+            result = await loop.run_in_executor(
+                executor, extract_segment_geo_from_html,
+                html_content, filing["filing_date"], filing["filing_url"],
+            )
+            record_parse_metrics(cik, result)
+            seg, geo, missing, timing = result
+            if seg is not None:
+                all_segment_data.append(seg)
+            if geo is not None:
+                all_geo_data.append(geo)
+            missing_reports.extend(missing)
+            parse_timings.append(timing)
+        if all_segment_data:
+            df_segment = pd.concat(all_segment_data, ignore_index=True)
+        if all_geo_data:
+            df_geo = pd.concat(all_geo_data, ignore_index=True)
+
+    if dataset_writer is not None:
+        # 只是放进后台写入器的队列，写盘和后面的抓取重叠
+        save_company_dataset(dataset_writer, cik, df_filings, df_financial,
+                             quality_report["results"], df_segment, df_geo)
+    elif save_to_csv:
+        df_quality_report = quality_report_to_frame(quality_report)
+        await loop.run_in_executor(
+            executor, save_company_csv,
+            ticker, cik, df_filings, df_financial, df_quality_report, df_segment, df_geo,
+        )
+
+    return {
+        "ticker": ticker,
+        "cik": cik,
+        "company_name": company_name,
+        "filings": df_filings,
+        "financial": df_financial,
+        "segment": df_segment,
+        "geographic": df_geo,
+        "missing_reports": missing_reports,
+        "parse_timings": parse_timings,
+        "quality_report": quality_report,
+    }
+
+
+async def run_batch_async(df_companies, years_back=5, rate=sec_client.SEC_MAX_REQUESTS_PER_SECOND,
+                          burst=None, max_in_flight=8, max_companies=None,
+                          save_to_csv=True, include_segments=False, dataset_writer=None, ledger=None):
+    """
+    并发处理一批公司
+
+    Args:
+        df_companies: 包含 ticker / cik / company_name 的DataFrame（registry.to_frame()）
+        years_back: 回溯年数
+        rate: 全局请求速率上限（req/s）；None表示沿用已经配置好的限速器（分布式worker，份额由心跳调整）
+        burst: 令牌桶容量，默认等于rate
+        max_in_flight: 同时在途的HTTP请求数上限
+        max_companies: 同时处理的公司数，默认等于 max_in_flight
+        save_to_csv: 是否保存CSV
+        include_segments: 是否同时抓10-K里的segment/geographic表格
+        dataset_writer: DatasetWriter；传了就写列式数据集而不是每家公司一组CSV
+        ledger: JobLedger；每家公司处理完就记一次台账
+
+    Returns:
+        (results, failed, stats)
+        results / failed 的格式和 final_step.py 写出的CSV一致，stats包含实际达到的请求速率
+    """
+    if rate is None:
+        limiter = sec_client.get_rate_limiter()
+    else:
+        limiter = sec_client.configure_rate_limit(rate, burst, max_in_flight)
+    max_companies = max_companies or max_in_flight
+    company_slots = asyncio.Semaphore(max_companies)
+    total = len(df_companies)
+
+    results = []
+    failed = []
+
+    # 线程数要比在途请求多一些，留给CPU处理和写文件
+    executor = ThreadPoolExecutor(max_workers=max_in_flight + max_companies)
+
+    async def run_one(idx, row):
+        async with company_slots:
+            ticker = row["ticker"]
+            if ledger is not None:
+                ledger.start(row["cik"], ticker, row["company_name"])
+            try:
+                result = await process_company_async(
+                    executor, ticker, row["cik"], row["company_name"],
+                    years_back, save_to_csv, include_segments, dataset_writer,
+                )
+                results.append({
+                    "ticker": ticker,
+                    "cik": row["cik"],
+                    "company_name": row["company_name"],
+                    "status": "success",
+                    "financial_records": len(result["financial"]),
+                    "filings_count": len(result["filings"]),
+                })
+                if ledger is not None:
+                    finish_job(ledger, row["cik"], len(result["financial"]), result["filings"], dataset_writer)
+                print(f"[{idx+1}/{total}] ✅ {ticker}")
+            except Exception as e:
+                print(f"[{idx+1}/{total}] ❌ {ticker}: {e}")
+                if ledger is not None:
+                    ledger.fail(row["cik"], e)
+                failed.append({
+                    "ticker": ticker,
+                    "cik": row["cik"],
+                    "company_name": row["company_name"],
+                    "error": str(e),
+                })
+
+    start = time.monotonic()
+    try:
+        await asyncio.gather(*[run_one(idx, row) for idx, (_, row) in enumerate(df_companies.iterrows())])
+    finally:
+        executor.shutdown(wait=True)
+    elapsed = time.monotonic() - start
+
+    stats = limiter.stats()
+    stats["elapsed_seconds"] = elapsed
+    stats["companies"] = total
+    return results, failed, stats
+
+
+def run_batch(df_companies, **kwargs):
+    """run_batch_async 的同步入口"""
+    return asyncio.run(run_batch_async(df_companies, **kwargs))
@@ -0,0 +1,281 @@
+"""
+端到端benchmark：用录好的HTTP语料回放整个流程，输出机器可读的JSON
+
+语料（tickers、submissions、companyfacts、10-K HTML）先录一次：
+    python benchmark.py --record bench_corpus AAPL MSFT JPM
+之后每次都离线回放，不发任何请求，结果只和代码有关：
+    python benchmark.py --corpus bench_corpus --output bench_v2.json --compare bench_v1.json
+
+阶段：
+    ticker_lookup    TickerRegistry加载 + 逐个ticker查CIK
+    process_company  filings + companyfacts提取 + 单公司质量检查（main.process_company，不写文件）
+    segment_geo      10-K下载 + 解析（get_segment_geographic_data）
+    quality_checks   所有公司拼成一个面板跑一次 run_quality_checks
+每个阶段记录 wall / CPU 时间、处理量和吞吐量；另外记录整体wall / CPU 和峰值RSS
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+import sec_client
+from first_01 import TickerRegistry
+from main import process_company
+from task1_financial_data import run_quality_checks
+from task2_segment_geo import get_segment_geographic_data
+
+CORPUS_MANIFEST = "benchmark_corpus.json"
+BENCH_STAGES = ["ticker_lookup", "process_company", "segment_geo", "quality_checks"]
+
+
+def _peak_rss_bytes():
+    """进程到目前为止的峰值RSS（Linux上ru_maxrss单位是KB，macOS上是字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class _Stage:
+    """计一个阶段的wall / CPU时间，结束时算吞吐量"""
+
+    def __init__(self, results, name, unit):
+        self.results = results
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.extra = {}
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        self.results[self.name] = dict({
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "items": self.items,
+            "unit": self.unit,
+            "throughput_per_second": self.items / wall if wall > 0 else None,
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }, **self.extra)
+        return False
+
+
+def run_pipeline(tickers, years_back=5, include_segments=True, verbose=False):
+    """
+    跑一遍被测的流程（网络 / 录制 / 回放都是这一段）
+
+    Returns:
+        {stage: {wall_seconds, cpu_seconds, items, unit, throughput_per_second, peak_rss_bytes, ...}}
+    """
+    stages = {}
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with out, tempfile.TemporaryDirectory() as tmp:
+        with _Stage(stages, "ticker_lookup", "tickers") as stage:
+            # 临时路径 + force_refresh：不读本地ticker缓存，也不带条件请求头（录制时要拿到完整的200）
+            registry = TickerRegistry.load(cache_path=os.path.join(tmp, "company_tickers.json"),
+                                           force_refresh=True)
+            companies = {}
+            for ticker in tickers:
+                company = registry.lookup(ticker)
+                if company is not None:
+                    companies[ticker] = company
+            stage.items = len(tickers)
+
+        panels = []
+        with _Stage(stages, "process_company", "companies") as stage:
+            rows = filings = 0
+            for ticker, (cik, _) in companies.items():
+                result = process_company(ticker, years_back, save_to_csv=False, registry=registry)
+                df_financial = result["financial"]
+                if len(df_financial) > 0:
+                    panels.append(df_financial.assign(cik=cik))
+                rows += len(df_financial)
+                filings += len(result["filings"])
+                stage.items += 1
+            stage.extra = {"fact_rows": rows, "filings": filings}
+
+        if include_segments:
+            with _Stage(stages, "segment_geo", "companies") as stage:
+                segment_rows = geo_rows = missing_count = 0
+                for ticker, (cik, _) in companies.items():
+                    df_segment, df_geo, missing = get_segment_geographic_data(cik, years_back)
+                    segment_rows += len(df_segment)
+                    geo_rows += len(df_geo)
+                    missing_count += len(missing)
+                    stage.items += 1
+                stage.extra = {"segment_rows": segment_rows, "geo_rows": geo_rows, "missing_reports": missing_count}
+
+        with _Stage(stages, "quality_checks", "fact_rows") as stage:
+            df_panel = pd.concat(panels, ignore_index=True) if panels else pd.DataFrame()
+            df_results = run_quality_checks(df_panel) if len(df_panel) > 0 else pd.DataFrame()
+            stage.items = len(df_panel)
+            stage.extra = {"result_rows": len(df_results)}
+    return stages
+
+
+def record_corpus(corpus_dir, tickers, years_back=5, include_segments=True):
+    """联网跑一遍流程，把所有响应录到 corpus_dir，并写语料清单"""
+    sec_client.configure_fixtures(corpus_dir, mode="record")
+    try:
+        run_pipeline(tickers, years_back, include_segments)
+        report = sec_client.fixture_report()
+    finally:
+        sec_client.configure_fixtures(None)
+    manifest = {
+        "tickers": list(tickers),
+        "years_back": years_back,
+        "include_segments": include_segments,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "responses": report["recorded"],
+        "bytes": report["bytes"],
+    }
+    with open(os.path.join(corpus_dir, CORPUS_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def run_benchmark(corpus_dir, repeat=1, label=None, verbose=False):
+    """
+    回放语料跑 repeat 遍
+
+    Returns:
+        结果dict（写成JSON的内容）；每个阶段的数字取 repeat 遍的中位数，runs 里是每一遍的原始结果
+    """
+    with open(os.path.join(corpus_dir, CORPUS_MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    runs = []
+    sec_client.configure_fixtures(corpus_dir, mode="replay")
+    try:
+        for _ in range(repeat):
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            stages = run_pipeline(manifest["tickers"], manifest["years_back"],
+                                  manifest.get("include_segments", True), verbose)
+            runs.append({
+                "wall_seconds": time.perf_counter() - wall,
+                "cpu_seconds": time.process_time() - cpu,
+                "stages": stages,
+            })
+        fixtures = sec_client.fixture_report()
+    finally:
+        sec_client.configure_fixtures(None)
+
+    def median(values):
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    stages = {}
+    for name in runs[0]["stages"]:
+        per_run = [run["stages"][name] for run in runs]
+        stages[name] = {
+            key: (median([r[key] for r in per_run]) if isinstance(per_run[0][key], (int, float)) else per_run[0][key])
+            for key in per_run[0]
+        }
+    return {
+        "label": label,
+        "git_commit": _git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": dict(manifest, dir=os.path.abspath(corpus_dir)),
+        "fixtures_missing": fixtures["missing"] // max(repeat, 1),
+        "repeat": repeat,
+        "wall_seconds": median([run["wall_seconds"] for run in runs]),
+        "cpu_seconds": median([run["cpu_seconds"] for run in runs]),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "stages": stages,
+        "runs": runs,
+    }
+
+
+def compare_results(current, baseline):
+    """
+    和之前的结果比较
+
+    Returns:
+        DataFrame：每个阶段（和total）的 wall / cpu / 吞吐量，以及相对baseline的变化（%）
+    """
+    rows = []
+    pairs = [("total", current, baseline)] + [
+        (name, current["stages"][name], baseline["stages"].get(name))
+        for name in current["stages"]
+    ]
+    for name, cur, base in pairs:
+        row = {"stage": name}
+        for key in ("wall_seconds", "cpu_seconds", "throughput_per_second"):
+            value = cur.get(key)
+            old = base.get(key) if base else None
+            row[key] = value
+            row[f"{key}_change_pct"] = (value - old) / old * 100 if value is not None and old else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def print_results(result):
+    print(f"\nBenchmark {result['label'] or ''} @ {result['git_commit']} "
+          f"({len(result['corpus']['tickers'])} companies, repeat={result['repeat']})")
+    print(f"  wall {result['wall_seconds']:.3f}s  cpu {result['cpu_seconds']:.3f}s  "
+          f"peak RSS {result['peak_rss_bytes'] / 1024 ** 2:.0f} MB")
+    for name, stage in result["stages"].items():
+        throughput = stage["throughput_per_second"]
+        throughput = f"{throughput:,.1f} {stage['unit']}/s" if throughput is not None else "-"
+        print(f"  {name:<16} wall {stage['wall_seconds']:8.3f}s  cpu {stage['cpu_seconds']:8.3f}s  {throughput}")
+    if result["fixtures_missing"]:
+        print(f"  ⚠️ {result['fixtures_missing']} requests had no recorded response (corpus incomplete)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用录好的HTTP语料回放整个流程并计时")
+    parser.add_argument("tickers", nargs="*", help="录制时用的ticker")
+    parser.add_argument("--record", metavar="DIR", default=None, help="联网录制语料到这个目录")
+    parser.add_argument("--corpus", metavar="DIR", default=None, help="回放这个目录里的语料")
+    parser.add_argument("--years-back", type=int, default=5)
+    parser.add_argument("--no-segments", action="store_true", help="不跑segment/geo阶段")
+    parser.add_argument("--repeat", type=int, default=1, help="回放几遍（结果取中位数）")
+    parser.add_argument("--label", default=None, help="写进结果里的版本标签")
+    parser.add_argument("--output", default="benchmark_result.json", help="结果JSON")
+    parser.add_argument("--compare", default=None, help="和之前的结果JSON比较")
+    parser.add_argument("--verbose", action="store_true", help="保留流程本身的输出")
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.tickers:
+            parser.error("--record needs at least one ticker")
+        manifest = record_corpus(args.record, args.tickers, args.years_back, not args.no_segments)
+        print(f"Recorded {manifest['responses']} responses ({manifest['bytes'] / 1024 ** 2:.1f} MB) to {args.record}")
+    if args.corpus:
+        result = run_benchmark(args.corpus, args.repeat, args.label, args.verbose)
+        print_results(result)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results saved to {args.output}")
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"\nCompared with {baseline.get('label') or ''} @ {baseline.get('git_commit')}:")
+            print(compare_results(result, baseline).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    elif not args.record:
+        parser.error("nothing to do: pass --record DIR and/or --corpus DIR")
@@ -0,0 +1,222 @@
+"""
+Bulk模式：直接读取SEC每晚发布的 companyfacts.zip / submissions.zip
+https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip
+https://www.sec.gov/Archives/edgar/daily-index/bulkdata/submissions.zip
+
+全量跑的时候不用再对每个公司发两个JSON请求（约2万次、受限速约束要好几个小时），
+下载两个zip之后就是纯本地的CPU任务；zip成员不解压到磁盘，直接流式读取，
+按成员分块交给进程池并行处理，提取逻辑和在线模式完全相同
+"""
+import argparse
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from task1_filings import filings_from_submissions_batch, fetch_submission_pages
+from task1_financial_data import extract_financial_data_from_stream, standardize_financial_data, run_quality_checks
+from fact_history import canonicalize_facts
+
+# 每个进程一次处理的成员数
+MEMBER_CHUNK_SIZE = 200
+
+# CIK0000320193.json；submissions.zip里还有 CIK0000320193-submissions-001.json 这样的分页文件
+MEMBER_RE = re.compile(r"^CIK(\d{10})\.json$")
+
+
+def list_company_members(zip_path, ciks=None):
+    """
+    zip里每个公司的主文件名（分页文件不算）
+
+    Args:
+        zip_path: zip文件路径
+        ciks: 只要这些CIK（10位字符串），None表示全部
+
+    Returns:
+        [(cik, member_name), ...]
+    """
+    wanted = set(ciks) if ciks is not None else None
+    with zipfile.ZipFile(zip_path) as zf:
+        members = []
+        for name in zf.namelist():
+            m = MEMBER_RE.match(os.path.basename(name))
+            if m and (wanted is None or m.group(1) in wanted):
+                members.append((m.group(1), name))
+    return members
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _ingest_companyfacts_chunk(zip_path, members, years_back):
+    """
+    进程池里执行：提取 + 标准化一批companyfacts成员（质量检查在汇总后对整个面板一次做完）
+
+    Returns:
+        [(cik, df_financial, error), ...]
+    """
+    out = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for cik, name in members:
+            try:
+                with zf.open(name) as fp:
+                    df_financial = extract_financial_data_from_stream(fp, years_back)
+                if len(df_financial) == 0:
+                    out.append((cik, None, "No us-gaap facts in range"))
+                    continue
+                out.append((cik, standardize_financial_data(df_financial), None))
+            except Exception as e:
+                out.append((cik, None, str(e)))
+    return out
+
+
+def _ingest_submissions_chunk(zip_path, members, years_back):
+    """
+    进程池里执行：读一批submissions成员，整批一次向量化筛选
+
+    Returns:
+        [(cik, df_filings, error), ...]；整批的filings放在cik为None的那一条里，
+        读取失败的公司各一条（df_filings为None）
+    """
+    out = []
+    documents = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for cik, name in members:
+            try:
+                with zf.open(name) as fp:
+                    data = json.load(fp)
+                # 分页文件和主文件在zip的同一个目录里
+                folder = os.path.dirname(name)
+                def load_page(page_name):
+                    with zf.open(f"{folder}/{page_name}" if folder else page_name) as fp:
+                        return json.load(fp)
+                pages = fetch_submission_pages(data, years_back, max_workers=1, load_page=load_page)
+                documents.append((cik, data, pages))
+            except Exception as e:
+                out.append((cik, None, str(e)))
+    out.append((None, filings_from_submissions_batch(documents, years_back), None))
+    return out
+
+
+def _run_chunks(func, zip_path, members, years_back, workers, chunk_size):
+    """把成员分块，用进程池并行处理；workers=0 时在当前进程里顺序处理"""
+    chunks = _chunks(members, chunk_size)
+    if workers == 0:
+        for chunk in chunks:
+            yield from func(zip_path, chunk, years_back)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, zip_path, chunk, years_back) for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def ingest_companyfacts_zip(zip_path, years_back=5, workers=None, ciks=None, chunk_size=MEMBER_CHUNK_SIZE):
+    """
+    从 companyfacts.zip 提取所有公司的财务数据并做质量检查
+
+    Args:
+        zip_path: 本地 companyfacts.zip 路径
+        years_back: 回溯年数
+        workers: 进程数，默认CPU核数；0表示不开进程池
+        ciks: 只处理这些CIK，None表示全部
+        chunk_size: 每个任务处理的成员数
+
+    Returns:
+        (df_financial, df_quality_report, failed)
+        df_financial 带 cik 列；df_quality_report 是 run_quality_checks 的结构化结果表；
+        failed 是 [{"cik", "error"}, ...]
+    """
+    members = list_company_members(zip_path, ciks)
+    workers = os.cpu_count() if workers is None else workers
+
+    financial_frames = []
+    failed = []
+    for cik, df_financial, error in _run_chunks(
+        _ingest_companyfacts_chunk, zip_path, members, years_back, workers, chunk_size
+    ):
+        if error is not None:
+            failed.append({"cik": cik, "error": error})
+            continue
+        df_financial.insert(0, "cik", cik)
+        financial_frames.append(df_financial)
+
+    df_financial_all = pd.concat(financial_frames, ignore_index=True) if financial_frames else pd.DataFrame()
+    # 所有公司的质量检查在一个面板上一次跑完
+    df_quality_all = run_quality_checks(df_financial_all)
+    return df_financial_all, df_quality_all, failed
+
+
+def ingest_submissions_zip(zip_path, years_back=5, workers=None, ciks=None, chunk_size=MEMBER_CHUNK_SIZE):
+    """
+    从 submissions.zip 提取所有公司的10-K/10-Q列表
+
+    Returns:
+        (df_filings, failed)
+    """
+    members = list_company_members(zip_path, ciks)
+    workers = os.cpu_count() if workers is None else workers
+
+    frames = []
+    failed = []
+    for cik, df_filings, error in _run_chunks(
+        _ingest_submissions_chunk, zip_path, members, years_back, workers, chunk_size
+    ):
+        if error is not None:
+            failed.append({"cik": cik, "error": error})
+        elif len(df_filings) > 0:
+            frames.append(df_filings)
+
+    df_filings_all = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df_filings_all, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从SEC bulk zip导入数据")
+    parser.add_argument("--companyfacts", help="companyfacts.zip 路径")
+    parser.add_argument("--submissions", help="submissions.zip 路径")
+    parser.add_argument("--years-back", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认CPU核数")
+    parser.add_argument("--prefix", default="bulk", help="输出文件名前缀")
+    parser.add_argument("--dataset", default=None, help="写到这个Parquet数据集目录，而不是CSV")
+    parser.add_argument("--canonical", action="store_true",
+                        help="财务数据去重后只存历史表（原始报告 + 重述），代替逐条的原始记录")
+    args = parser.parse_args()
+
+    start = time.time()
+    failed = []
+    dataset_writer = None
+    if args.dataset:
+        from dataset_store import DatasetWriter
+        dataset_writer = DatasetWriter(args.dataset)
+
+    def save(table, df, csv_name=None):
+        if dataset_writer is not None:
+            dataset_writer.write(table, df)
+        else:
+            df.to_csv(f"{args.prefix}_{csv_name or table}.csv", index=False)
+
+    if args.submissions:
+        df_filings, failed_filings = ingest_submissions_zip(args.submissions, args.years_back, args.workers)
+        save("filings", df_filings)
+        failed.extend({**f, "source": "submissions"} for f in failed_filings)
+        print(f"Filings: {len(df_filings)} records")
+    if args.companyfacts:
+        df_financial, df_quality, failed_facts = ingest_companyfacts_zip(args.companyfacts, args.years_back, args.workers)
+        if args.canonical:
+            _, df_history = canonicalize_facts(df_financial)
+            save("fact_history", df_history)
+            print(f"Canonical facts: {len(df_history)} rows (from {len(df_financial)} raw records)")
+        else:
+            save("financial", df_financial)
+        save("quality", df_quality, "quality_report")
+        failed.extend({**f, "source": "companyfacts"} for f in failed_facts)
+        print(f"Financial data: {len(df_financial)} records")
+    if dataset_writer is not None:
+        dataset_writer.close()
+    pd.DataFrame(failed).to_csv(f"{args.prefix}_failed.csv", index=False)
+    print(f"Failed: {len(failed)}")
+    print(f"Done in {time.time() - start:.1f}s")
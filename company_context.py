@@ -0,0 +1,87 @@
+"""
+每家公司一个的共享上下文
+
+一家公司的完整流程里，filings列表、财务数据、segment/geo几个阶段都要用submissions，
+以前每个阶段各自请求一次（get_filings_for_company 在 process_company 里调一次，
+get_segment_geographic_data 里又调一次）。CompanyContext 把 submissions / companyfacts /
+filings列表各下载（解析）一次，所有阶段共用；几个阶段在不同线程里同时要同一份数据时，
+只有第一个去取，其他的等它（sec_get 本身也会合并同一个URL的在途请求）
+"""
+import threading
+import metrics
+from sec_client import sec_get
+from first_01 import get_sec_headers
+from task1_filings import filings_from_submissions, fetch_submission_pages
+from task1_financial_data import fetch_company_facts
+
+
+class CompanyContext:
+    """
+    Args:
+        cik: 10位CIK字符串
+        years_back: 回溯年数（filings列表用）
+
+    用法:
+        context = CompanyContext(cik, years_back)
+        df_filings = get_filings_for_company(cik, years_back, context=context)
+        df_financial, report, _, _ = get_financial_data_for_company(cik, years_back, context=context)
+        df_segment, df_geo, missing = get_segment_geographic_data(cik, years_back, context=context)
+    """
+
+    def __init__(self, cik, years_back=5):
+        self.cik = cik
+        self.years_back = years_back
+        self._lock = threading.Lock()
+        self._locks = {}  # 属性名 -> Lock，不同属性可以同时加载
+        self._values = {}
+
+    def _load(self, name, loader):
+        """第一次访问时加载，之后直接返回；加载失败不缓存，下次访问重试"""
+        if name in self._values:
+            return self._values[name]
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._values:
+                self._values[name] = loader()
+            return self._values[name]
+
+    @property
+    def submissions(self):
+        """submissions JSON（dict）"""
+        def load():
+            url = f"https://data.sec.gov/submissions/CIK{self.cik}.json"
+            with metrics.timer("submissions_fetch", self.cik) as t:
+                resp = sec_get(url, headers=get_sec_headers())
+                resp.raise_for_status()
+                t.bytes = len(resp.content)
+                return resp.json()
+        return self._load("submissions", load)
+
+    @property
+    def company_facts(self):
+        """companyfacts JSON（dict）"""
+        return self._load("company_facts", lambda: fetch_company_facts(self.cik))
+
+    @property
+    def filings(self):
+        """过去 years_back 年的10-K/10-Q列表，和 get_filings_for_company 的返回值一样（含需要的分页）"""
+        def load():
+            data = self.submissions
+            # submissions_fetch 已经在 submissions 里记过一次了，分页单独记
+            with metrics.timer("submissions_pages", self.cik):
+                pages = fetch_submission_pages(data, self.years_back)
+            return filings_from_submissions(data, self.cik, self.years_back, pages)
+        return self._load("filings", load)
+
+    def ten_k_filings(self):
+        """10-K（含10-K/A），返回 [(filing_date, filing_url), ...]"""
+        df_filings = self.filings
+        if len(df_filings) == 0:
+            return []
+        df_10k = df_filings[df_filings["form"].isin(["10-K", "10-K/A"])]
+        return list(zip(df_10k["filing_date"], df_10k["filing_url"]))
+
+    def loaded(self):
+        """已经加载了哪些数据（调试用）"""
+        return sorted(self._values)
@@ -0,0 +1,400 @@
+"""
+列式数据集存储（Parquet，按表和CIK区间分区）
+
+全量跑的时候每家公司写3~5个CSV，最后是几万个小文本文件，写得慢、ls慢、再读回来更慢。
+这里把每家公司的结果追加到一个数据集里：
+
+    {root}/table=financial/cik_bucket=3/part-00001-xxxx.parquet
+
+- 每张表固定schema（日期是date32，metric/form/unit等是dictionary编码，相当于分类代码）
+- CIK按 CIK_BUCKET_SIZE 分桶，同一个桶的数据在内存里攒够 flush_rows 行才落一个文件，
+  不会产生大量小文件；文件内按 metric/fiscal_year 排序，row group统计信息可以用来跳过数据
+- 写入在后台线程里做（DatasetWriter），抓数据的线程只负责把DataFrame放进队列
+- 缓冲区里的数据进程崩溃就丢了，所以台账要等公司的数据真正写进文件后再登记成功：
+  DatasetWriter.commit(cik, callback) 在这家公司的缓冲全部落盘后才调用callback（见 job_ledger.finish_job）
+
+读取用 load_table / load_financial，只读需要的列和分区，例如
+    load_financial(metrics="revenue", fiscal_years=2023, columns=["cik", "value"])
+"""
+import os
+import queue
+import threading
+import uuid
+from datetime import date
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import metrics
+
+DATASET_DIR = "sec_dataset"
+CIK_BUCKET_SIZE = 100000  # 每个分区覆盖的CIK区间大小
+FLUSH_ROWS = 200000  # 每个分区攒够这么多行写一个文件
+ROW_GROUP_SIZE = 50000
+WRITER_QUEUE_SIZE = 64
+
+_COMMIT = "__commit__"  # 队列里的特殊项：(_COMMIT, (cik, callback, args))
+_CHECKPOINT = "__checkpoint__"
+
+_category = pa.dictionary(pa.int32(), pa.string())
+
+TABLE_SCHEMAS = {
+    "filings": pa.schema([
+        ("cik", pa.string()),
+        ("form", _category),
+        ("filing_date", pa.date32()),
+        ("accession_number", pa.string()),
+        ("primary_document", pa.string()),
+        ("filing_url", pa.string()),
+        ("fiscal_year", pa.int32()),
+    ]),
+    "financial": pa.schema([
+        ("cik", pa.string()),
+        ("metric", _category),
+        ("metric_name", _category),
+        ("value", pa.float64()),
+        ("unit", _category),
+        ("fiscal_year", pa.int32()),
+        ("fiscal_period", _category),
+        ("form", _category),
+        ("filed_date", pa.date32()),
+        ("start_date", pa.date32()),
+        ("end_date", pa.date32()),
+        ("frame", pa.string()),
+        ("Accession_Number", pa.string()),
+    ]),
+    # fact_history.canonicalize_facts 的历史表（去重后的事实 + 重述记录）
+    "fact_history": pa.schema([
+        ("cik", pa.string()),
+        ("metric", _category),
+        ("unit", _category),
+        ("start_date", pa.date32()),
+        ("end_date", pa.date32()),
+        ("value", pa.float64()),
+        ("filed_date", pa.date32()),
+        ("known_until", pa.date32()),
+        ("revision", pa.int32()),
+        ("Accession_Number", pa.string()),
+        ("form", _category),
+        ("metric_name", _category),
+        ("fiscal_year", pa.int32()),
+        ("fiscal_period", _category),
+        ("frame", pa.string()),
+    ]),
+    "quality": pa.schema([
+        ("cik", pa.string()),
+        ("fiscal_year", pa.int32()),
+        ("check", _category),
+        ("status", _category),
+        ("lhs", pa.float64()),
+        ("rhs", pa.float64()),
+        ("diff", pa.float64()),
+        ("diff_pct", pa.float64()),
+        ("message", pa.string()),
+        ("checked_at", pa.date32()),  # 检查日期；增量更新后同一年可能有多次检查，取最新的
+    ]),
+    # segment / geographic 表格是宽表（year_2023, year_2022, ...），存的时候转成长表
+    "segment": pa.schema([
+        ("cik", pa.string()),
+        ("name", pa.string()),
+        ("fiscal_year", pa.int32()),
+        ("value", pa.float64()),
+        ("filing_date", pa.date32()),
+        ("filing_url", pa.string()),
+        ("scale", pa.float64()),  # value乘以scale是美元（iXBRL是1，表格按单位说明识别，不知道时为空）
+    ]),
+}
+TABLE_SCHEMAS["geographic"] = TABLE_SCHEMAS["segment"]
+
+# 文件内的排序键：按常见的查询条件排序，row group的min/max才有过滤效果
+TABLE_SORT_KEYS = {
+    "filings": ["form", "filing_date"],
+    "financial": ["metric", "fiscal_year", "cik"],
+    "fact_history": ["metric", "end_date", "cik", "filed_date"],
+    "quality": ["check", "fiscal_year", "cik"],
+    "segment": ["fiscal_year", "cik"],
+    "geographic": ["fiscal_year", "cik"],
+}
+
+PARTITIONING = ds.partitioning(pa.schema([("cik_bucket", pa.int32())]), flavor="hive")
+
+
+def cik_bucket(cik):
+    """CIK -> 分区号"""
+    return int(cik) // CIK_BUCKET_SIZE
+
+
+def _wide_to_long(df):
+    """parse_revenue_table 的宽表（name, year_XXXX...）转成 name/fiscal_year/value 长表"""
+    year_cols = [c for c in df.columns if str(c).startswith("year_")]
+    id_cols = [c for c in df.columns if c not in year_cols]
+    df_long = df.melt(id_vars=id_cols, value_vars=year_cols, var_name="fiscal_year", value_name="value")
+    df_long["fiscal_year"] = df_long["fiscal_year"].str[len("year_"):].astype("int64")
+    return df_long.dropna(subset=["value"])
+
+
+def to_arrow_table(table, df):
+    """
+    DataFrame -> 按表schema转换类型的 pyarrow.Table
+    schema里有、df里没有的列填null；df里多出来的列丢掉
+    """
+    schema = TABLE_SCHEMAS[table]
+    if table in ("segment", "geographic"):
+        df = _wide_to_long(df)
+    columns = []
+    for field in schema:
+        if field.name not in df.columns:
+            columns.append(pa.nulls(len(df), field.type))
+            continue
+        col = df[field.name]
+        if pa.types.is_date32(field.type):
+            col = pd.to_datetime(col, errors="coerce").dt.date
+        elif pa.types.is_integer(field.type):
+            col = pd.to_numeric(col, errors="coerce").astype("Int64")
+        elif pa.types.is_floating(field.type):
+            col = pd.to_numeric(col, errors="coerce")
+        elif pa.types.is_dictionary(field.type) or pa.types.is_string(field.type):
+            col = col.astype("string")
+        arr = pa.array(col, from_pandas=True)
+        columns.append(arr.cast(field.type) if arr.type != field.type else arr)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class DatasetWriter:
+    """
+    后台写入器：write() 只是把数据放进队列，后台线程负责转换类型、按分区缓冲、攒够了写Parquet
+
+    Args:
+        root: 数据集目录
+        flush_rows: 每个分区缓冲多少行写一个文件
+        queue_size: 队列长度（写盘跟不上时 write() 会阻塞，内存不会无限涨）
+
+    用法:
+        with DatasetWriter() as writer:
+            writer.write("financial", df_financial, cik=cik)
+    """
+
+    def __init__(self, root=DATASET_DIR, flush_rows=FLUSH_ROWS, queue_size=WRITER_QUEUE_SIZE):
+        self.root = root
+        self.flush_rows = flush_rows
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buffers = {}  # (table, bucket) -> [pa.Table, ...]
+        self._buffered_rows = {}
+        self._buffer_ciks = {}  # (table, bucket) -> 缓冲里有数据的CIK
+        self._commits = []  # [还没落盘的分区, callback, args]
+        self._error = None
+        self.stats = {"frames": 0, "rows": 0, "files": 0, "bytes": 0}
+        os.makedirs(root, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="dataset-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, table, df, cik=None):
+        """
+        追加一个DataFrame
+
+        Args:
+            table: TABLE_SCHEMAS 里的表名
+            df: 数据；cik为None时df必须有cik列（多公司一起写）
+            cik: 这份数据所属的CIK
+        """
+        if table not in TABLE_SCHEMAS:
+            raise ValueError(f"Unknown table: {table}")
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+        if df is None or len(df) == 0:
+            return
+        if cik is not None:
+            df = df.assign(cik=cik)
+        if table == "quality" and "checked_at" not in df.columns:
+            df = df.assign(checked_at=date.today())
+        self._queue.put((table, df))
+
+    def commit(self, cik, callback, *args):
+        """
+        cik 之前 write() 的数据全部写进Parquet文件后调用 callback(*args)
+
+        缓冲不满 flush_rows 时会等到以后的写盘、checkpoint() 或 close()；
+        callback 在后台线程里执行，写盘失败的话永远不会被调用
+        """
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+        self._queue.put((_COMMIT, (str(cik), callback, args)))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._flush_all()
+                    return
+                if self._error is not None:
+                    continue
+                if item[0] == _COMMIT:
+                    self._add_commit(*item[1])
+                elif item[0] == _CHECKPOINT:
+                    self._flush_all()
+                else:
+                    self._add(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _add(self, table, df):
+        data = to_arrow_table(table, df)
+        buckets = pc.divide(pc.cast(data["cik"], pa.int64()), CIK_BUCKET_SIZE)
+        for bucket in pc.unique(buckets).to_pylist():
+            part = data.filter(pc.equal(buckets, bucket))
+            key = (table, bucket)
+            self._buffers.setdefault(key, []).append(part)
+            self._buffered_rows[key] = self._buffered_rows.get(key, 0) + part.num_rows
+            self._buffer_ciks.setdefault(key, set()).update(pc.unique(part["cik"]).to_pylist())
+            if self._buffered_rows[key] >= self.flush_rows:
+                self._flush(key)
+        self.stats["frames"] += 1
+        self.stats["rows"] += data.num_rows
+
+    def _add_commit(self, cik, callback, args):
+        keys = {key for key, ciks in self._buffer_ciks.items() if cik in ciks}
+        if keys:
+            self._commits.append([keys, callback, args])
+        else:
+            callback(*args)
+
+    def _flush(self, key):
+        parts = self._buffers.pop(key, None)
+        self._buffered_rows.pop(key, None)
+        self._buffer_ciks.pop(key, None)
+        if not parts:
+            return
+        with metrics.timer("dataset_write") as t:
+            t.bytes = self._write_parts(key, parts)
+            t.rows = sum(part.num_rows for part in parts)
+        # 这个分区写完了，数据全部落盘的公司可以登记了
+        waiting = []
+        for commit in self._commits:
+            commit[0].discard(key)
+            if commit[0]:
+                waiting.append(commit)
+            else:
+                commit[1](*commit[2])
+        self._commits = waiting
+
+    def _write_parts(self, key, parts):
+        """一个分区的缓冲排序后写成一个Parquet文件，返回文件大小"""
+        table, bucket = key
+        data = pa.concat_tables(parts).unify_dictionaries().combine_chunks()
+        # dictionary列不能直接sort_by，用解码后的值算排序下标
+        keys = TABLE_SORT_KEYS[table]
+        sort_keys = pa.table({
+            c: data[c].cast(pa.string()) if pa.types.is_dictionary(data.schema.field(c).type) else data[c]
+            for c in keys
+        })
+        data = data.take(pc.sort_indices(sort_keys, [(c, "ascending") for c in keys]))
+        directory = os.path.join(self.root, f"table={table}", f"cik_bucket={bucket}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+        tmp_path = path + ".tmp"
+        pq.write_table(data, tmp_path, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        self.stats["files"] += 1
+        self.stats["bytes"] += size
+        return size
+
+    def _flush_all(self):
+        for key in list(self._buffers):
+            self._flush(key)
+
+    def flush(self):
+        """等队列里的数据处理完（缓冲区里不满 flush_rows 的部分仍然留在内存）"""
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+
+    def checkpoint(self):
+        """把所有缓冲（包括不满 flush_rows 的）写盘，等待中的 commit() 回调都会执行；会产生较小的文件，不要频繁调用"""
+        self._queue.put((_CHECKPOINT, None))
+        self.flush()
+
+    def close(self):
+        """把所有缓冲写盘并结束后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Dataset writer failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def save_company_dataset(writer, cik, df_filings, df_financial, df_quality_results,
+                         df_segment=None, df_geo=None):
+    """save_company_csv 的数据集版本：一个公司的所有结果追加到数据集"""
+    writer.write("filings", df_filings, cik=cik)
+    writer.write("financial", df_financial, cik=cik)
+    writer.write("quality", df_quality_results, cik=cik)
+    writer.write("segment", df_segment, cik=cik)
+    writer.write("geographic", df_geo, cik=cik)
+
+
+def _equals_any(field, values):
+    if isinstance(values, (list, tuple, set)):
+        return ds.field(field).isin(list(values))
+    return ds.field(field) == values
+
+
+def load_table(table, root=DATASET_DIR, columns=None, filters=None, ciks=None):
+    """
+    读取一张表
+
+    Args:
+        table: 表名
+        root: 数据集目录
+        columns: 只读这些列（None表示全部）
+        filters: {列名: 值或值列表}，或者直接传 pyarrow.dataset 表达式
+        ciks: 只读这些CIK（会先按CIK区间裁剪分区）
+
+    Returns:
+        DataFrame（dictionary列读出来是category）
+    """
+    path = os.path.join(root, f"table={table}")
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns or TABLE_SCHEMAS[table].names)
+    dataset = ds.dataset(path, schema=TABLE_SCHEMAS[table].append(pa.field("cik_bucket", pa.int32())),
+                         format="parquet", partitioning=PARTITIONING)
+
+    expr = None
+    if isinstance(filters, dict):
+        for field, values in filters.items():
+            cond = _equals_any(field, values)
+            expr = cond if expr is None else expr & cond
+    elif filters is not None:
+        expr = filters
+    if ciks is not None:
+        ciks = [ciks] if isinstance(ciks, str) else list(ciks)
+        cond = ds.field("cik_bucket").isin(sorted({cik_bucket(c) for c in ciks})) & ds.field("cik").isin(ciks)
+        expr = cond if expr is None else expr & cond
+
+    columns = columns or TABLE_SCHEMAS[table].names
+    return dataset.to_table(columns=columns, filter=expr).to_pandas(date_as_object=False)
+
+
+def load_financial(metrics=None, fiscal_years=None, fiscal_period=None, columns=None, ciks=None, root=DATASET_DIR):
+    """
+    读取财务数据，例如 2023年所有公司的revenue：
+        load_financial(metrics="revenue", fiscal_years=2023)
+    """
+    filters = {}
+    if metrics is not None:
+        filters["metric"] = metrics
+    if fiscal_years is not None:
+        filters["fiscal_year"] = fiscal_years
+    if fiscal_period is not None:
+        filters["fiscal_period"] = fiscal_period
+    return load_table("financial", root, columns=columns, filters=filters or None, ciks=ciks)
@@ -0,0 +1,187 @@
+"""
+事实去重 + 重述历史 + as-of索引
+
+companyfacts里同一个数会出现很多次：10-K里带着前两年的比较数，10-Q带着去年同期，
+10-K/A又会重述。这里把 extract_financial_data 的输出收敛成：
+- 历史表（history）：每个 (metric, unit, start_date, end_date) 只在数值变化时留一行，
+  即原始报告 + 每一次重述，known_until 是被下一次重述取代的日期
+- 最新表（latest）：每个 (metric, unit, start_date, end_date) 一行，取最新重述后的值
+
+AsOfIndex 在历史表上按 (key, filed_date) 建排序数组，
+"D这一天已知的值"用 numpy.searchsorted 二分查找，不用每次过滤DataFrame（回测用）
+"""
+import numpy as np
+import pandas as pd
+
+# 一个事实的身份：同一个指标、同一个单位、同一个期间
+HISTORY_KEY = ["metric", "unit", "start_date", "end_date"]
+
+HISTORY_COLUMNS = HISTORY_KEY + [
+    "value", "filed_date", "known_until", "revision", "Accession_Number", "form",
+    "metric_name", "fiscal_year", "fiscal_period", "frame",
+]
+
+# 组合键 key_id << _KEY_SHIFT | 日期(天)，一个int64里同时按key和日期排序
+_KEY_SHIFT = 32
+
+
+def _key_columns(df):
+    """多公司面板时key里加上cik"""
+    return (["cik"] if "cik" in df.columns else []) + HISTORY_KEY
+
+
+def canonicalize_facts(df_financial):
+    """
+    收敛重复事实，保留重述历史
+
+    Args:
+        df_financial: extract_financial_data 的输出（可以是带cik列的多公司面板）
+
+    Returns:
+        (df_latest, df_history)
+        df_history: 列见 HISTORY_COLUMNS，按key和filed_date排序；
+            fiscal_year / fiscal_period / frame 取第一次报告这个期间时的值
+            （后来的filing里的比较数带的是那份filing自己的fy/fp）
+        df_latest: 每个key一行（最新的值），多两列 first_filed_date、revisions（重述次数）
+    """
+    key = _key_columns(df_financial)
+    if len(df_financial) == 0:
+        df_history = pd.DataFrame(columns=key[:-len(HISTORY_KEY)] + HISTORY_COLUMNS)
+        return df_history.assign(first_filed_date=[], revisions=[]), df_history
+
+    df = df_financial.sort_values(key + ["filed_date", "Accession_Number"], kind="stable").reset_index(drop=True)
+    key_id = df.groupby(key, dropna=False, sort=False).ngroup().to_numpy()
+    value = df["value"].to_numpy()
+
+    # 第一次出现，或者数值和同一key的上一条不一样（重述）才保留
+    new_key = np.r_[True, key_id[1:] != key_id[:-1]]
+    changed = np.r_[True, value[1:] != value[:-1]]
+    keep = new_key | changed
+
+    # 原始报告的fy/fp/frame（frame在SEC数据里只挂在其中一条上，取第一个非空的）
+    by_key = df.groupby(key_id, sort=False)
+    original = {col: by_key[col].transform("first") for col in ("fiscal_year", "fiscal_period", "frame")}
+
+    df_history = df.loc[keep, key + ["value", "filed_date", "Accession_Number", "form", "metric_name"]]
+    for col, values in original.items():
+        df_history[col] = values[keep].to_numpy()
+    kept_ids = key_id[keep]
+    df_history["revision"] = pd.Series(kept_ids).groupby(kept_ids).cumcount().to_numpy()
+    next_same_key = np.r_[kept_ids[1:] == kept_ids[:-1], False]
+    next_filed = np.r_[df_history["filed_date"].to_numpy()[1:], None]
+    df_history["known_until"] = np.where(next_same_key, next_filed, None)
+    df_history = df_history[key[:-len(HISTORY_KEY)] + HISTORY_COLUMNS].reset_index(drop=True)
+
+    last = ~next_same_key
+    first_filed = df_history.groupby(kept_ids, sort=False)["filed_date"].transform("first")
+    df_latest = df_history[last].assign(
+        first_filed_date=first_filed[last].to_numpy(),
+        revisions=df_history["revision"][last].to_numpy(),
+    ).drop(columns=["known_until"]).reset_index(drop=True)
+    return df_latest, df_history
+
+
+def _to_days(dates):
+    """日期（字符串/datetime） -> 1970-01-01起的天数（int64）"""
+    return pd.to_datetime(dates).to_numpy().astype("datetime64[D]").astype("int64")
+
+
+def _day(date):
+    """单个日期 -> 天数（点查询用，避免每次走 pd.to_datetime）"""
+    return np.datetime64(str(date)[:10], "D").astype("int64")
+
+
+def _norm(value):
+    """key里的值统一成字符串（日期列可能是字符串，也可能是从Parquet读回来的datetime）"""
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+class AsOfIndex:
+    """
+    历史表上的as-of查询
+
+    Args:
+        df_history: canonicalize_facts 返回的 df_history
+
+    用法:
+        index = AsOfIndex(df_history)
+        index.value("revenue", "2023-12-31", as_of="2024-03-01", start_date="2023-01-01")
+        index.as_of("2024-03-01", metric="revenue")   # 那天已知的所有revenue
+    """
+
+    def __init__(self, df_history):
+        self.key_columns = _key_columns(df_history)
+        df = df_history.sort_values(self.key_columns + ["filed_date"], kind="stable").reset_index(drop=True)
+        self.history = df
+        self._key_ids = df.groupby(self.key_columns, dropna=False, sort=False).ngroup().to_numpy().astype("int64")
+        self._composite = (self._key_ids << _KEY_SHIFT) | _to_days(df["filed_date"])
+        self._values = df["value"].to_numpy()
+
+        # key表（每个key一行，行号就是key_id），按条件选key时只扫这张小表
+        first_rows = np.r_[True, self._key_ids[1:] != self._key_ids[:-1]] if len(df) else np.array([], dtype=bool)
+        self.keys = df.loc[first_rows, self.key_columns].reset_index(drop=True)
+        self._lookup = {
+            tuple(_norm(v) for v in row): key_id
+            for key_id, row in enumerate(self.keys.itertuples(index=False, name=None))
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    def select(self, **filters):
+        """
+        按key列选key_id，例如 select(metric="revenue", cik="0000320193")
+        值可以是单个值或列表
+        """
+        mask = np.ones(len(self.keys), dtype=bool)
+        for col, values in filters.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            mask &= self.keys[col].isin(list(values)).to_numpy()
+        return np.flatnonzero(mask)
+
+    def snapshot(self, as_of, key_ids=None):
+        """
+        as_of 当天已知的值（每个key取 filed_date <= as_of 的最后一次报告/重述）
+
+        Args:
+            as_of: 日期
+            key_ids: 只查这些key，None表示全部
+
+        Returns:
+            history的子集DataFrame；as_of时还没报告过的key不出现
+        """
+        ids = np.arange(len(self.keys), dtype="int64") if key_ids is None else np.asarray(key_ids, dtype="int64")
+        if len(ids) == 0 or len(self._composite) == 0:
+            return self.history.iloc[:0]
+        day = _day(as_of)
+        pos = np.searchsorted(self._composite, (ids << _KEY_SHIFT) | day, side="right") - 1
+        found = pos >= 0
+        found[found] = self._key_ids[pos[found]] == ids[found]
+        return self.history.iloc[pos[found]]
+
+    def as_of(self, as_of, **filters):
+        """snapshot + select，例如 as_of("2024-03-01", metric=["revenue", "net_income"])"""
+        return self.snapshot(as_of, self.select(**filters) if filters else None)
+
+    def value(self, metric, end_date, as_of, start_date=None, unit="USD", cik=None):
+        """
+        单个事实在 as_of 当天已知的值
+
+        Returns:
+            float；那天还没报告（或没有这个事实）时返回None
+        """
+        key = (metric, unit, start_date, end_date)
+        if "cik" in self.key_columns:
+            key = (cik,) + key
+        key_id = self._lookup.get(tuple(_norm(v) for v in key))
+        if key_id is None:
+            return None
+        target = (key_id << _KEY_SHIFT) | _day(as_of)
+        pos = np.searchsorted(self._composite, target, side="right") - 1
+        if pos < 0 or self._key_ids[pos] != key_id:
+            return None
+        return self._values[pos]
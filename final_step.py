@@ -1,52 +1,203 @@
 from main import process_company
-from first_01 import fetch_company_tickers
+from first_01 import TickerRegistry
+from job_ledger import JobLedger, JOB_LEDGER_PATH, finish_job
+import argparse
 import time
 import pandas as pd
 
-# 获取所有公司列表
-df_companies = fetch_company_tickers()
-print(f"总共 {len(df_companies)} 家公司")
-
-# 批量处理
-results = []
-failed = []
-
-for idx, row in df_companies.iterrows():
-    ticker = row['ticker']
-    cik = row['cik']
-    
-    try:
-        print(f"\n[{idx+1}/{len(df_companies)}] 处理 {ticker} ({row['company_name']})")
-        result = process_company(ticker, years_back=5, save_to_csv=True)
-        results.append({
-            'ticker': ticker,
-            'cik': cik,
-            'company_name': row['company_name'],
-            'status': 'success',
-            'financial_records': len(result['financial']),
-            'filings_count': len(result['filings'])
-        })
-        print(f"✅ {ticker} 完成")
-        
-    except Exception as e:
-        print(f"❌ {ticker} 失败: {e}")
-        failed.append({
-            'ticker': ticker,
-            'cik': cik,
-            'company_name': row['company_name'],
-            'error': str(e)
-        })
-    
-    # 添加延迟，避免请求过快
-    time.sleep(0.1)
-
-# 保存处理结果
-df_results = pd.DataFrame(results)
-df_results.to_csv("batch_processing_results.csv", index=False)
-
-df_failed = pd.DataFrame(failed)
-df_failed.to_csv("batch_processing_failed.csv", index=False)
-
-print(f"\n处理完成！")
-print(f"成功: {len(results)} 家")
-print(f"失败: {len(failed)} 家")
\ No newline at end of file
+
+def run_serial(registry, df_companies, years_back=5, dataset_writer=None, ledger=None):
+    """
+    串行模式：一家一家处理（请求速率由 sec_client 的限速器控制）
+    传了ledger（JobLedger）时每处理完一家公司就写一次台账
+    """
+    results = []
+    failed = []
+
+    for idx, row in df_companies.iterrows():
+        ticker = row['ticker']
+        cik = row['cik']
+
+        if ledger is not None:
+            ledger.start(cik, ticker, row['company_name'])
+        try:
+            print(f"\n[{idx+1}/{len(df_companies)}] 处理 {ticker} ({row['company_name']})")
+            result = process_company(ticker, years_back=years_back, save_to_csv=True, registry=registry,
+                                     dataset_writer=dataset_writer)
+            results.append({
+                'ticker': ticker,
+                'cik': cik,
+                'company_name': row['company_name'],
+                'status': 'success',
+                'financial_records': len(result['financial']),
+                'filings_count': len(result['filings'])
+            })
+            if ledger is not None:
+                finish_job(ledger, cik, len(result['financial']), result['filings'], dataset_writer)
+            print(f"✅ {ticker} 完成")
+
+        except Exception as e:
+            print(f"❌ {ticker} 失败: {e}")
+            if ledger is not None:
+                ledger.fail(cik, e)
+            failed.append({
+                'ticker': ticker,
+                'cik': cik,
+                'company_name': row['company_name'],
+                'error': str(e)
+            })
+
+    return results, failed
+
+
+def save_batch_results(results, failed):
+    """保存处理结果"""
+    df_results = pd.DataFrame(results)
+    df_results.to_csv("batch_processing_results.csv", index=False)
+
+    df_failed = pd.DataFrame(failed)
+    df_failed.to_csv("batch_processing_failed.csv", index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量处理所有公司")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="并发模式：多家公司同时处理，共享一个限速器")
+    parser.add_argument("--rate", type=float, default=10, help="请求速率上限（req/s），默认10")
+    parser.add_argument("--burst", type=float, default=None, help="令牌桶容量，默认等于rate")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="同时在途的请求数上限")
+    parser.add_argument("--segments", action="store_true", help="同时抓取segment/geographic数据（仅并发模式）")
+    parser.add_argument("--years-back", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None, help="只处理前N家公司（测试用）")
+    parser.add_argument("--output", choices=["csv", "dataset"], default="csv",
+                        help="csv: 每家公司一组CSV；dataset: 追加到Parquet列式数据集")
+    parser.add_argument("--dataset-dir", default="sec_dataset", help="数据集目录（--output dataset）")
+    parser.add_argument("--ledger", default=None, help="任务台账路径，默认 .sec_cache/jobs.sqlite")
+    parser.add_argument("--retry-failed", action="store_true", help="只重跑台账里失败的公司")
+    parser.add_argument("--restart", action="store_true", help="清空台账，从头开始")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量更新：只处理有新10-K/10-Q的公司（和台账里上次的filing比较）")
+    parser.add_argument("--form-index", nargs="+", default=None,
+                        help="本地EDGAR每日索引文件（form.*.idx / master.*.idx），增量模式用它判断，不逐家查submissions")
+    parser.add_argument("--role", choices=["coordinator", "worker"], default=None,
+                        help="多机分片：coordinator把公司放进共享队列，worker（每台机器一个）领任务处理")
+    parser.add_argument("--queue", default=None, help="共享任务队列（SQLite）路径，--role 时必填")
+    parser.add_argument("--worker-id", default=None, help="worker标识，默认 host-pid-随机后缀")
+    parser.add_argument("--lease-batch", type=int, default=16, help="worker一次领几家公司")
+    parser.add_argument("--metrics", default=None,
+                        help="各阶段耗时/计数的JSON快照路径（运行中每分钟更新一次），如 metrics_snapshot.json")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="在 127.0.0.1:PORT/metrics 提供Prometheus文本格式的指标")
+    args = parser.parse_args()
+
+    import metrics
+    if args.metrics:
+        import atexit
+        atexit.register(metrics.start_snapshot_writer(args.metrics))  # 退出时写最后一次
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    if args.role and not args.queue:
+        parser.error("--role needs --queue")
+    if args.role == "worker":
+        # worker不需要ticker列表和本地台账，任务都从队列里来；--rate 由coordinator统一设置
+        from work_queue import run_worker
+        dataset_writer = None
+        if args.output == "dataset":
+            from dataset_store import DatasetWriter
+            dataset_writer = DatasetWriter(args.dataset_dir)
+        results, failed, stats = run_worker(
+            args.queue, args.worker_id, args.years_back,
+            max_in_flight=args.max_in_flight, batch_size=args.lease_batch,
+            include_segments=args.segments, dataset_writer=dataset_writer,
+        )
+        if dataset_writer is not None:
+            dataset_writer.close()
+        print(f"\nWorker {stats['worker_id']}: 成功 {len(results)} 家，失败 {len(failed)} 家，"
+              f"{stats['requests']} 个请求，{stats['achieved_rate']:.2f} req/s（份额 {stats['rate_share']:.2f} req/s）")
+        raise SystemExit(0)
+
+    # 获取所有公司列表（本地缓存，一次加载，整个batch共用）
+    registry = TickerRegistry.load()
+    df_companies = registry.to_frame()
+    if args.limit:
+        df_companies = df_companies.head(args.limit)
+
+    if args.role == "coordinator":
+        from work_queue import run_coordinator
+        start = time.time()
+        queue = run_coordinator(args.queue, df_companies, args.rate,
+                                retry_failed=args.retry_failed, restart=args.restart)
+        save_batch_results(queue.results(), queue.failures())
+        print(f"\n处理完成！用时 {time.time() - start:.1f} 秒")
+        print(f"队列: {queue.summary()}")
+        raise SystemExit(0)
+
+    # 台账：已经成功的公司跳过（崩溃后重跑从断点继续）
+    ledger = JobLedger(args.ledger or JOB_LEDGER_PATH)
+    if args.restart:
+        ledger.reset()
+    total = len(df_companies)
+    if not args.incremental:
+        df_companies = ledger.pending(df_companies, retry_failed=args.retry_failed).reset_index(drop=True)
+        print(f"总共 {total} 家公司，本次处理 {len(df_companies)} 家")
+
+    dataset_writer = None
+    if args.output == "dataset":
+        from dataset_store import DatasetWriter
+        dataset_writer = DatasetWriter(args.dataset_dir)
+
+    start = time.time()
+    if args.incremental:
+        from sec_client import configure_rate_limit
+        from incremental import run_incremental
+        configure_rate_limit(args.rate, args.burst, args.max_in_flight)
+        results, failed, stats = run_incremental(
+            df_companies, ledger, args.years_back,
+            form_index=args.form_index,
+            dataset_writer=dataset_writer,
+            include_segments=args.segments,
+            max_in_flight=args.max_in_flight,
+        )
+    elif args.use_async:
+        from async_batch import run_batch
+        results, failed, stats = run_batch(
+            df_companies,
+            years_back=args.years_back,
+            rate=args.rate,
+            burst=args.burst,
+            max_in_flight=args.max_in_flight,
+            include_segments=args.segments,
+            dataset_writer=dataset_writer,
+            ledger=ledger,
+        )
+        print(f"\n请求数: {stats['requests']}，实际速率: {stats['achieved_rate']:.2f} req/s "
+              f"(上限 {stats['rate_limit']:.0f} req/s)")
+        from sec_client import concurrency_report, http_stats
+        concurrency = concurrency_report()
+        if concurrency:
+            print(f"限流: {concurrency['throttled']} 次429/503，重试 {http_stats()['retries']} 次，"
+                  f"在途上限 {concurrency['lowest_limit']:.1f}-{concurrency['highest_limit']:.1f}"
+                  f"（当前 {concurrency['limit']:.1f}）")
+    else:
+        from sec_client import configure_rate_limit
+        configure_rate_limit(args.rate, args.burst)
+        results, failed = run_serial(registry, df_companies, args.years_back, dataset_writer, ledger)
+
+    if dataset_writer is not None:
+        dataset_writer.close()
+        print(f"数据集: {dataset_writer.stats['rows']} 行，{dataset_writer.stats['files']} 个文件 "
+              f"({dataset_writer.stats['bytes'] / 1024 ** 2:.1f} MB) -> {args.dataset_dir}")
+    # 结果文件按台账写（包括之前几次运行已经完成的公司）
+    save_batch_results(ledger.results(), ledger.failures())
+
+    from sec_client import cache_report
+    report = cache_report()
+    if report:
+        print(f"缓存: 命中 {report['hits']}，304 {report['revalidated']}，未命中 {report['misses']}"
+              f"（命中率 {report['hit_rate']:.1%}）")
+
+    print(f"\n处理完成！用时 {time.time() - start:.1f} 秒")
+    print(f"成功: {len(results)} 家")
+    print(f"失败: {len(failed)} 家")
+    print(f"台账: {ledger.summary()}")
@@ -1,7 +1,15 @@
 import requests
 import json
+import os
+import time
 import pandas as pd
 from datetime import datetime, timedelta
+from sec_client import sec_get
+import metrics
+
+# ticker列表的本地缓存（company_tickers.json 一天更新一次，没必要每个公司都下载一遍）
+TICKER_CACHE_PATH = os.path.join(".sec_cache", "company_tickers.json")
+TICKER_CACHE_TTL = 24 * 3600  # 秒
 
 def get_sec_headers():
     """返回SEC要求的User-Agent"""
@@ -10,12 +18,8 @@ def get_sec_headers():
     }
 
 
-def fetch_company_tickers(url="https://www.sec.gov/files/company_tickers.json"):
-    """获取所有公司的ticker和CIK映射"""
-    resp = requests.get(url, headers=get_sec_headers())
-    resp.raise_for_status()
-    data = resp.json()
-    
+def _records_from_tickers_json(data):
+    """把company_tickers.json的原始内容转成记录列表"""
     records = []
     for record in data.values():
         rec = {
@@ -25,10 +29,131 @@ def fetch_company_tickers(url="https://www.sec.gov/files/company_tickers.json"):
             #"mainfinancedate": f"https://data.sec.gov/api/xbrl/companyfacts/CIK{str(record.get("cik_str")).rjust(10, "0")}.json"
         }
         records.append(rec)
-    
-    df = pd.DataFrame(records)
+    return records
+
+
+def fetch_company_tickers(url="https://www.sec.gov/files/company_tickers.json"):
+    """获取所有公司的ticker和CIK映射"""
+    resp = sec_get(url, headers=get_sec_headers())
+    resp.raise_for_status()
+    data = resp.json()
+
+    df = pd.DataFrame(_records_from_tickers_json(data))
     return df #(this will be de_companies)
 
+
+class TickerRegistry:
+    """
+    ticker <-> CIK 的索引（带本地缓存）
+
+    用法：
+        registry = TickerRegistry.load()
+        cik, company_name = registry.lookup("AAPL")
+        registry.tickers_for_cik("0000320193")  # ["AAPL"]
+
+    两个字典都是O(1)查找，代替 df_companies[df_companies["ticker"] == ticker] 的整表扫描；
+    和原来一样是精确匹配（区分大小写，"aapl" 找不到）
+
+    company_tickers.json 只缓存在 cache_path 这一个文件里，请求时不再写 sec_client 的响应缓存
+    """
+
+    def __init__(self, records, fetched_at=None):
+        self.records = records
+        self.fetched_at = fetched_at
+        self._by_ticker = {}
+        self._by_cik = {}
+        for rec in records:
+            ticker = rec["ticker"]
+            if ticker is None:
+                continue
+            # 同一个ticker出现多次时保留第一条（和原来的 iloc[0] 一致）
+            self._by_ticker.setdefault(ticker, (rec["cik"], rec["company_name"]))
+            self._by_cik.setdefault(rec["cik"], []).append(ticker)
+
+    @classmethod
+    @metrics.timed("ticker_load")
+    def load(cls, cache_path=TICKER_CACHE_PATH, ttl=TICKER_CACHE_TTL,
+             url="https://www.sec.gov/files/company_tickers.json", force_refresh=False):
+        """
+        读取本地缓存；过期后用 ETag / Last-Modified 做条件请求刷新
+
+        Args:
+            cache_path: 缓存文件路径
+            ttl: 缓存有效期（秒）
+            url: company_tickers.json 地址
+            force_refresh: 忽略TTL，强制向SEC确认
+
+        Returns:
+            TickerRegistry
+        """
+        cached = None
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = None  # 缓存损坏就当作没有
+
+        if cached and not force_refresh and time.time() - cached.get("fetched_at", 0) < ttl:
+            return cls(_records_from_tickers_json(cached["data"]), cached["fetched_at"])
+
+        headers = get_sec_headers()
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            resp = sec_get(url, headers=headers, use_cache=False)
+            if resp.status_code == 304 and cached:
+                # 内容没变，只刷新时间戳
+                cached["fetched_at"] = time.time()
+            else:
+                resp.raise_for_status()
+                cached = {
+                    "fetched_at": time.time(),
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                    "data": resp.json(),
+                }
+        except requests.RequestException as e:
+            if not cached:
+                raise
+            # 网络失败时退回到过期的缓存，总比整个batch挂掉好
+            print(f"Warning: ticker refresh failed ({e}), using cached copy")
+            return cls(_records_from_tickers_json(cached["data"]), cached.get("fetched_at"))
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(tmp_path, cache_path)
+
+        return cls(_records_from_tickers_json(cached["data"]), cached["fetched_at"])
+
+    def lookup(self, ticker):
+        """ticker -> (cik, company_name)，找不到返回None"""
+        with metrics.timer("ticker_lookup"):
+            return self._by_ticker.get(ticker)
+
+    def tickers_for_cik(self, cik):
+        """cik(10位) -> 该公司的所有ticker（可能有多个share class）"""
+        return list(self._by_cik.get(str(cik).rjust(10, "0"), []))
+
+    def to_frame(self):
+        """返回和 fetch_company_tickers() 相同格式的DataFrame"""
+        return pd.DataFrame(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, ticker):
+        return ticker in self._by_ticker
+
+
 if __name__ == "__main__":
     df = fetch_company_tickers()
     print(f"Total companies: {len(df)}")
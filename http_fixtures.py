@@ -0,0 +1,130 @@
+"""
+HTTP响应的录制/回放（benchmark和离线测试用）
+
+录制（record）：正常请求SEC，把每个200响应的内容原样存到目录里；
+回放（replay）：所有请求都从目录里读，不发任何网络请求、不经过限速器和响应缓存，
+这样同一份语料每次跑的结果和耗时都可以比较，不受网络波动影响。
+
+文件按URL存放，方便查看和手工增删：
+    https://data.sec.gov/submissions/CIK0000320193.json
+    -> {root}/data.sec.gov/submissions/CIK0000320193.json
+    -> {root}/data.sec.gov/submissions/CIK0000320193.json.meta.json（状态码、Content-Type、编码）
+用法见 sec_client.configure_fixtures
+"""
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+
+FIXTURE_MODES = ("record", "replay")
+
+
+class FixtureStore:
+    """
+    Args:
+        root: 语料目录
+        mode: "record" 或 "replay"
+    """
+
+    def __init__(self, root, mode="replay"):
+        if mode not in FIXTURE_MODES:
+            raise ValueError(f"Invalid fixture mode: {mode} (expected one of {FIXTURE_MODES})")
+        self.root = root
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "missing": 0, "bytes": 0}
+        self.missing = []  # 回放时找不到的URL
+        if mode == "record":
+            os.makedirs(root, exist_ok=True)
+
+    def path_for(self, url):
+        """URL -> 文件路径（host/path，查询串里的字符换成下划线）"""
+        parts = urlsplit(url)
+        path = parts.path.lstrip("/") or "index"
+        if path.endswith("/"):
+            path += "index"
+        if parts.query:
+            path += "_" + "".join(c if c.isalnum() else "_" for c in parts.query)
+        return os.path.join(self.root, parts.netloc, *path.split("/"))
+
+    def save(self, url, resp):
+        """录制一个响应（只录200；body是解压后的内容）"""
+        if resp.status_code != 200:
+            return
+        path = self.path_for(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = resp.content
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        with open(path + ".meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "status": resp.status_code,
+                "content_type": resp.headers.get("Content-Type"),
+                "encoding": resp.encoding,
+            }, f)
+        with self._lock:
+            self.stats["recorded"] += 1
+            self.stats["bytes"] += len(body)
+
+    def _meta(self, path):
+        try:
+            with open(path + ".meta.json", encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            return {}
+
+    def _miss(self, url):
+        with self._lock:
+            self.stats["missing"] += 1
+            self.missing.append(url)
+
+    def response(self, url):
+        """
+        回放：URL -> requests.Response
+        语料里没有的URL返回404（调用方 raise_for_status 时报错，fetch_frame 之类当作不存在）
+        """
+        path = self.path_for(url)
+        resp = requests.Response()
+        resp.url = url
+        resp.from_cache = True
+        if not os.path.exists(path):
+            self._miss(url)
+            resp.status_code = 404
+            resp._content = b""
+            return resp
+        with open(path, "rb") as f:
+            body = f.read()
+        meta = self._meta(path)
+        resp.status_code = meta.get("status", 200)
+        resp._content = body
+        resp.encoding = meta.get("encoding")
+        resp.headers = CaseInsensitiveDict({"Content-Type": meta.get("content_type") or ""})
+        with self._lock:
+            self.stats["replayed"] += 1
+            self.stats["bytes"] += len(body)
+        return resp
+
+    def open(self, url):
+        """
+        回放的流式版本：返回文件对象（sec_stream 用）
+
+        Raises:
+            requests.HTTPError: 语料里没有这个URL
+        """
+        path = self.path_for(url)
+        if not os.path.exists(path):
+            self._miss(url)
+            raise requests.HTTPError(f"404 Client Error: no fixture for url: {url}")
+        with self._lock:
+            self.stats["replayed"] += 1
+            self.stats["bytes"] += os.path.getsize(path)
+        return open(path, "rb")
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, mode=self.mode, root=self.root)
@@ -0,0 +1,261 @@
+"""
+增量更新：只重新处理有新10-K/10-Q的公司
+
+每天真正有新filing的公司只有几百家，没必要整个universe重跑一遍。
+判断"有没有新filing"有两种来源：
+- 本地的EDGAR每日索引文件（form.YYYYMMDD.idx / master.YYYYMMDD.idx），不发任何请求
+- 每家公司的submissions
+和任务台账（job_ledger）里记的最后一份filing比较，有变化的公司才去拉companyfacts / 10-K。
+run_incremental 运行期间把JSON缓存的TTL设成0：submissions / companyfacts 每次都发条件请求，
+没变化时是304（很便宜），不会用到24小时内的旧缓存——旧submissions会看不见新filing，
+旧companyfacts配上新accession登记进台账，新数据就再也不会被补上
+写数据集时只追加比上次更新的行（按accession/提交日期），写CSV时整份覆盖
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import sec_client
+from sec_client import sec_get
+from first_01 import get_sec_headers
+from task1_filings import filings_from_submissions, fetch_submission_pages
+from task1_financial_data import get_financial_data_for_company
+from task2_segment_geo import run_segment_pipeline
+from main import quality_report_to_frame, save_company_csv
+from dataset_store import save_company_dataset
+from job_ledger import finish_job
+
+PERIODIC_FORMS = ["10-K", "10-K/A", "10-Q", "10-Q/A"]
+
+# form.idx: 定宽列，Form Type 里可能有空格（"SC 13G"），按两个以上空格切
+_FORM_IDX_RE = re.compile(r"^(\S.*?)\s{2,}(.+?)\s{2,}(\d+)\s+(\d{8}|\d{4}-\d{2}-\d{2})\s+(edgar/\S+)\s*$")
+_ACCESSION_RE = re.compile(r"(\d{10}-\d{2}-\d{6})")
+
+
+def parse_form_index(path, forms=PERIODIC_FORMS):
+    """
+    读取本地的EDGAR每日索引文件
+
+    Args:
+        path: form.YYYYMMDD.idx（定宽）或 master.YYYYMMDD.idx（竖线分隔）
+        forms: 只保留这些表单类型
+
+    Returns:
+        DataFrame: cik（10位）, form, filing_date（YYYY-MM-DD）, accession_number
+    """
+    rows = []
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            if "|" in line:
+                parts = line.rstrip("\n").split("|")
+                if len(parts) != 5 or not parts[0].strip().isdigit():
+                    continue  # 表头
+                cik, _, form, filed, filename = parts
+            else:
+                m = _FORM_IDX_RE.match(line)
+                if not m:
+                    continue
+                form, _, cik, filed, filename = m.groups()
+            form = form.strip()
+            if form not in forms:
+                continue
+            accession = _ACCESSION_RE.search(filename)
+            filed = filed.strip().replace("-", "")
+            rows.append({
+                "cik": cik.strip().zfill(10),
+                "form": form,
+                "filing_date": f"{filed[:4]}-{filed[4:6]}-{filed[6:8]}",
+                "accession_number": accession.group(1) if accession else None,
+            })
+    return pd.DataFrame(rows, columns=["cik", "form", "filing_date", "accession_number"])
+
+
+def latest_filings_from_index(paths):
+    """一个或多个索引文件 -> 每个CIK最新的一份10-K/10-Q"""
+    paths = [paths] if isinstance(paths, str) else paths
+    df = pd.concat([parse_form_index(p) for p in paths], ignore_index=True)
+    return df.sort_values(["filing_date", "accession_number"]).drop_duplicates("cik", keep="last")
+
+
+def latest_filing_from_submissions(cik, years_back=5):
+    """
+    从submissions取公司最新的一份10-K/10-Q
+
+    Returns:
+        (df_filings, latest_accession, latest_filing_date)；没有filing时后两个是None
+    """
+    url = f"https://data.sec.gov/submissions/CIK{cik}.json"
+    resp = sec_get(url, headers=get_sec_headers())
+    resp.raise_for_status()
+    data = resp.json()
+    df_filings = filings_from_submissions(data, cik, years_back, fetch_submission_pages(data, years_back))
+    if len(df_filings) == 0:
+        return df_filings, None, None
+    latest = df_filings.iloc[0]  # 按日期由近到远
+    return df_filings, latest["accession_number"], latest["filing_date"]
+
+
+def find_changed_companies(df_companies, ledger, form_index=None, years_back=5, max_in_flight=8):
+    """
+    找出需要更新的公司
+
+    台账里没有成功记录的公司都算要更新；成功过的公司只有出现了新的10-K/10-Q才算
+    （上次在回溯窗口里没有10-K/10-Q的公司，这次还是没有的话不算）
+
+    Args:
+        df_companies: registry.to_frame()
+        ledger: JobLedger
+        form_index: 本地EDGAR索引文件路径（或路径列表）；None时查每家公司的submissions
+        years_back: 回溯年数
+        max_in_flight: 查submissions时同时在途的请求数（速率由 sec_client 的全局限速器控制）
+
+    Returns:
+        (df_changed, filings_by_cik)
+        df_changed 是 df_companies 的子集，多一列 last_filing_date（台账里上次的，没有是NaN）；
+        filings_by_cik 是查submissions时顺便拿到的filings列表，后面不用再请求
+    """
+    df_companies = df_companies.drop_duplicates("cik")
+    df_jobs = ledger.to_frame("success")[["cik", "last_accession", "last_filing_date"]]
+    df = df_companies.merge(df_jobs, on="cik", how="left", indicator=True)
+    never_done = df.pop("_merge") == "left_only"
+    filings_by_cik = {}
+
+    if form_index is not None:
+        df_index = latest_filings_from_index(form_index)
+        df = df.merge(
+            df_index[["cik", "accession_number", "filing_date"]], on="cik", how="left"
+        )
+        has_new = df["accession_number"].notna() & (
+            (df["accession_number"] != df["last_accession"])
+            & ~(df["filing_date"] < df["last_filing_date"])
+        )
+        changed = never_done | has_new
+    else:
+        changed = never_done.copy()
+        df_done = df[~never_done]
+        # 和 run_batch 一样多线程并发请求，整体速率由共享的限速器控制（逐家串行要跑一整遍universe）
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = {
+                i: executor.submit(latest_filing_from_submissions, cik, years_back)
+                for i, cik in zip(df_done.index, df_done["cik"])
+            }
+            for i, future in futures.items():
+                row = df_done.loc[i]
+                try:
+                    df_filings, accession, _ = future.result()
+                except Exception as e:
+                    print(f"❌ {row['ticker']}: {e}")
+                    changed.loc[i] = True
+                    continue
+                filings_by_cik[row["cik"]] = df_filings
+                changed.loc[i] = accession is not None and accession != row["last_accession"]
+
+    df_changed = df.loc[changed, list(df_companies.columns) + ["last_filing_date"]].reset_index(drop=True)
+    return df_changed, filings_by_cik
+
+
+def update_company(row, years_back=5, df_filings=None, dataset_writer=None, save_to_csv=True,
+                   include_segments=False):
+    """
+    更新一家公司
+
+    Args:
+        row: find_changed_companies 返回的一行（ticker / cik / company_name / last_filing_date）
+        df_filings: 已经拿到的filings列表（None时重新请求）
+        dataset_writer: 有的话只把上次之后的新行追加到数据集；否则整份覆盖CSV
+
+    Returns:
+        (df_filings, df_financial)，都是完整的（不是只有新行）
+    """
+    cik = row["cik"]
+    since = row["last_filing_date"] if pd.notna(row["last_filing_date"]) else None
+    if df_filings is None:
+        df_filings, _, _ = latest_filing_from_submissions(cik, years_back)
+    df_financial, quality_report, _, _ = get_financial_data_for_company(cik, years_back)
+    df_quality_results = quality_report["results"]
+
+    # segment/geo：数据集模式只解析新的10-K，CSV模式整份重做（10-K HTML在响应缓存里，不会重新下载）
+    df_segment = df_geo = None
+    if include_segments and len(df_filings) > 0:
+        df_10k = df_filings[df_filings["form"].isin(["10-K", "10-K/A"])]
+        if dataset_writer is not None and since is not None:
+            df_10k = df_10k[df_10k["filing_date"] > since]
+        tasks = [("filing", cik, d, u) for d, u in zip(df_10k["filing_date"], df_10k["filing_url"])]
+        if tasks:
+            collected, _ = run_segment_pipeline(tasks, years_back, parse_workers=0)
+            df_segment, df_geo, _ = collected.get(cik, (None, None, []))
+
+    if dataset_writer is not None:
+        if since is not None:
+            new_financial = df_financial[df_financial["filed_date"] > since]
+            save_company_dataset(
+                dataset_writer, cik,
+                df_filings[df_filings["filing_date"] > since],
+                new_financial,
+                df_quality_results[df_quality_results["fiscal_year"].isin(new_financial["fiscal_year"].unique())],
+                df_segment, df_geo,
+            )
+        else:
+            save_company_dataset(dataset_writer, cik, df_filings, df_financial, df_quality_results,
+                                 df_segment, df_geo)
+    elif save_to_csv:
+        save_company_csv(row["ticker"], cik, df_filings, df_financial,
+                         quality_report_to_frame(quality_report), df_segment, df_geo)
+    return df_filings, df_financial
+
+
+def run_incremental(df_companies, ledger, years_back=5, form_index=None, dataset_writer=None,
+                    save_to_csv=True, include_segments=False, max_in_flight=8):
+    """
+    增量更新入口：找出有新filing的公司（max_in_flight 个请求并发检查），逐家更新并记台账
+
+    Returns:
+        (results, failed, stats)，results / failed 和 run_serial 的格式一致
+    """
+    previous_ttl = sec_client.set_json_ttl(0)  # JSON都向SEC确认，不用TTL内的旧缓存
+    try:
+        return _run_incremental(df_companies, ledger, years_back, form_index, dataset_writer,
+                                save_to_csv, include_segments, max_in_flight)
+    finally:
+        if previous_ttl is not None:
+            sec_client.set_json_ttl(previous_ttl)
+
+
+def _run_incremental(df_companies, ledger, years_back, form_index, dataset_writer, save_to_csv, include_segments,
+                     max_in_flight):
+    start = time.time()
+    df_changed, filings_by_cik = find_changed_companies(df_companies, ledger, form_index, years_back, max_in_flight)
+    print(f"有新filing的公司: {len(df_changed)} / {df_companies['cik'].nunique()}（{time.time() - start:.1f}s）")
+
+    results = []
+    failed = []
+    for idx, row in df_changed.iterrows():
+        ticker = row["ticker"]
+        cik = row["cik"]
+        ledger.start(cik, ticker, row["company_name"])
+        try:
+            df_filings, df_financial = update_company(
+                row, years_back, filings_by_cik.get(cik), dataset_writer, save_to_csv, include_segments,
+            )
+            finish_job(ledger, cik, len(df_financial), df_filings, dataset_writer)
+            results.append({
+                "ticker": ticker,
+                "cik": cik,
+                "company_name": row["company_name"],
+                "status": "success",
+                "financial_records": len(df_financial),
+                "filings_count": len(df_filings),
+            })
+            last = row["last_filing_date"] if pd.notna(row["last_filing_date"]) else "无"
+            print(f"[{idx+1}/{len(df_changed)}] ✅ {ticker}（上次: {last}）")
+        except Exception as e:
+            ledger.fail(cik, e)
+            failed.append({"ticker": ticker, "cik": cik, "company_name": row["company_name"], "error": str(e)})
+            print(f"[{idx+1}/{len(df_changed)}] ❌ {ticker}: {e}")
+
+    stats = {
+        "companies": int(df_companies["cik"].nunique()),
+        "changed": len(df_changed),
+        "elapsed_seconds": time.time() - start,
+    }
+    return results, failed, stats
@@ -0,0 +1,184 @@
+"""
+batch任务台账（SQLite，按CIK一行）
+
+final_step.py 每处理完一家公司就写一次台账，中途崩溃或被kill之后重跑，
+已经成功的公司直接跳过；--retry-failed 只重跑失败的公司。
+台账里同时记着每家公司最后看到的filing（accession/日期），增量更新时用得上
+"""
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+JOB_LEDGER_PATH = os.path.join(".sec_cache", "jobs.sqlite")
+
+JOB_COLUMNS = [
+    "cik", "ticker", "company_name", "status", "attempts",
+    "started_at", "finished_at", "elapsed_seconds", "error",
+    "financial_records", "filings_count", "last_accession", "last_filing_date",
+]
+
+
+class JobLedger:
+    """
+    Args:
+        path: SQLite文件路径
+
+    status: running（开始了但没结束，崩溃时会留下这个状态）/ success / failed
+    """
+
+    def __init__(self, path=JOB_LEDGER_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                cik TEXT PRIMARY KEY,
+                ticker TEXT,
+                company_name TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                elapsed_seconds REAL,
+                error TEXT,
+                financial_records INTEGER,
+                filings_count INTEGER,
+                last_accession TEXT,
+                last_filing_date TEXT
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        self._db.commit()
+
+    def start(self, cik, ticker, company_name):
+        """登记开始处理（attempts+1）"""
+        with self._lock:
+            self._db.execute(
+                """INSERT INTO jobs (cik, ticker, company_name, status, attempts, started_at)
+                   VALUES (?, ?, ?, 'running', 1, ?)
+                   ON CONFLICT(cik) DO UPDATE SET
+                       ticker = excluded.ticker, company_name = excluded.company_name,
+                       status = 'running', attempts = attempts + 1,
+                       started_at = excluded.started_at, error = NULL""",
+                (cik, ticker, company_name, time.time()),
+            )
+            self._db.commit()
+
+    def finish(self, cik, financial_records, df_filings=None):
+        """
+        登记成功
+
+        Args:
+            cik: CIK
+            financial_records: 财务数据条数
+            df_filings: 这家公司的filings列表，用来记最后一份filing
+        """
+        last_accession = last_filing_date = None
+        filings_count = 0
+        if df_filings is not None and len(df_filings) > 0:
+            filings_count = len(df_filings)
+            latest = df_filings.sort_values("filing_date").iloc[-1]
+            last_accession = latest["accession_number"]
+            last_filing_date = str(latest["filing_date"])
+        self._finish(cik, "success", None, financial_records, filings_count, last_accession, last_filing_date)
+
+    def fail(self, cik, error):
+        """登记失败"""
+        self._finish(cik, "failed", str(error), None, None, None, None)
+
+    def _finish(self, cik, status, error, financial_records, filings_count, last_accession, last_filing_date):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """UPDATE jobs SET status = ?, error = ?, finished_at = ?,
+                       elapsed_seconds = ? - started_at,
+                       financial_records = COALESCE(?, financial_records),
+                       filings_count = COALESCE(?, filings_count),
+                       last_accession = COALESCE(?, last_accession),
+                       last_filing_date = COALESCE(?, last_filing_date)
+                   WHERE cik = ?""",
+                (status, error, now, now, financial_records, filings_count,
+                 last_accession, last_filing_date, cik),
+            )
+            self._db.commit()
+
+    def to_frame(self, status=None):
+        """台账内容（可按status过滤）"""
+        query = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return pd.DataFrame(rows, columns=JOB_COLUMNS)
+
+    def pending(self, df_companies, retry_failed=False):
+        """
+        这次需要处理的公司
+
+        Args:
+            df_companies: registry.to_frame()
+            retry_failed: True时只返回台账里失败的公司，否则返回所有还没成功的公司
+
+        Returns:
+            df_companies 的子集（同一个CIK有多个ticker时只保留第一个）
+        """
+        df = df_companies.drop_duplicates("cik")
+        if retry_failed:
+            failed = set(self.to_frame("failed")["cik"])
+            return df[df["cik"].isin(failed)]
+        done = set(self.to_frame("success")["cik"])
+        return df[~df["cik"].isin(done)]
+
+    def results(self):
+        """成功的公司，格式和 batch_processing_results.csv 一致"""
+        df = self.to_frame("success")
+        return df.assign(status="success")[
+            ["ticker", "cik", "company_name", "status", "financial_records", "filings_count"]
+        ].to_dict("records")
+
+    def failures(self):
+        """失败的公司，格式和 batch_processing_failed.csv 一致"""
+        df = self.to_frame("failed")
+        return df[["ticker", "cik", "company_name", "error"]].to_dict("records")
+
+    def reset(self):
+        """清空台账（从头开始跑）"""
+        with self._lock:
+            self._db.execute("DELETE FROM jobs")
+            self._db.commit()
+
+    def summary(self):
+        """各状态的公司数"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def finish_job(ledger, cik, financial_records, df_filings=None, dataset_writer=None):
+    """
+    登记一家公司成功
+
+    写列式数据集时，数据可能还在 DatasetWriter 的缓冲里，这时候登记成功、进程又崩溃的话，
+    重跑会跳过这家公司，数据就丢了；所以等它的数据写进Parquet文件后再登记（DatasetWriter.commit）
+    ledger 是 JobLedger 或 WorkQueue
+    """
+    if dataset_writer is None:
+        ledger.finish(cik, financial_records, df_filings)
+    else:
+        dataset_writer.commit(cik, ledger.finish, cik, financial_records, df_filings)
+
+
+if __name__ == "__main__":
+    ledger = JobLedger()
+    print(ledger.summary())
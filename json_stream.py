@@ -0,0 +1,158 @@
+"""
+增量JSON解析（不把整个文档读进内存）
+
+companyfacts动辄几十MB，json.loads之后是几百MB的dict，而我们只用其中十几个us-gaap标签。
+这里按块读取字节流，逐层走到 facts -> us-gaap，只把需要的标签解析成Python对象，
+其余标签解析完立刻丢掉，峰值内存约等于“读缓冲 + 单个标签”的大小
+"""
+import codecs
+import json
+
+READ_CHUNK_SIZE = 1024 * 1024  # 每次读1MB
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class JSONStreamReader:
+    """
+    在字节流上按需解析JSON
+
+    Args:
+        fp: 有 read(n) 方法、返回bytes的对象（HTTP响应流、gzip文件、zip成员都可以）
+        chunk_size: 每次读取的字节数
+    """
+
+    def __init__(self, fp, chunk_size=READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def _fill(self, at_least=None):
+        """再读一块进缓冲区；读到结尾返回False"""
+        if self.eof:
+            return False
+        # 已经用掉的部分丢掉，缓冲区只保留还没解析的内容
+        if self.pos > 0:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        size = max(self.chunk_size, at_least or 0)
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            self.buf += self._text_decoder.decode(b"", final=True)
+            return False
+        self.bytes_read += len(data)
+        self.buf += self._text_decoder.decode(data)
+        return True
+
+    def _peek(self):
+        """跳过空白，返回下一个字符（文档结束返回空串）"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.bytes_read - len(self.buf) + self.pos}")
+        self.pos += 1
+
+    def _read_string(self):
+        self._expect('"')
+        while True:
+            try:
+                value, end = json.decoder.scanstring(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 字符串被块边界截断，多读一些再试（pos回退到引号位置，_fill会保留它）
+                self.pos -= 1
+                if not self._fill(at_least=len(self.buf)):
+                    raise
+                self.pos += 1
+                continue
+            self.pos = end
+            return value
+
+    def read_value(self):
+        """解析当前位置的一个完整值（对象、数组、字符串、数字……）"""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 值还没读完整；每次至少翻倍，避免大值反复从头解析
+                if not self._fill(at_least=len(self.buf)):
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and not isinstance(value, (dict, list, str)):
+                # 数字/true/false 正好在缓冲区末尾，可能被截断
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def drain(self):
+        """读到流的结尾（让边读边写缓存的流能完整落盘）"""
+        while self._fill():
+            self.pos = len(self.buf)
+
+    def skip_value(self):
+        """跳过当前位置的值（解析后立即丢弃）"""
+        self.read_value()
+
+    def members(self):
+        """
+        逐个yield当前对象的key；调用方必须在下一次迭代前
+        用 read_value / skip_value / members 把对应的值消费掉
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            self._peek()
+            key = self._read_string()
+            self._expect(":")
+            yield key
+            char = self._peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' after member {key!r}")
+
+
+def iter_companyfacts_tags(fp, taxonomy="us-gaap", tags=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    流式读取companyfacts，只返回指定标签
+
+    Args:
+        fp: companyfacts JSON的字节流
+        taxonomy: "us-gaap" / "dei" 等
+        tags: 需要的标签集合，None表示全部
+
+    Yields:
+        (tag, tag_data)，tag_data 和 company_facts["facts"][taxonomy][tag] 一样
+    """
+    reader = JSONStreamReader(fp, chunk_size)
+    for key in reader.members():
+        if key != "facts":
+            reader.skip_value()
+            continue
+        for namespace in reader.members():
+            if namespace != taxonomy:
+                reader.skip_value()
+                continue
+            for tag in reader.members():
+                if tags is None or tag in tags:
+                    yield tag, reader.read_value()
+                else:
+                    reader.skip_value()
+    reader.drain()
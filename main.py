@@ -3,13 +3,41 @@ SEC财务数据爬虫主程序
 整合任务1和任务2的所有功能
 """
 import pandas as pd
-from first_01 import fetch_company_tickers
+import metrics
+from first_01 import TickerRegistry
+from company_context import CompanyContext
 from task1_filings import get_filings_for_company
 from task1_financial_data import get_financial_data_for_company
 from task2_segment_geo import get_segment_geographic_data, validate_segment_geo_data
 #新建 main.py - 主程序
 
-def process_company(ticker, years_back=5, save_to_csv=True):
+def quality_report_to_frame(quality_report):
+    """把quality_report（checks/warnings/errors三个列表）转成 type/message 两列的DataFrame"""
+    quality_records = []
+    for check in quality_report.get("checks", []):
+        quality_records.append({"type": "check", "message": check})
+    for warning in quality_report.get("warnings", []):
+        quality_records.append({"type": "warning", "message": warning})
+    for error in quality_report.get("errors", []):
+        quality_records.append({"type": "error", "message": error})
+    
+    return pd.DataFrame(quality_records) if quality_records else pd.DataFrame(columns=["type", "message"])
+
+def save_company_csv(ticker, cik, df_filings, df_financial, df_quality_report, df_segment=None, df_geo=None):
+    """按 {TICKER}_{CIK}_{type}.csv 保存，返回文件名前缀"""
+    prefix = f"{ticker}_{cik}"
+    frames = {"filings": df_filings, "financial": df_financial, "quality_report": df_quality_report}
+    if df_segment is not None and len(df_segment) > 0:
+        frames["segment"] = df_segment
+    if df_geo is not None and len(df_geo) > 0:
+        frames["geographic"] = df_geo
+    with metrics.timer("csv_write", cik) as t:
+        for name, df in frames.items():
+            df.to_csv(f"{prefix}_{name}.csv", index=False)
+        t.rows = sum(len(df) for df in frames.values())
+    return prefix
+
+def process_company(ticker, years_back=5, save_to_csv=True, registry=None, dataset_writer=None):
     """
     处理单个公司的完整数据抓取流程
     
@@ -17,42 +45,39 @@ def process_company(ticker, years_back=5, save_to_csv=True):
         ticker: 股票代码
         years_back: 回溯年数
         save_to_csv: 是否保存为CSV文件
+        registry: TickerRegistry；batch时传进来，避免每个公司都重新下载ticker列表
+        dataset_writer: dataset_store.DatasetWriter；传了就追加到列式数据集，不再写CSV
     """
     print(f"\n{'='*60}")
     print(f"Processing {ticker}")
     print(f"{'='*60}")
     
-    # 1. 获取公司列表
-    df_companies = fetch_company_tickers()
-    company_row = df_companies[df_companies["ticker"] == ticker]
-    if len(company_row) == 0:
+    # 1. 查公司（ticker -> CIK）
+    if registry is None:
+        registry = TickerRegistry.load()
+    company = registry.lookup(ticker)
+    if company is None:
         print(f"Error: Ticker {ticker} not found")
         return
     
-    cik = company_row.iloc[0]["cik"]
-    company_name = company_row.iloc[0]["company_name"]
+    cik, company_name = company
     print(f"Company: {company_name}")
     print(f"CIK: {cik}")
     
+    # 各个阶段共用一份submissions / companyfacts，不重复请求
+    context = CompanyContext(cik, years_back)
+    
     # 2. 获取filings列表
     print("\n[Step 1] Fetching filings...")
-    df_filings = get_filings_for_company(cik, years_back)
+    df_filings = get_filings_for_company(cik, years_back, context=context)
     print(f"Found {len(df_filings)} filings (10-K and 10-Q)")
     
     # 3. 获取财务数据
     print("\n[Step 2] Fetching financial data...")
-    df_financial, quality_report = get_financial_data_for_company(cik, years_back)
+    df_financial, quality_report, _, _ = get_financial_data_for_company(cik, years_back, context=context)
     
     # 将quality_report转换为结构化的DataFrame
-    quality_records = []
-    for check in quality_report.get("checks", []):
-        quality_records.append({"type": "check", "message": check})
-    for warning in quality_report.get("warnings", []):
-        quality_records.append({"type": "warning", "message": warning})
-    for error in quality_report.get("errors", []):
-        quality_records.append({"type": "error", "message": error})
-    
-    df_quality_report = pd.DataFrame(quality_records) if quality_records else pd.DataFrame(columns=["type", "message"])
+    df_quality_report = quality_report_to_frame(quality_report)
     
     print(f"Found {len(df_financial)} financial data points")
     print(f"Quality checks: {len(quality_report['checks'])} passed, "
@@ -60,7 +85,7 @@ def process_company(ticker, years_back=5, save_to_csv=True):
     
     # # 4. 获取segment和geographic数据
     # print("\n[Step 3] Fetching segment and geographic data...")
-    # df_segment, df_geo, missing = get_segment_geographic_data(cik, years_back)
+    # df_segment, df_geo, missing = get_segment_geographic_data(cik, years_back, context=context)
     # print(f"Segment data: {len(df_segment)} records")
     # print(f"Geographic data: {len(df_geo)} records")
     # print(f"Missing reports: {len(missing)}")
@@ -75,11 +100,12 @@ def process_company(ticker, years_back=5, save_to_csv=True):
     #         print(f"  - {w}")
     
     # 6. 保存数据
-    if save_to_csv:
-        prefix = f"{ticker}_{cik}"
-        df_filings.to_csv(f"{prefix}_filings.csv", index=False)
-        df_financial.to_csv(f"{prefix}_financial.csv", index=False)
-        df_quality_report.to_csv(f"{prefix}_quality_report.csv", index=False)
+    if dataset_writer is not None:
+        from dataset_store import save_company_dataset
+        save_company_dataset(dataset_writer, cik, df_filings, df_financial, quality_report["results"])
+        print(f"\n[Step 5] Data queued for dataset: {dataset_writer.root}")
+    elif save_to_csv:
+        prefix = save_company_csv(ticker, cik, df_filings, df_financial, df_quality_report)
         # if len(df_segment) > 0:
         #     df_segment.to_csv(f"{prefix}_segment.csv", index=False)
         # if len(df_geo) > 0:
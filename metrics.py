@@ -0,0 +1,379 @@
+"""
+流程各阶段的计时和计数
+
+每个阶段（ticker列表加载 / 查询、submissions / companyfacts下载、提取、质量检查、10-K下载 / 解析、写CSV / 数据集）
+都用 timer() 包起来，记录：
+- 耗时直方图（按阶段），另外按公司累计每个阶段的耗时，用来找拖慢整个batch的公司
+- 产出的行数、字节数、出错次数
+sec_client 另外记每个HTTP响应的状态码、字节数、耗时（按接口分类）和缓存命中情况。
+
+导出：
+- write_snapshot(path)：JSON快照（各阶段汇总 + 耗时最多的公司），长时间运行时用 start_snapshot_writer 定期写
+- start_http_server(port)：本地的Prometheus文本格式端点（/metrics），可选
+
+用法:
+    with metrics.timer("extraction", cik) as t:
+        df = extract_financial_data(company_facts)
+        t.rows = len(df)
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = [
+    "ticker_load", "ticker_lookup", "submissions_fetch", "submissions_pages", "companyfacts_fetch", "extraction", "quality_checks",
+    "html_fetch", "html_parse", "csv_write", "dataset_write",
+]
+
+# 耗时直方图的桶（秒），和Prometheus的 le 一样是累积上界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 快照里列出耗时最多的多少家公司
+TOP_COMPANIES = 20
+
+METRICS_SNAPSHOT_PATH = "metrics_snapshot.json"
+
+_ARCHIVE_CIK_RE = re.compile(r"/Archives/edgar/data/(\d+)/")
+
+
+def cik_from_url(url):
+    """Archives URL里的CIK（补成10位），不是Archives地址时返回None"""
+    m = _ARCHIVE_CIK_RE.search(url or "")
+    return m.group(1).zfill(10) if m else None
+
+
+class Histogram:
+    """固定桶的直方图（线程安全由 Metrics 的锁保证）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """按桶线性插值估计分位数"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if n and seen + n >= target:
+                return lower + (upper - lower) * (target - seen) / n
+            seen += n
+            lower = upper
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class _Timer:
+    """timer() 的返回值：在with块里设置 rows / bytes，退出时一起记下"""
+
+    __slots__ = ("stage", "cik", "rows", "bytes")
+
+    def __init__(self, stage, cik):
+        self.stage = stage
+        self.cik = cik
+        self.rows = None
+        self.bytes = None
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Metrics:
+    """一组计数器和直方图；进程里默认共用模块级的那一个（get_metrics()）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}    # (name, labels) -> 数值
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.companies = {}   # cik -> {stage: 秒}
+
+    def inc(self, name, value=1, **labels):
+        """计数器加 value"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """往直方图里记一个值"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, stage, cik=None):
+        """
+        给一个阶段计时
+
+        Args:
+            stage: 阶段名（见 STAGES）
+            cik: 这次处理的是哪家公司（按公司累计耗时用），不知道时传None
+        """
+        t = _Timer(stage, cik)
+        start = time.perf_counter()
+        try:
+            yield t
+        except BaseException:
+            self.inc("stage_errors", stage=stage)
+            raise
+        finally:
+            self.record_stage(stage, time.perf_counter() - start, cik, t.rows, t.bytes)
+
+    def record_stage(self, stage, seconds, cik=None, rows=None, nbytes=None):
+        """记一次阶段耗时（已经在别处量好时间的情况，比如流式解析）"""
+        self.observe("stage_seconds", seconds, stage=stage)
+        with self._lock:
+            if cik is not None:
+                per_stage = self.companies.setdefault(cik, {})
+                per_stage[stage] = per_stage.get(stage, 0.0) + seconds
+        if rows is not None:
+            self.inc("stage_rows", rows, stage=stage)
+        if nbytes is not None:
+            self.inc("stage_bytes", nbytes, stage=stage)
+
+    def timed(self, stage):
+        """装饰器版的 timer（不区分公司）"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.counters.clear()
+            self.histograms.clear()
+            self.companies.clear()
+
+    def snapshot(self, top=TOP_COMPANIES):
+        """
+        当前状态（可以直接写成JSON）
+
+        Returns:
+            {
+              created_at, uptime_seconds,
+              stages: {stage: {count, sum, mean, p50, p95, max, share, rows, bytes, errors}}（share = 占所有阶段总耗时的比例）,
+              counters: [{name, labels, value}], histograms: [{name, labels, count, sum, ...}],
+              top_companies: [{cik, total_seconds, stages: {stage: 秒}}]（按总耗时从多到少）,
+              companies: 有阶段耗时记录的公司数
+            }
+        """
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                dict({"name": name, "labels": dict(labels)}, **hist.to_dict())
+                for (name, labels), hist in sorted(self.histograms.items())
+            ]
+            companies = [
+                {"cik": cik, "total_seconds": sum(per_stage.values()), "stages": dict(per_stage)}
+                for cik, per_stage in self.companies.items()
+            ]
+
+        def counter(name, stage):
+            return sum(c["value"] for c in counters if c["name"] == name and c["labels"].get("stage") == stage)
+
+        stage_hists = [h for h in histograms if h["name"] == "stage_seconds"]
+        total = sum(h["sum"] for h in stage_hists)
+        stages = {}
+        for h in sorted(stage_hists, key=lambda h: -h["sum"]):
+            stage = h["labels"]["stage"]
+            stages[stage] = {
+                key: h[key] for key in ("count", "sum", "mean", "p50", "p95", "max")
+            }
+            stages[stage].update({
+                "share": h["sum"] / total if total else None,
+                "rows": counter("stage_rows", stage),
+                "bytes": counter("stage_bytes", stage),
+                "errors": counter("stage_errors", stage),
+            })
+        companies.sort(key=lambda c: -c["total_seconds"])
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "uptime_seconds": time.time() - self.started_at,
+            "stages": stages,
+            "counters": counters,
+            "histograms": histograms,
+            "top_companies": companies[:top],
+            "companies": len(companies),
+        }
+
+    def write_snapshot(self, path=METRICS_SNAPSHOT_PATH):
+        """写JSON快照（先写临时文件再替换，读的一方不会读到半个文件）"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def prometheus_text(self, prefix="sec_"):
+        """Prometheus文本格式（计数器加 _total 后缀，直方图输出 _bucket / _sum / _count）"""
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+            hist_data = [(key, hist.buckets, list(hist.counts), hist.sum, hist.count) for key, hist in histograms]
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{fmt(labels)} {value}")
+        for (name, labels), buckets, counts, total, count in hist_data:
+            metric = f"{prefix}{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{fmt(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{metric}_sum{fmt(labels)} {total}")
+            lines.append(f"{metric}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def inc(name, value=1, **labels):
+    _metrics.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _metrics.observe(name, value, **labels)
+
+
+def timer(stage, cik=None):
+    return _metrics.timer(stage, cik)
+
+
+def record_stage(stage, seconds, cik=None, rows=None, nbytes=None):
+    _metrics.record_stage(stage, seconds, cik, rows, nbytes)
+
+
+def timed(stage):
+    return _metrics.timed(stage)
+
+
+def snapshot(top=TOP_COMPANIES):
+    return _metrics.snapshot(top)
+
+
+def write_snapshot(path=METRICS_SNAPSHOT_PATH):
+    return _metrics.write_snapshot(path)
+
+
+def reset():
+    _metrics.reset()
+
+
+def start_snapshot_writer(path=METRICS_SNAPSHOT_PATH, interval=60):
+    """
+    后台线程每 interval 秒写一次快照（跑十几个小时的batch中途也能看到进度和瓶颈）
+
+    Returns:
+        stop()：停止后台线程并写最后一次快照
+    """
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            _metrics.write_snapshot(path)
+
+    thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+    thread.start()
+
+    def stop():
+        stopped.set()
+        thread.join()
+        _metrics.write_snapshot(path)
+    return stop
+
+
+def start_http_server(port=9108, host="127.0.0.1"):
+    """
+    本地Prometheus端点：GET /metrics 返回文本格式，GET /snapshot 返回JSON快照
+
+    Returns:
+        ThreadingHTTPServer（shutdown() 停止）
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body = _metrics.prometheus_text().encode()
+                content_type = "text/plain; version=0.0.4"
+            elif self.path.startswith("/snapshot"):
+                body = json.dumps(_metrics.snapshot()).encode()
+                content_type = "application/json"
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,239 @@
+"""
+SEC原始响应的本地缓存（gzip压缩 + SQLite索引）
+
+两类内容分开处理：
+- Archives下的文件（10-K HTML等）：accession号一旦存在内容就不会再变，
+  按 CIK/accession/文件名 存放，永不过期
+- 其他接口（submissions、companyfacts 等JSON）：会更新，按TTL过期，
+  过期后用 ETag / Last-Modified 做条件请求
+总大小超过上限时按最近访问时间（LRU）淘汰
+"""
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_DIR = os.path.join(".sec_cache", "responses")
+RESPONSE_CACHE_MAX_BYTES = 10 * 1024 ** 3  # 10GB
+JSON_TTL = 24 * 3600  # submissions / companyfacts 一天内不重复请求
+
+# https://www.sec.gov/Archives/edgar/data/{cik}/{accession}/{filename}
+ARCHIVE_URL_RE = re.compile(r"/Archives/edgar/data/(\d+)/(\d{18})/([^?#]+)$")
+
+
+def cache_key(url):
+    """
+    URL -> (key, kind)
+    archive文件用 archives/cik/accession/filename 作key，其他用URL的sha1
+    """
+    m = ARCHIVE_URL_RE.search(url)
+    if m:
+        cik, accession, filename = m.groups()
+        return f"archives/{int(cik)}/{accession}/{filename}", "archive"
+    return "url/" + hashlib.sha1(url.encode("utf-8")).hexdigest(), "json"
+
+
+class ResponseCache:
+    """
+    Args:
+        root: 缓存目录
+        max_bytes: 压缩后总大小上限，超过时按LRU淘汰
+        json_ttl: 非archive内容的有效期（秒）
+    """
+
+    def __init__(self, root=RESPONSE_CACHE_DIR, max_bytes=RESPONSE_CACHE_MAX_BYTES, json_ttl=JSON_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.json_ttl = json_ttl
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                kind TEXT,
+                size INTEGER,
+                stored_at REAL,
+                last_access REAL,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                encoding TEXT
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+        self._db.commit()
+
+        # 本进程的命中统计
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0, "evicted": 0}
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".gz")
+
+    def lookup(self, url):
+        """
+        查缓存条目（只读元数据，不读内容）
+
+        Returns:
+            dict 或 None；dict里的 fresh 表示不用请求SEC可以直接用
+        """
+        key, kind = cache_key(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key, kind, size, stored_at, etag, last_modified, content_type, encoding "
+                "FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or not os.path.exists(self._path(key)):
+            return None
+        entry = dict(zip(["key", "kind", "size", "stored_at", "etag", "last_modified",
+                          "content_type", "encoding"], row))
+        entry["fresh"] = kind == "archive" or time.time() - entry["stored_at"] < self.json_ttl
+        return entry
+
+    def read(self, entry, count_hit=True):
+        """读取条目内容（更新LRU时间），count_hit=False 用于304之后的读取"""
+        with gzip.open(self._path(entry["key"]), "rb") as f:
+            body = f.read()
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), entry["key"]))
+            self._db.commit()
+            if count_hit:
+                self.stats["hits"] += 1
+        return body
+
+    def record_miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+
+    def touch(self, entry):
+        """条件请求返回304：内容没变，重新开始计算TTL"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, entry["key"])
+            )
+            self._db.commit()
+            self.stats["revalidated"] += 1
+
+    def put(self, url, resp):
+        """保存一个200响应"""
+        writer = self.open_writer(url, resp)
+        writer.write(resp.content)
+        writer.commit()
+
+    def open_writer(self, url, resp):
+        """
+        边下载边写缓存（流式读取时用）：write() 写入解压后的内容，
+        读完调用 commit()，中途放弃调用 abort()
+        """
+        return _CacheWriter(self, url, resp)
+
+    def open(self, entry, count_hit=True):
+        """以流的方式读取条目内容（返回gzip文件对象，调用方负责close）"""
+        f = gzip.open(self._path(entry["key"]), "rb")
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), entry["key"]))
+            self._db.commit()
+            if count_hit:
+                self.stats["hits"] += 1
+        return f
+
+    def _commit(self, url, resp, tmp_path):
+        key, kind = cache_key(url)
+        path = self._path(key)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, kind, size, now, now,
+                 resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                 resp.headers.get("Content-Type"), resp.encoding),
+            )
+            self._db.commit()
+            self.stats["stored"] += 1
+        self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        """总大小超过上限时，从最久没访问的开始删到上限的90%"""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+            evicted = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                evicted.append(key)
+                total -= size
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in evicted])
+            self._db.commit()
+            self.stats["evicted"] += len(evicted)
+        for key in evicted:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def report(self):
+        """
+        Returns:
+            本进程的命中/未命中统计 + 缓存里的条目数和大小（按kind）
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY kind"
+            ).fetchall()
+            report = dict(self.stats)
+        lookups = report["hits"] + report["misses"] + report["revalidated"]
+        report["hit_rate"] = (report["hits"] + report["revalidated"]) / lookups if lookups else 0.0
+        report["entries"] = {kind: {"count": count, "bytes": size} for kind, count, size in rows}
+        return report
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class _CacheWriter:
+    """写入临时文件，commit时rename到正式位置并登记索引"""
+
+    def __init__(self, cache, url, resp):
+        self.cache = cache
+        self.url = url
+        self.resp = resp
+        key, _ = cache_key(url)
+        path = cache._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再rename，多线程/多进程同时写同一个key也不会读到半个文件
+        self.tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = gzip.open(self.tmp_path, "wb", compresslevel=5)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def commit(self):
+        self._file.close()
+        self.cache._commit(self.url, self.resp, self.tmp_path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    cache = ResponseCache()
+    for kind, info in cache.report()["entries"].items():
+        print(f"{kind}: {info['count']} entries, {info['bytes'] / 1024 ** 2:.1f} MB")
@@ -0,0 +1,718 @@
+"""
+SEC请求的公共入口
+所有fetch函数都通过 sec_get 发请求，共享同一个限速器（SEC要求 ≤ 10 requests / second）、
+同一个AIMD在途数控制器（被限流时自动退避降速）和同一个连接池（keep-alive + gzip）；响应写入本地缓存（response_cache），
+archive文件命中后不再请求，JSON接口过期后做条件请求（ETag / Last-Modified）
+"""
+import io
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from response_cache import ResponseCache, RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES, JSON_TTL
+from http_fixtures import FixtureStore
+import metrics
+
+# SEC允许的最大请求速率
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+# 默认的SEC域名，测试时可以用 set_base_url 指向本地的stub服务器
+SEC_WWW_URL = "https://www.sec.gov"
+SEC_DATA_URL = "https://data.sec.gov"
+
+
+class RateLimiter:
+    """
+    令牌桶限速器（线程安全）
+
+    Args:
+        rate: 每秒补充的令牌数（= 允许的请求速率）
+        burst: 桶容量，允许的瞬时突发请求数，默认等于rate
+        max_in_flight: 同时在途的请求数上限，None表示不限制
+    """
+
+    def __init__(self, rate=SEC_MAX_REQUESTS_PER_SECOND, burst=None, max_in_flight=None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst if burst is not None else rate))
+        self.max_in_flight = max_in_flight
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+        # 统计：实际达到的请求速率
+        self.request_count = 0
+        self.first_request_at = None
+        self.last_request_at = None
+
+    def _take_token(self):
+        """拿一个令牌，拿不到就返回还要等多久（秒）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.request_count += 1
+                if self.first_request_at is None:
+                    self.first_request_at = now
+                self.last_request_at = now
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def set_rate(self, rate, burst=None):
+        """
+        运行中调整速率（分布式worker的速率份额变化时用），已经在等令牌的请求按新速率继续等
+
+        Args:
+            rate: 新的速率（req/s）
+            burst: 新的桶容量，默认等于rate（至少为1，否则永远攒不够一个令牌）
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self.rate = float(rate)
+            self.burst = max(1.0, float(burst if burst is not None else rate))
+            self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self):
+        """阻塞直到可以发下一个请求"""
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+        while True:
+            wait = self._take_token()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def release(self):
+        """请求结束后释放在途名额"""
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def achieved_rate(self):
+        """从第一个请求到最后一个请求之间的平均速率（req/s）"""
+        if self.request_count < 2:
+            return 0.0
+        elapsed = self.last_request_at - self.first_request_at
+        return (self.request_count - 1) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            "requests": self.request_count,
+            "achieved_rate": self.achieved_rate(),
+            "rate_limit": self.rate,
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+# 每个host的连接池大小
+HTTP_POOL_MAXSIZE = 16
+
+# SEC限流时返回的状态码：重试，而不是当成失败
+RETRY_STATUSES = (429, 503)
+# 这些异常也重试：连接错误、超时、响应体读到一半连接断了
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+# 限流 / 连接错误时最多重试几次
+MAX_RETRIES = 5
+# 退避：第n次重试前等 uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)) 秒（full jitter）
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD并发控制：同时在途的请求数上限随SEC的反应自动调整
+
+    - 正常响应、在途请求已经用满上限、且不在降低后的冷却期内时，上限 +1/limit（大约每一轮加1，加性增）
+    - 429/503或连接错误：上限减半（乘性减），有 Retry-After 时所有请求都暂停到那个时间
+    - 延迟明显变长（EWMA超过观察到的最低延迟的 latency_tolerance 倍）：上限 ×0.9，先于限流降速
+    同一个冷却期（cooldown秒）内只降一次，一批同时返回的429不会把上限一路降到底
+
+    Args:
+        max_limit: 上限的上限（一般是 max_in_flight / 连接池大小）
+        min_limit: 上限的下限
+        initial: 初始上限，默认等于max_limit
+        latency_tolerance: 延迟超过最低延迟的多少倍时开始降
+        cooldown: 两次降低之间至少间隔多少秒
+    """
+
+    def __init__(self, max_limit=HTTP_POOL_MAXSIZE, min_limit=1, initial=None, latency_tolerance=2.0, cooldown=1.0):
+        self.max_limit = float(max_limit)
+        self.min_limit = float(min_limit)
+        self.limit = float(initial or max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.latency_ewma = None
+        self.latency_floor = None
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.stats = {"throttled": 0, "errors": 0, "slow": 0, "decreases": 0,
+                      "lowest_limit": self.limit, "highest_limit": self.limit}
+
+    def set_max(self, max_limit):
+        with self._cond:
+            self.max_limit = float(max_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self._cond.notify_all()
+
+    def acquire(self):
+        """等到有在途名额（且不在Retry-After暂停期内）"""
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight < int(self.limit):
+                    self._in_flight += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def _decrease(self, factor, now):
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        self.stats["decreases"] += 1
+        self.stats["lowest_limit"] = min(self.stats["lowest_limit"], self.limit)
+
+    def release(self, latency=None, throttled=False, error=False, retry_after=None):
+        """
+        请求结束
+
+        Args:
+            latency: 到收到响应头的秒数（正常响应时）
+            throttled: 收到了429/503
+            error: 连接错误 / 超时
+            retry_after: 服务器要求的等待秒数
+        """
+        now = time.monotonic()
+        with self._cond:
+            full = self._in_flight >= int(self.limit)
+            self._in_flight -= 1
+            if throttled or error:
+                self.stats["throttled" if throttled else "errors"] += 1
+                self._decrease(0.5, now)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            elif latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                # 最低延迟缓慢上浮，网络整体变慢之后不会一直认为"比平时慢"
+                self.latency_floor = latency if self.latency_floor is None else min(self.latency_floor * 1.001, latency)
+                if self.latency_ewma > self.latency_floor * self.latency_tolerance and self.latency_ewma > 0.05:
+                    self.stats["slow"] += 1
+                    self._decrease(0.9, now)
+                elif full and now - self._last_decrease >= self.cooldown:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self.stats["highest_limit"] = max(self.stats["highest_limit"], self.limit)
+            self._cond.notify_all()
+
+    def report(self):
+        with self._cond:
+            return dict(self.stats, limit=self.limit, max_limit=self.max_limit, in_flight=self._in_flight,
+                        latency_ewma=self.latency_ewma, latency_floor=self.latency_floor)
+
+
+def _new_session(pool_maxsize=HTTP_POOL_MAXSIZE):
+    """带连接池的Session：同一个host复用TCP+TLS连接，默认接受gzip"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+_limiter = RateLimiter(SEC_MAX_REQUESTS_PER_SECOND)
+_concurrency = AdaptiveConcurrency()
+_backoff = {"max_retries": MAX_RETRIES, "base": BACKOFF_BASE, "max": BACKOFF_MAX}
+_base_url_overrides = {}
+_session = _new_session()
+_response_cache = None
+_cache_enabled = True
+_fixtures = None  # FixtureStore，录制/回放模式时才有
+
+# 传输统计：请求数、304数、实际收到的字节数、和别的线程共用了同一个在途请求的次数
+_http_stats_lock = threading.Lock()
+_http_stats = {"requests": 0, "not_modified": 0, "bytes_received": 0, "deduplicated": 0, "retries": 0}
+
+
+def configure_rate_limit(rate=SEC_MAX_REQUESTS_PER_SECOND, burst=None, max_in_flight=None):
+    """
+    替换全局限速器（整个进程共用一个）
+
+    Returns:
+        新的RateLimiter
+    """
+    global _limiter, _session
+    _limiter = RateLimiter(rate, burst, max_in_flight)
+    if max_in_flight and max_in_flight > HTTP_POOL_MAXSIZE:
+        # 连接池要能容纳所有在途请求，否则多出来的连接用完就被丢掉
+        _session = _new_session(max_in_flight)
+    if _concurrency is not None:
+        _concurrency.set_max(max_in_flight or HTTP_POOL_MAXSIZE)
+    return _limiter
+
+
+def configure_backoff(max_retries=MAX_RETRIES, base=BACKOFF_BASE, max_delay=BACKOFF_MAX):
+    """
+    429/503/连接错误的重试参数
+
+    Args:
+        max_retries: 最多重试几次，0表示不重试
+        base: 第一次重试的最长等待（秒），之后每次翻倍
+        max_delay: 单次等待的上限（秒）；Retry-After 比它长时按 Retry-After
+    """
+    _backoff.update(max_retries=max_retries, base=base, max=max_delay)
+
+
+def configure_concurrency(max_limit=None, min_limit=1, initial=None, adaptive=True, **kwargs):
+    """
+    替换在途请求数的AIMD控制器
+
+    Args:
+        max_limit: 上限的上限，默认取当前限速器的 max_in_flight（没有时是连接池大小）
+        min_limit / initial / kwargs: 见 AdaptiveConcurrency
+        adaptive: False时关闭自适应（只由限速器的 max_in_flight 控制）
+
+    Returns:
+        AdaptiveConcurrency（关闭时返回None）
+    """
+    global _concurrency
+    max_limit = max_limit or _limiter.max_in_flight or HTTP_POOL_MAXSIZE
+    _concurrency = AdaptiveConcurrency(max_limit, min_limit, initial, **kwargs) if adaptive else None
+    return _concurrency
+
+
+def concurrency_report():
+    """AIMD控制器的当前上限和统计，关闭时返回None"""
+    return _concurrency.report() if _concurrency is not None else None
+
+
+def configure_http(cache_dir=RESPONSE_CACHE_DIR, enabled=True, max_bytes=RESPONSE_CACHE_MAX_BYTES, json_ttl=JSON_TTL):
+    """
+    设置响应缓存
+
+    Args:
+        cache_dir: 缓存目录
+        enabled: False时关闭缓存和条件请求（每次都完整下载）
+        max_bytes: 缓存大小上限（压缩后），超过按LRU淘汰
+        json_ttl: submissions / companyfacts 等JSON的有效期（秒）
+    """
+    global _response_cache, _cache_enabled
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = ResponseCache(cache_dir, max_bytes, json_ttl) if enabled else None
+    _cache_enabled = enabled
+
+
+def set_json_ttl(json_ttl):
+    """
+    修改JSON缓存的有效期（秒），返回原来的值（缓存关闭时什么都不做，返回None）
+    0表示每次都向SEC确认：有缓存时发条件请求，没变化是304，变了就重新下载
+    """
+    cache = _get_response_cache()
+    if cache is None:
+        return None
+    previous = cache.json_ttl
+    cache.json_ttl = json_ttl
+    return previous
+
+
+def configure_fixtures(root=None, mode="replay"):
+    """
+    录制/回放（见 http_fixtures）
+
+    Args:
+        root: 语料目录；None表示关闭，恢复正常请求
+        mode: "record" 正常请求并把响应存到root；"replay" 只从root读，不发任何请求
+
+    Returns:
+        FixtureStore（root为None时返回None）
+    """
+    global _fixtures
+    _fixtures = FixtureStore(root, mode) if root is not None else None
+    return _fixtures
+
+
+def fixture_report():
+    """录制/回放统计，没开时返回None"""
+    return _fixtures.report() if _fixtures is not None else None
+
+
+def _get_response_cache():
+    global _response_cache
+    if _response_cache is None and _cache_enabled:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def cache_report():
+    """缓存命中/未命中统计，缓存关闭时返回None"""
+    cache = _get_response_cache()
+    return cache.report() if cache is not None else None
+
+
+def http_stats():
+    """返回传输统计的副本"""
+    with _http_stats_lock:
+        return dict(_http_stats)
+
+
+def endpoint_of(url):
+    """URL属于哪类SEC接口（metrics的标签）"""
+    if "/submissions/" in url:
+        return "submissions"
+    if "/api/xbrl/companyfacts/" in url:
+        return "companyfacts"
+    if "/api/xbrl/frames/" in url:
+        return "frames"
+    if "/Archives/" in url:
+        return "archives"
+    if "company_tickers" in url:
+        return "tickers"
+    return "other"
+
+
+def _record_response(resp, streamed=False):
+    # Content-Length 是压缩后的长度，即实际传输的字节数
+    received = resp.headers.get("Content-Length")
+    if received and received.isdigit():
+        received = int(received)
+    else:
+        received = 0 if streamed else len(resp.content)
+    with _http_stats_lock:
+        _http_stats["requests"] += 1
+        _http_stats["bytes_received"] += received
+        if resp.status_code == 304:
+            _http_stats["not_modified"] += 1
+    endpoint = endpoint_of(resp.url or "")
+    metrics.inc("http_responses", endpoint=endpoint, status=resp.status_code)
+    metrics.inc("http_bytes", received, endpoint=endpoint)
+    if resp.elapsed is not None:
+        # 到收到响应头为止的时间（流式读取的body不算在内）
+        metrics.observe("http_request_seconds", resp.elapsed.total_seconds(), endpoint=endpoint)
+
+
+def _record_cache(url, result):
+    """缓存查找结果：hit（新鲜，没发请求）/ revalidated（304）/ miss"""
+    metrics.inc("cache_lookups", endpoint=endpoint_of(url), result=result)
+
+
+def _response_from_cache(url, entry, body):
+    """用缓存内容拼一个200响应，调用方不用区分是缓存命中还是304"""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = body
+    resp.encoding = entry.get("encoding")
+    resp.headers = CaseInsensitiveDict({
+        "Content-Type": entry.get("content_type") or "",
+        "ETag": entry.get("etag") or "",
+        "Last-Modified": entry.get("last_modified") or "",
+    })
+    resp.from_cache = True
+    return resp
+
+
+def get_rate_limiter():
+    return _limiter
+
+
+def set_base_url(original, replacement):
+    """
+    把某个SEC域名重定向到别的地址，例如
+    set_base_url(SEC_DATA_URL, "http://127.0.0.1:8000")
+    """
+    _base_url_overrides[original] = replacement.rstrip("/")
+
+
+def reset_base_urls():
+    _base_url_overrides.clear()
+
+
+def resolve_url(url):
+    for original, replacement in _base_url_overrides.items():
+        if url.startswith(original):
+            return replacement + url[len(original):]
+    return url
+
+
+class _SingleFlight:
+    """
+    同一个key同时只执行一次：第一个调用方真正去请求，
+    同时到达的其他调用方等它的结果（异常也一起抛出），不再各自发请求
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> [Event, result, error]
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            with _http_stats_lock:
+                _http_stats["deduplicated"] += 1
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = fn()
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1]
+
+
+_single_flight = _SingleFlight()
+
+
+def sec_get(url, headers=None, use_cache=True, **kwargs):
+    """
+    限速后的GET请求，用法和 requests.get 一样
+
+    - archive文件（10-K HTML等）缓存命中直接返回，不发请求
+    - JSON接口在TTL内直接返回缓存；过期后带上 If-None-Match / If-Modified-Since，
+      SEC返回304时把缓存内容包装成200返回，调用方无感知
+    - 调用方自己带了条件请求头、use_cache=False、或者 stream=True 时不走缓存
+    - 多个线程同时请求同一个URL时只发一次请求，共用同一个响应（带了额外参数或条件请求头的除外）
+    - 429/503和连接错误自动退避重试（遵守Retry-After），在途请求数由AIMD控制器自动调整
+
+    Args:
+        url: SEC地址
+        headers: 请求头（一般是 get_sec_headers()）
+        use_cache: False 时不查也不写响应缓存（调用方自己有缓存的时候用，比如 TickerRegistry）
+
+    Returns:
+        requests.Response（共用时是同一个对象，调用方不要修改它）
+    """
+    fixtures = _fixtures
+    if fixtures is not None and fixtures.mode == "replay":
+        return fixtures.response(url)
+    original_url = url
+    url = resolve_url(url)
+    headers = headers or {}
+    if kwargs or "If-None-Match" in headers or "If-Modified-Since" in headers:
+        resp = _fetch(url, headers, use_cache, **kwargs)  # 调用方自己控制的请求不合并
+    else:
+        resp = _single_flight.do(url, lambda: _fetch(url, headers, use_cache))
+    if fixtures is not None and not kwargs.get("stream"):
+        fixtures.save(original_url, resp)  # 按原始URL录，回放时和 set_base_url 无关
+    return resp
+
+
+def _retry_after_seconds(resp):
+    """Retry-After 头（秒数或HTTP日期）-> 秒，没有或解析不了时返回None"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt, retry_after=None):
+    """第attempt次重试前等多久：full jitter指数退避，有Retry-After时至少等那么久"""
+    delay = random.uniform(0, min(_backoff["max"], _backoff["base"] * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, _backoff["base"]))
+    return delay
+
+
+def _send(url, headers, **kwargs):
+    """
+    真正发请求的地方（限速 + 在途数控制 + 限流重试）
+
+    429/503、连接错误和响应体读到一半断开按指数退避重试（遵守Retry-After），同时通知AIMD控制器降低在途上限；
+    重试次数用完后返回最后一个响应（调用方 raise_for_status 时报错），连接错误则抛出
+    """
+    attempt = 0
+    while True:
+        concurrency = _concurrency
+        if concurrency is not None:
+            concurrency.acquire()
+        # 在途名额无论如何都要还：默认按出错还（其他异常、KeyboardInterrupt也一样），拿到响应后按响应还
+        outcome = {"error": True}
+        resp = None
+        try:
+            with _limiter:
+                resp = _session.get(url, headers=headers, **kwargs)
+            _record_response(resp, streamed=kwargs.get("stream", False))
+            throttled = resp.status_code in RETRY_STATUSES
+            retry_after = _retry_after_seconds(resp) if throttled else None
+            outcome = {"latency": resp.elapsed.total_seconds() if resp.elapsed is not None else None,
+                       "throttled": throttled, "retry_after": retry_after}
+        except RETRY_EXCEPTIONS as e:
+            if attempt >= _backoff["max_retries"]:
+                raise
+            metrics.inc("http_retries", endpoint=endpoint_of(url), reason=type(e).__name__)
+            retry_after = None
+        finally:
+            if concurrency is not None:
+                concurrency.release(**outcome)
+        if resp is not None:
+            if not throttled or attempt >= _backoff["max_retries"]:
+                return resp
+            resp.close()
+            metrics.inc("http_retries", endpoint=endpoint_of(url), reason=str(resp.status_code))
+        with _http_stats_lock:
+            _http_stats["retries"] += 1
+        time.sleep(_backoff_delay(attempt, retry_after))
+        attempt += 1
+
+
+def _fetch(url, headers=None, use_cache=True, **kwargs):
+    headers = dict(headers or {})
+    cache = None
+    entry = None
+    if use_cache and "If-None-Match" not in headers and "If-Modified-Since" not in headers and not kwargs.get("stream"):
+        cache = _get_response_cache()
+    if cache is not None:
+        entry = cache.lookup(url)
+        if entry is not None and entry["fresh"]:
+            _record_cache(url, "hit")
+            return _response_from_cache(url, entry, cache.read(entry))
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        else:
+            cache.record_miss()
+            _record_cache(url, "miss")
+
+    resp = _send(url, headers, **kwargs)
+
+    if cache is None:
+        return resp
+    if resp.status_code == 304 and entry is not None:
+        cache.touch(entry)
+        _record_cache(url, "revalidated")
+        return _response_from_cache(url, entry, cache.read(entry, count_hit=False))
+    if resp.status_code == 200:
+        if entry is not None:
+            cache.record_miss()  # 过期且内容已经变了
+            _record_cache(url, "miss")
+        cache.put(url, resp)
+    return resp
+
+
+class _StreamReader:
+    """
+    HTTP响应体的流式读取（自动解压gzip）；传入cache_writer时边读边写缓存，
+    只有完整读到结尾才写入缓存，中途close则丢弃
+    """
+
+    def __init__(self, resp, cache_writer=None):
+        self.resp = resp
+        self.raw = resp.raw
+        self.raw.decode_content = True
+        self.cache_writer = cache_writer
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size if size is not None and size >= 0 else None)
+        if data:
+            self.bytes_read += len(data)
+            if self.cache_writer is not None:
+                self.cache_writer.write(data)
+        elif self.cache_writer is not None:
+            self.cache_writer.commit()
+            self.cache_writer = None
+        return data
+
+    def close(self):
+        if self.cache_writer is not None:
+            self.cache_writer.abort()
+            self.cache_writer = None
+        self.resp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def sec_stream(url, headers=None, use_cache=True):
+    """
+    流式GET：返回一个可 read(n) 的字节流（已解压），不把整个响应读进内存
+
+    缓存规则和 sec_get 一样：新鲜的缓存直接从本地读，过期的做条件请求；
+    从网络读取时边读边写缓存（读到结尾才写入）；录制模式下整份下载（录下来）再返回内存里的流
+    use_cache=False 时不查也不写缓存（调用方打算读一部分就停的时候用）
+
+    Returns:
+        有 read / close 方法的对象，支持 with
+    """
+    if _fixtures is not None:
+        if _fixtures.mode == "replay":
+            return _fixtures.open(url)
+        resp = sec_get(url, headers=headers)
+        resp.raise_for_status()
+        return io.BytesIO(resp.content)
+    url = resolve_url(url)
+    headers = dict(headers or {})
+    cache = _get_response_cache() if use_cache else None
+    entry = None
+    if cache is not None:
+        entry = cache.lookup(url)
+        if entry is not None and entry["fresh"]:
+            _record_cache(url, "hit")
+            return cache.open(entry)
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        else:
+            cache.record_miss()
+            _record_cache(url, "miss")
+
+    resp = _send(url, headers, stream=True)
+
+    if resp.status_code == 304 and cache is not None and entry is not None:
+        resp.close()
+        cache.touch(entry)
+        _record_cache(url, "revalidated")
+        return cache.open(entry, count_hit=False)
+    if resp.status_code >= 400:
+        resp.close()
+    resp.raise_for_status()
+    if cache is None:
+        return _StreamReader(resp)
+    if entry is not None:
+        cache.record_miss()
+        _record_cache(url, "miss")
+    return _StreamReader(resp, cache.open_writer(url, resp))
+
@@ -1,98 +1,213 @@
 import requests
 import json
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from first_01 import get_sec_headers
+from itertools import chain
+import metrics
+from sec_client import sec_get
+from first_01 import get_sec_headers, TickerRegistry
 #新建 task1_filings.py - 抓取10-K/10-Q文件列表
-def get_filings_for_company(cik, years_back=5): #要确认cik
+
+# submissions JSON里 filings.recent 只有最近的约1000份filing（或最近一年），
+# 更早的在 filings.files 列出的分页文件里（CIK##########-submissions-001.json）
+SUBMISSIONS_PAGE_URL = "https://data.sec.gov/submissions/{name}"
+SUBMISSIONS_PAGE_WORKERS = 4  # 同时下载的分页数（请求速率仍由 sec_client 的限速器控制）
+
+# 只要这些表单
+FILING_FORMS = ["10-K", "10-K/A", "10-Q", "10-Q/A"]
+
+# filings列表的列（cik是补好的10位数字，fiscal_year留给后续从companyfacts获取）
+FILING_COLUMNS = [
+    "cik", "form", "filing_date", "accession_number", "primary_document", "filing_url", "fiscal_year",
+]
+
+def get_filings_for_company(cik, years_back=5, context=None): #要确认cik
     """
     获取公司过去N年的10-K和10-Q文件列表
 
     Args:
         cik: 10位CIK字符串，如 "0000320193"
         years_back: 回溯年数，默认5年
+        context: company_context.CompanyContext；传了就用它已经（或正在）下载的submissions
+            （filings列表按 context.years_back 取，和 years_back 不一致时报错）
     
     Returns:
         DataFrame包含所有10-K和10-Q文件信息
         根据日期由近到远，由(由10K、Q等)cik，form，date，doc，url 组成
+    
+    Raises:
+        ValueError: 传了context，但 years_back 和 context.years_back 不一样
     """
+    if context is not None:
+        check_context_years_back(context, years_back)
+        return context.filings
     url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-    resp = requests.get(url, headers=get_sec_headers())
+    with metrics.timer("submissions_fetch", cik) as t:
+        resp = sec_get(url, headers=get_sec_headers())
+        resp.raise_for_status()
+        data = resp.json()
+        t.bytes = len(resp.content)
+    
+    # 回溯期超过recent覆盖的范围时，补上需要的分页
+    with metrics.timer("submissions_pages", cik):
+        pages = fetch_submission_pages(data, years_back)
+    return filings_from_submissions(data, cik, years_back, pages)
+
+def check_context_years_back(context, years_back):
+    """CompanyContext 的filings列表是按它自己的 years_back 取的，调用方的 years_back 必须一致"""
+    if context.years_back != years_back:
+        raise ValueError(f"years_back={years_back} does not match CompanyContext.years_back={context.years_back}")
+
+def submission_pages_needed(data, years_back=5):
+    """
+    filings.files 里和回溯期有重叠的分页文件名（filingTo >= 截止日期），
+    整页都比截止日期早的不用下载
+    """
+    cutoff = (datetime.now() - timedelta(days=years_back * 365)).strftime("%Y-%m-%d")
+    files = data.get("filings", {}).get("files", [])
+    return [page["name"] for page in files if (page.get("filingTo") or "9999-12-31") >= cutoff]
+
+def fetch_submission_page(name):
+    """下载一个分页（返回的dict和 filings.recent 是同样的列式结构）"""
+    resp = sec_get(SUBMISSIONS_PAGE_URL.format(name=name), headers=get_sec_headers())
     resp.raise_for_status()
-    data = resp.json()
+    return resp.json()
+
+def fetch_submission_pages(data, years_back=5, max_workers=SUBMISSIONS_PAGE_WORKERS, load_page=fetch_submission_page):
+    """
+    并发下载回溯期需要的分页
+    
+    Args:
+        data: submissions JSON
+        years_back: 回溯年数
+        max_workers: 同时下载的分页数
+        load_page: 文件名 -> 分页dict（bulk模式从zip里读）
     
-    # 获取filings.recent部分
+    Returns:
+        分页dict列表，顺序和 filings.files 一致（由新到旧）；不需要分页时是空列表
+    """
+    names = submission_pages_needed(data, years_back)
+    if len(names) <= 1 or max_workers <= 1:
+        return [load_page(name) for name in names]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as executor:
+        return list(executor.map(load_page, names))
+
+def merge_submission_columns(data, pages=()):
+    """
+    filings.recent 和分页按列拼接：每列一个list（list拼接，不逐行处理）
+    分页缺某一列时用None补齐，保证各列长度一致
+    
+    Returns:
+        {列名: list}
+    """
     recent = data.get("filings", {}).get("recent", {})
-    forms = recent.get("form", [])
-    filing_dates = recent.get("filingDate", [])
-    primary_docs = recent.get("primaryDocument", [])
-    accession_numbers = recent.get("accessionNumber", [])
+    if not pages:
+        return recent
+    blocks = [recent, *pages]
+    keys = list(dict.fromkeys(key for block in blocks for key in block))
+    sizes = [len(block.get("accessionNumber", [])) for block in blocks]
+    return {
+        key: list(chain.from_iterable(block.get(key) or [None] * size for block, size in zip(blocks, sizes)))
+        for key in keys
+    }
+
+def filings_from_submissions(data, cik, years_back=5, pages=None):
+    """
+    从submissions JSON（已解析的dict）中筛选10-K/10-Q
+    在线抓取和bulk zip导入共用这一段逻辑
     
-    # 计算截止日期（5年前）
-    cutoff_date = datetime.now() - timedelta(days=years_back * 365) #这里需要考虑闰年吗（小细节）
+    Args:
+        data: submissions JSON
+        cik: 10位CIK字符串
+        years_back: 回溯年数
+        pages: fetch_submission_pages 取回的分页（None表示只看filings.recent）
     
-    filings = []
-    for i in range(len(forms)):
-        form = forms[i]
-        # 只关注10-K和10-Q（包括修正版）
-        if form in ["10-K", "10-K/A", "10-Q", "10-Q/A"]:
-            filing_date = datetime.strptime(filing_dates[i], "%Y-%m-%d")
-            
-            # 只保留过去5年的
-            if filing_date >= cutoff_date:
-                accession_no = accession_numbers[i]
-                primary_doc = primary_docs[i]
+    Returns:
+        同 get_filings_for_company
+    """
+    return filings_from_submissions_batch([(cik, data, pages)], years_back)
 
-                
-                # 构建真实URL
-                cik_numeric = str(int(cik))  # 去掉前导零  （这里放在for循环外面会不会减少运算量）
-                accession_no_clean = accession_no.replace("-", "")
-                filing_url = (
-                    f"https://www.sec.gov/Archives/edgar/data/"
-                    f"{cik_numeric}/{accession_no_clean}/{primary_doc}"
-                )
-                
-                filings.append({
-                    "cik": cik,  # 这个cik是已经补好的10位数字
-                    "form": form,
-                    "filing_date": filing_dates[i],
-                    "accession_number": accession_no,
-                    "primary_document": primary_doc,
-                    "filing_url": filing_url,
-                    "fiscal_year": None,  # 后续从companyfacts获取
-                })
+def filings_from_submissions_batch(documents, years_back=5):
+    """
+    一次处理多家公司的submissions：所有公司的列数组先拼起来，
+    表单类型和日期截止用向量化的mask过滤，URL用字符串列运算生成（不逐条strptime、不逐条建dict）
     
-    df = pd.DataFrame(filings)
-    if len(df) > 0:
-        df = df.sort_values("filing_date", ascending=False)
+    Args:
+        documents: [(cik, submissions JSON, 分页列表或None), ...]
+        years_back: 回溯年数
+    
+    Returns:
+        DataFrame，列见 FILING_COLUMNS；按公司（documents的顺序）分组，
+        公司内按日期由近到远（同一天的保持submissions里的顺序）
+    """
+    blocks = [merge_submission_columns(data, pages) for _, data, pages in documents]
+    sizes = np.array([len(block.get("form", [])) for block in blocks], dtype="int64")
+    def column(key):
+        return list(chain.from_iterable(block.get(key, []) for block in blocks))
+    df = pd.DataFrame({
+        "order": np.repeat(np.arange(len(blocks)), sizes),
+        "cik": np.repeat([cik for cik, _, _ in documents], sizes) if len(documents) else [],
+        "form": column("form"),
+        "filing_date": column("filingDate"),
+        "accession_number": column("accessionNumber"),
+        "primary_document": column("primaryDocument"),
+    })
     
-    return df  # 根据日期由近到远，由(由10K、Q等)cik，form，date，doc，url 组成
+    # 只关注10-K和10-Q（包括修正版），只保留过去N年的
+    cutoff_date = datetime.now() - timedelta(days=years_back * 365)
+    filing_dates = pd.to_datetime(df["filing_date"], format="%Y-%m-%d", errors="coerce")
+    mask = df["form"].isin(FILING_FORMS) & (filing_dates >= cutoff_date)
+    df = df[mask.to_numpy()].reset_index(drop=True)
+    if len(df) == 0:
+        return pd.DataFrame(columns=FILING_COLUMNS)
+    
+    # 构建真实URL：.../data/{去掉前导零的CIK}/{去掉横线的accession}/{主文档}
+    cik_numeric = df["cik"].astype(str).str.lstrip("0").replace("", "0")
+    df["filing_url"] = (
+        "https://www.sec.gov/Archives/edgar/data/" + cik_numeric + "/"
+        + df["accession_number"].str.replace("-", "", regex=False) + "/" + df["primary_document"]
+    )
+    df["fiscal_year"] = None  # 后续从companyfacts获取
+    
+    df = df.sort_values("filing_date", ascending=False, kind="stable")
+    df = df.sort_values("order", kind="stable")
+    return df[FILING_COLUMNS].reset_index(drop=True)
 
-def get_all_filings_for_ticker(ticker, df_companies, years_back=5):
+def get_all_filings_for_ticker(ticker, df_companies=None, years_back=5, registry=None):
     """
     根据ticker获取所有filings
     
     Args:
         ticker: 股票代码，如 "AAPL"
-        df_companies: 公司列表DataFrame
+        df_companies: 公司列表DataFrame（旧接口，传了registry就不用）
         years_back: 回溯年数
+        registry: TickerRegistry，O(1)查ticker；两个都不传时读本地缓存
     return:
         这里返回的表格的链接最红可以直接看10K等文件，html格式
     """
-    company_row = df_companies[df_companies["ticker"] == ticker]
-    #这里是ticker 还是tickers，根据输入的ticker(股票代码)找公司
-    if len(company_row) == 0:
+    if registry is None and df_companies is not None:
+        company_row = df_companies[df_companies["ticker"] == ticker]
+        #这里是ticker 还是tickers，根据输入的ticker(股票代码)找公司
+        if len(company_row) == 0:
+            raise ValueError(f"Ticker {ticker} not found")
+        cik = company_row.iloc[0]["cik"]
+        return get_filings_for_company(cik, years_back)
+
+    if registry is None:
+        registry = TickerRegistry.load()
+    company = registry.lookup(ticker)
+    if company is None:
         raise ValueError(f"Ticker {ticker} not found")
     
-    cik = company_row.iloc[0]["cik"]
+    cik, _ = company
     return get_filings_for_company(cik, years_back)
 #这里返回的表格的链接最红可以直接看10K等文件，html格式
 if __name__ == "__main__":
     # 测试：获取AAPL的filings
-    from first_01 import fetch_company_tickers
-    
-    df_companies = fetch_company_tickers()
-    df_filings = get_all_filings_for_ticker("AAPL", df_companies, years_back=5)
+    registry = TickerRegistry.load()
+    df_filings = get_all_filings_for_ticker("AAPL", years_back=5, registry=registry)
     print(f"\nFound {len(df_filings)} filings for AAPL:")
     print(df_filings[["form", "filing_date", "filing_url"]].head(10))
     df2=df_filings[["form", "filing_date", "filing_url"]].head(10)
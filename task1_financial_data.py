@@ -1,7 +1,12 @@
 import requests
 import json
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from itertools import compress
+import metrics
+from sec_client import sec_get, sec_stream
+from json_stream import iter_companyfacts_tags
 from first_01 import get_sec_headers
 #新建 task1_financial_data.py - 抓取财务数据
 
@@ -10,59 +15,57 @@ asset_quality_threshold = 1
 cashflow_quality_threshold = 1  # 现金流检查的百分比阈值（%）
 
 # 财务指标映射（US-GAAP标签）
+# 每个指标有多个候选标签，按优先级排列：单个标签（比如 Revenues）会漏掉很多公司，
+# 同一个期间多个候选标签都有值时取排在前面的，前面的标签没有的期间用后面的补
 FINANCIAL_METRICS = {
-    "revenue": "Revenues",
-    "operating_income": "OperatingIncomeLoss",
-    "net_income": "NetIncomeLoss",
-    "eps": "EarningsPerShareBasic",
-    "assets": "Assets",
-    "liabilities": "Liabilities",
-    "equity": "Equity",
-    "ocf": "NetCashProvidedByUsedInOperatingActivities",  # Operating Cash Flow
-    "icf": "NetCashProvidedByUsedInInvestingActivities",
-    "fcf": "NetCashProvidedByUsedInFinancingActivities",
-    "capex": "CapitalExpenditures",
-    "cash": "CashAndCashEquivalentsAtCarryingValue",
+    "revenue": [
+        "Revenues",
+        "SalesRevenueNet",
+        "OperatingRevenue",
+        "RevenueFromContractWithCustomerExcludingAssessedTax",
+    ],
+    "operating_income": [
+        "OperatingIncomeLoss",
+        "OperatingProfit",
+    ],
+    "net_income": [
+        "NetIncomeLoss",
+        "ProfitLoss",
+        "NetIncomeLossAvailableToCommonStockholdersBasic",
+    ],
+    "eps": [
+        "EarningsPerShareBasic",
+        "EarningsPerShareBasicAndDiluted",
+        "EarningsPerShareDiluted",
+    ],
+    "assets": ["Assets"],
+    "liabilities": ["Liabilities"],
+    "equity": [
+        "Equity",
+        "StockholdersEquity",
+        "StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest",
+    ],
+    "ocf": [  # Operating Cash Flow
+        "NetCashProvidedByUsedInOperatingActivities",
+        "NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
+    ],
+    "icf": [
+        "NetCashProvidedByUsedInInvestingActivities",
+        "NetCashProvidedByUsedInInvestingActivitiesContinuingOperations",
+    ],
+    "fcf": [
+        "NetCashProvidedByUsedInFinancingActivities",
+        "NetCashProvidedByUsedInFinancingActivitiesContinuingOperations",
+    ],
+    "capex": [
+        "CapitalExpenditures",
+        "PaymentsToAcquirePropertyPlantAndEquipment",
+    ],
+    "cash": [
+        "CashAndCashEquivalentsAtCarryingValue",
+        "CashCashEquivalentsRestrictedCashAndRestrictedCashEquivalents",
+    ],
 }
-#备用的metrics:
-# FINANCIAL_METRICS = {
-#     "revenue": [
-#         "Revenues",
-#         "SalesRevenueNet",
-#         "OperatingRevenue",
-#         "RevenueFromContractWithCustomerExcludingAssessedTax",
-#     ],
-#     "operating_income": [
-#         "OperatingIncomeLoss",
-#         "OperatingProfit",
-#     ],
-#     "net_income": [
-#         "NetIncomeLoss",
-#         "ProfitLoss",
-#         "NetIncomeLossAvailableToCommonStockholdersBasic",
-#     ],
-#     "eps": [
-#         "EarningsPerShareBasic",
-#         "EarningsPerShareBasicAndDiluted",
-#         "EarningsPerShareDiluted",
-#     ],
-#     "assets": ["Assets"],
-#     "liabilities": ["Liabilities"],
-#     "equity": ["Equity"],
-#     "ocf": [
-#         "NetCashProvidedByUsedInOperatingActivities",
-#         "NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
-#     ],
-#     "capex": [
-#         "CapitalExpenditures",
-#         "PaymentsToAcquirePropertyPlantAndEquipment",
-#     ],
-#     "cash": [
-#         "CashAndCashEquivalentsAtCarryingValue",
-#         "CashCashEquivalentsRestrictedCashAndRestrictedCashEquivalents",
-#     ],
-# }
-
 
 def fetch_company_facts(cik):
     """
@@ -75,9 +78,167 @@ def fetch_company_facts(cik):
         完整的companyfacts JSON数据
     """
     url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
-    resp = requests.get(url, headers=get_sec_headers())
-    resp.raise_for_status()
-    return resp.json()
+    with metrics.timer("companyfacts_fetch", cik) as t:
+        resp = sec_get(url, headers=get_sec_headers())
+        resp.raise_for_status()
+        t.bytes = len(resp.content)
+        return resp.json()
+
+def fetch_company_facts_stream(cik):
+    """
+    以字节流的方式获取companyfacts（不读进内存），配合 extract_financial_data_streaming 使用
+    
+    Returns:
+        有 read(n) / close() 的流对象，支持 with
+    """
+    url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
+    return sec_stream(url, headers=get_sec_headers())
+
+# 标签 -> (metric_key, 优先级)，提取时只查这张表，开销和公司实际有的标签数成正比
+TAG_TO_METRIC = {
+    tag: (metric_key, priority)
+    for metric_key, tags in FINANCIAL_METRICS.items()
+    for priority, tag in enumerate(tags)
+}
+
+# extract_financial_data 输出的列
+FACT_COLUMNS = [
+    "metric", "metric_name", "value", "unit", "fiscal_year", "fiscal_period",
+    "form", "filed_date", "start_date", "end_date", "frame", "Accession_Number",
+]
+
+# companyfacts 每条记录里用到的字段
+_RECORD_FIELDS = ["val", "fy", "fp", "form", "filed", "start", "end", "frame", "accn"]
+
+def build_fact_frame(metric_units, years_back=5):
+    """
+    把多个标签的记录一次性拼成列式数组，再用向量化操作做单位选择、日期解析和cutoff过滤
+    （代替逐条 strptime + 逐条append字典），最后在候选标签之间选值（见 resolve_metric_tags）
+    
+    Args:
+        metric_units: 可迭代的 (metric_key, metric_name, units)，units 即 facts[tag]["units"]
+        years_back: 回溯年数
+    
+    Returns:
+        DataFrame，列见 FACT_COLUMNS；metric_name 是最终选中的标签
+    """
+    cutoff_date = datetime.now() - timedelta(days=years_back * 365)
+    
+    records = []
+    batches = []  # 每个(标签, 单位)一段：(metric_key, metric_name, unit_key, unit_rank, 记录数)
+    for metric_key, metric_name, units in metric_units:
+        for rank, (unit_key, unit_records) in enumerate(units.items()):
+            records.extend(unit_records)
+            # 通常使用USD单位，没有USD时用第一个单位
+            batches.append((metric_key, metric_name, unit_key, 0 if unit_key == "USD" else rank + 1, len(unit_records)))
+    
+    if not records:
+        return pd.DataFrame()
+    
+    counts = np.array([batch[4] for batch in batches])
+    # 单位选择：每个标签只保留rank最小的单位；标签之间的取舍留给 resolve_metric_tags 按优先级做
+    # （不能按指标选单位，否则优先级高、只有非USD单位的标签会被优先级低的USD标签挤掉）
+    best_rank = {}
+    for metric_key, metric_name, _, rank, _ in batches:
+        key = (metric_key, metric_name)
+        best_rank[key] = min(rank, best_rank.get(key, rank))
+    keep_batch = np.array([rank == best_rank[(metric_key, metric_name)]
+                           for metric_key, metric_name, _, rank, _ in batches])
+    
+    # 只保留过去5年的数据（filed整列一次解析）
+    filed = pd.DataFrame.from_records(records, columns=["filed"])["filed"]
+    filed_date = pd.to_datetime(filed, format="%Y-%m-%d")
+    mask = np.repeat(keep_batch, counts) & (filed_date >= cutoff_date).to_numpy()
+    
+    # 过滤后的记录一次性转成列（C实现），dtype按保留下来的数据推断
+    df_records = pd.DataFrame.from_records(list(compress(records, mask)), columns=_RECORD_FIELDS)
+    del records
+    
+    df = pd.DataFrame({
+        "metric": np.repeat([batch[0] for batch in batches], counts)[mask],
+        "metric_name": np.repeat([batch[1] for batch in batches], counts)[mask],
+        "value": df_records["val"],
+        "unit": np.repeat([batch[2] for batch in batches], counts)[mask],
+        "fiscal_year": df_records["fy"],
+        "fiscal_period": df_records["fp"],  # Q1, Q2, Q3, Q4, FY
+        "form": df_records["form"],  # 10-K or 10-Q
+        "filed_date": df_records["filed"],
+        "start_date": df_records["start"],  # 时点指标（资产负债表）没有start
+        "end_date": df_records["end"],
+        "frame": df_records["frame"],  # 用于季度数据的年度标识
+        "Accession_Number": df_records["accn"],
+    })
+    if len(df) == 0:
+        return pd.DataFrame()
+    priority = np.repeat([TAG_TO_METRIC.get(batch[1], (None, 0))[1] for batch in batches], counts)[mask]
+    return resolve_metric_tags(df, priority)
+
+def resolve_metric_tags(df, priority):
+    """
+    同一个指标有多个候选标签时，每个 (metric, fiscal_period, start_date, end_date) 只保留一个标签的记录：
+    优先级高的（FINANCIAL_METRICS里排在前面的）优先；优先级相同时取覆盖期间多的
+    （start_date 要算进去：10-Q里截止日相同的单季度数和年初至今累计数是两个不同的期间）
+    同一标签同一期间的多条记录（原始报告 + 后来的比较数/重述）都保留，和单标签时一样
+    
+    Args:
+        df: build_fact_frame 拼好的DataFrame
+        priority: 每行所属标签的优先级（0最高），和df行对齐的数组
+    
+    Returns:
+        过滤后的DataFrame（保持原来的行顺序）
+    """
+    pairs = df[["metric", "metric_name"]].drop_duplicates()
+    if not pairs["metric"].duplicated().any():
+        return df  # 每个指标只出现了一个标签，不用选
+    
+    # 每个标签在这家公司覆盖了多少个 (fiscal_period, start_date, end_date) 期间
+    periods = df[["metric", "metric_name", "fiscal_period", "start_date", "end_date"]].drop_duplicates()
+    coverage = periods.groupby(["metric", "metric_name"]).size()
+    row_coverage = coverage.reindex(pd.MultiIndex.from_frame(df[["metric", "metric_name"]])).to_numpy()
+    
+    # 优先级为主、覆盖度为辅的综合分数，越小越好
+    score = pd.Series(priority * (len(df) + 1) - row_coverage, index=df.index)
+    best = score.groupby(
+        [df["metric"], df["fiscal_period"], df["start_date"], df["end_date"]], dropna=False, sort=False
+    ).transform("min")
+    return df[score == best].reset_index(drop=True)
+
+def _iter_metric_units(facts):
+    """us-gaap字典 -> (metric_key, metric_name, units)，按FINANCIAL_METRICS的顺序（指标内按优先级）"""
+    for tag, (metric_key, _) in TAG_TO_METRIC.items():
+        if tag in facts:
+            yield metric_key, tag, facts[tag].get("units", {})
+
+def iter_metric_units_stream(fp):
+    """
+    流式解析companyfacts字节流，yield (metric_key, metric_name, units)
+    只有 FINANCIAL_METRICS 里的标签会被解析成Python对象，其余边读边丢
+    
+    Args:
+        fp: companyfacts JSON字节流（HTTP流、缓存文件、zip成员都可以）
+    """
+    for tag, tag_data in iter_companyfacts_tags(fp, "us-gaap", TAG_TO_METRIC):
+        yield TAG_TO_METRIC[tag][0], tag, tag_data.get("units", {})
+
+def extract_financial_data_from_stream(fp, years_back=5):
+    """
+    从companyfacts字节流提取财务数据（在线流式和bulk zip共用）
+    
+    Returns:
+        和 extract_financial_data 相同的DataFrame（指标顺序按标签在文件里出现的顺序）
+    """
+    return build_fact_frame(iter_metric_units_stream(fp), years_back)
+
+def extract_financial_data_streaming(cik, years_back=5):
+    """
+    extract_financial_data 的流式版本：边下载边解析，不生成完整的companyfacts字典
+    峰值内存约等于保留下来的记录本身
+    下载和解析是交织在一起的，整段记在 extraction 阶段
+    """
+    with metrics.timer("extraction", cik) as t, fetch_company_facts_stream(cik) as fp:
+        df_financial = extract_financial_data_from_stream(fp, years_back)
+        t.rows = len(df_financial)
+        return df_financial
 
 def extract_financial_data(company_facts, years_back=5):
     """
@@ -90,8 +251,6 @@ def extract_financial_data(company_facts, years_back=5):
     Returns:
         DataFrame包含所有财务指标
     """
-    cutoff_date = datetime.now() - timedelta(days=years_back * 365)
-    
     facts = company_facts.get("facts", {}).get("us-gaap", {}) #只有us-gaap这一栏有用，Document and Entity Information等不需要考虑
     #这里facts就是us-gapp里面的数据
     """Revenues（收入）
@@ -108,50 +267,8 @@ CapitalExpenditures（资本开支）
 EPS（每股收益）
 Segment 信息（有时）
 Geographic 信息（极少）"""
-    all_data = []
-    
-    # 遍历每个财务指标
-    for metric_key, metric_name in FINANCIAL_METRICS.items():
-        if metric_name not in facts:
-            continue
-        
-        metric_data = facts[metric_name]
-        units = metric_data.get("units", {})
-        
-        # 通常使用USD单位, units是次一级的列表
-        if "USD" not in units:
-            # 尝试其他单位
-            available_units = list(units.keys())
-            if available_units:
-                unit_key = available_units[0]
-            else:
-                continue
-        else:
-            unit_key = "USD"
-        
-        for record in units[unit_key]:
-            # record 就是一条具体的财务数据
-            end_date = datetime.strptime(record["end"], "%Y-%m-%d")
-            filed_date = datetime.strptime(record["filed"], "%Y-%m-%d")
-            
-            # 只保留过去5年的数据
-            if filed_date >= cutoff_date:
-                all_data.append({
-                    "metric": metric_key,
-                    "metric_name": metric_name,
-                    "value": record["val"],
-                    "unit": unit_key,
-                    "fiscal_year": record.get("fy"),
-                    "fiscal_period": record.get("fp"),  # Q1, Q2, Q3, Q4, FY
-                    "form": record.get("form"),  # 10-K or 10-Q
-                    "filed_date": record["filed"],
-                    "end_date": record["end"],
-                    "frame": record.get("frame"),  # 用于季度数据的年度标识
-                    "Accession_Number" : record.get("accn")   #要不要记上这个
-                })
-    
-    df = pd.DataFrame(all_data)
-    return df
+    # 遍历每个财务指标，列式提取
+    return build_fact_frame(_iter_metric_units(facts), years_back)
 #返回us-gaap 的df
 
 def standardize_financial_data(df_financial):  #我想这一步把10K 和 10Q区分开，并尝试在这里算 change in cash flow(compared to last year)
@@ -168,6 +285,9 @@ def standardize_financial_data(df_financial):  #我想这一步把10K 和 10Q区
     # ！！！ 确保所有值都是USD，以下这一行使得单位为share 删除了，这不是我们想要的，先屏蔽喽
     #df_standardized = df_financial[df_financial["unit"] == "USD"].copy()
     df_standardized = df_financial
+    if len(df_standardized.columns) == 0:
+        # 没有提取到任何数据（build_fact_frame 返回的空DataFrame）
+        return pd.DataFrame(columns=FACT_COLUMNS)
     
     # 按fiscal_year和fiscal_period排序
     df_standardized = df_standardized.sort_values(
@@ -177,219 +297,323 @@ def standardize_financial_data(df_financial):  #我想这一步把10K 和 10Q区
 
     return df_standardized
 
-def check_cashflow_balance(df_financial, cik):
+# 质量检查结果表的列
+#   check: "balance_sheet" / "cashflow"
+#   status: "pass" / "warning" / "skipped" / "error"
+#   lhs / rhs: 被比较的两边（Assets vs Liabilities+Equity，OCF+ICF+FCF vs ΔCash）
+QUALITY_RESULT_COLUMNS = ["cik", "fiscal_year", "check", "status", "lhs", "rhs", "diff", "diff_pct", "message"]
+
+CASHFLOW_REQUIRED_METRICS = ["ocf", "icf", "fcf", "capex", "cash"]
+
+
+def build_annual_pivot(df_financial):
     """
-    检查现金流平衡：OCF + ICF + FCF ≈ ΔCash
-    
-    使用年度数据（10-K文件），计算每年的现金流变化
-    
+    年度数据(FY)透视成 (cik, fiscal_year) x metric 的宽表
+    同一财年同一指标有多条时（10-K里还带着往年的比较数），取报告期最晚的那一期，
+    同一报告期再取最新提交的（重述之后的值）
+
     Args:
-        df_financial: 标准化后的财务数据DataFrame
-        cik: CIK用于错误报告
-    
+        df_financial: 单个公司或多个公司的财务数据；多公司时需要有 cik 列
+
+    Returns:
+        以 (cik, fiscal_year) 为索引、metric 为列的DataFrame，按索引升序
+    """
+    if len(df_financial) == 0 or "fiscal_period" not in df_financial.columns:
+        index = pd.MultiIndex.from_arrays([[], []], names=["cik", "fiscal_year"])
+        return pd.DataFrame(index=index)
+
+    df_annual = df_financial.loc[
+        (df_financial["fiscal_period"] == "FY") & df_financial["fiscal_year"].notna(),
+        [c for c in ("cik", "fiscal_year", "metric", "value", "end_date", "filed_date") if c in df_financial.columns],
+    ]
+    if "cik" not in df_annual.columns:
+        df_annual = df_annual.assign(cik="")
+    df_annual = df_annual.assign(fiscal_year=df_annual["fiscal_year"].astype("int64"))
+
+    latest = df_annual.sort_values(
+        ["cik", "fiscal_year", "metric", "end_date", "filed_date"], kind="stable"
+    ).drop_duplicates(["cik", "fiscal_year", "metric"], keep="last")
+    pivot = latest.pivot(index=["cik", "fiscal_year"], columns="metric", values="value")
+    pivot.columns.name = None
+    return pivot.sort_index()
+
+
+def _metric_column(pivot, metric):
+    """透视表里的某个指标列；没有这个指标时返回全NaN"""
+    if metric in pivot.columns:
+        return pivot[metric].astype("float64")
+    return pd.Series(np.nan, index=pivot.index, dtype="float64")
+
+
+def _balance_sheet_results(pivot):
+    """检查1: Assets ≈ Liabilities + Equity（每个 cik x fiscal_year 一行）"""
+    assets = _metric_column(pivot, "assets")
+    liabilities_equity = _metric_column(pivot, "liabilities") + _metric_column(pivot, "equity")
+    has_all = assets.notna() & liabilities_equity.notna()
+    assets = assets[has_all]
+    liabilities_equity = liabilities_equity[has_all]
+
+    balance = assets - liabilities_equity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance_pct = np.where(assets != 0, (balance / assets * 100).abs(), 0.0)
+    failed = balance_pct > asset_quality_threshold
+
+    years = assets.index.get_level_values("fiscal_year")
+    messages = [
+        f"FY{year}: Assets balance check failed. Difference: ${b:,.0f} ({p:.2f}%)" if f
+        else f"FY{year}: Assets balance check passed"
+        for year, b, p, f in zip(years, balance, balance_pct, failed)
+    ]
+    return pd.DataFrame({
+        "cik": assets.index.get_level_values("cik"),
+        "fiscal_year": years,
+        "check": "balance_sheet",
+        "status": np.where(failed, "warning", "pass"),
+        "lhs": assets.to_numpy(),
+        "rhs": liabilities_equity.to_numpy(),
+        "diff": balance.to_numpy(),
+        "diff_pct": balance_pct,
+        "message": messages,
+    })
+
+
+def _cashflow_results(pivot):
+    """
+    检查2: OCF + ICF + FCF ≈ ΔCash
+    ΔCash 用同一公司上一个财年的现金余额（groupby(cik).shift）；
+    缺少必要指标的公司整体记一条error
+    """
+    present = pivot.reindex(columns=CASHFLOW_REQUIRED_METRICS).notna().groupby(level="cik").any()
+    missing_by_cik = {
+        cik: [m for m in CASHFLOW_REQUIRED_METRICS if not row[m]]
+        for cik, row in present.iterrows()
+    }
+    error_rows = pd.DataFrame({
+        "cik": [cik for cik, missing in missing_by_cik.items() if missing],
+        "fiscal_year": pd.NA,
+        "check": "cashflow",
+        "status": "error",
+        "message": [f"Missing required cashflow metrics: {missing}"
+                    for missing in missing_by_cik.values() if missing],
+    })
+
+    ok_ciks = [cik for cik, missing in missing_by_cik.items() if not missing]
+    df = pivot[pivot.index.get_level_values("cik").isin(ok_ciks)]
+    if len(df) == 0:
+        return error_rows
+
+    ocf = _metric_column(df, "ocf")
+    icf = _metric_column(df, "icf")
+    fcf = _metric_column(df, "fcf")
+    cash = _metric_column(df, "cash")
+    complete = ocf.notna() & icf.notna() & fcf.notna() & cash.notna()
+
+    # 上一个财年（透视表里同一公司的上一行，和原来按年份列表取 years[i-1] 一致）
+    by_cik = df.groupby(level="cik", sort=False)
+    years = pd.Series(df.index.get_level_values("fiscal_year"), index=df.index)
+    prev_year = years.groupby(level="cik", sort=False).shift(1)
+    prev_cash = cash.groupby(level="cik", sort=False).shift(1)
+    prev_complete = complete.groupby(level="cik", sort=False).shift(1, fill_value=False)
+    is_first = by_cik.cumcount() == 0
+
+    cashflow_sum = ocf + icf + fcf
+    delta_cash = cash - prev_cash
+    diff = (cashflow_sum - delta_cash).abs()
+    denominator = np.maximum(cashflow_sum.abs(), delta_cash.abs())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff_pct = diff / denominator * 100
+
+    checked = complete & ~is_first & prev_complete
+    both_zero = checked & (denominator == 0)
+    failed = checked & ~both_zero & (diff_pct > cashflow_quality_threshold)
+
+    status = np.select(
+        [~checked, failed], ["skipped", "warning"], default="pass"
+    )
+    messages = []
+    for year, first, prev, ok, zero, fail, s, d, dd, p in zip(
+        years, is_first, prev_year, checked, both_zero, failed,
+        cashflow_sum, delta_cash, diff, diff_pct,
+    ):
+        if first:
+            messages.append(f"FY{year}: Cashflow balance check skipped - First year, no prior cash balance")
+        elif not ok:
+            messages.append(f"FY{year}: Cashflow balance check skipped - Previous year ({int(prev)}) data missing")
+        elif zero:
+            messages.append(f"FY{year}: Cashflow balance check passed (both values are zero)")
+        else:
+            result = "failed" if fail else "passed"
+            messages.append(
+                f"FY{year}: Cashflow balance check {result}. "
+                f"OCF+ICF+FCF: ${s:,.0f}, ΔCash: ${d:,.0f}, "
+                f"Difference: ${dd:,.0f} ({p:.2f}%)"
+            )
+
+    results = pd.DataFrame({
+        "cik": df.index.get_level_values("cik"),
+        "fiscal_year": years.to_numpy(),
+        "check": "cashflow",
+        "status": status,
+        "lhs": cashflow_sum.to_numpy(),
+        "rhs": delta_cash.where(checked).to_numpy(),
+        "diff": diff.where(checked).to_numpy(),
+        "diff_pct": diff_pct.where(~both_zero, 0.0).where(checked).to_numpy(),
+        "message": messages,
+    })
+    # 本年数据不全的年份不出结果（和原来的逐年检查一致）
+    results = results[complete.to_numpy()]
+    return pd.concat([error_rows, results], ignore_index=True) if len(error_rows) else results
+
+
+def run_quality_checks(df_financial, pivot=None):
+    """
+    对财务数据（单个公司或带 cik 列的多公司面板）一次性跑完所有质量检查
+
+    Args:
+        df_financial: 标准化后的财务数据
+        pivot: 已经算好的 build_annual_pivot 结果（可选）
+
     Returns:
-        cashflow_report: 现金流检查报告字典
+        结构化的检查结果表，列见 QUALITY_RESULT_COLUMNS
+    """
+    if pivot is None:
+        pivot = build_annual_pivot(df_financial)
+    frames = [f for f in (_balance_sheet_results(pivot), _cashflow_results(pivot)) if len(f) > 0]
+    if not frames:
+        return pd.DataFrame(columns=QUALITY_RESULT_COLUMNS)
+    results = pd.concat(frames, ignore_index=True).reindex(columns=QUALITY_RESULT_COLUMNS)
+    return results.sort_values(["cik", "check", "fiscal_year"], kind="stable", ignore_index=True)
+
+
+def quality_report_from_results(df_results, cik):
     """
-    cashflow_report = {
+    结构化结果 -> 旧格式的报告字典（checks / warnings / errors 都是字符串列表）
+    pass 记到 checks，warning / skipped 记到 warnings，error 记到 errors
+    资产负债检查按年份倒序、现金流检查按年份升序，和原来的输出顺序一致
+    """
+    report = {
         "cik": cik,
         "checks": [],
         "warnings": [],
         "errors": [],
     }
+    buckets = {"pass": "checks", "warning": "warnings", "skipped": "warnings", "error": "errors"}
+    balance = df_results[df_results["check"] == "balance_sheet"].iloc[::-1]
+    cashflow = df_results[df_results["check"] == "cashflow"]
+    for df in (balance, cashflow):
+        for status, message in zip(df["status"], df["message"]):
+            report[buckets[status]].append(message)
+    return report
+
+
+def check_cashflow_balance(df_financial, cik):
+    """
+    检查现金流平衡：OCF + ICF + FCF ≈ ΔCash
     
-    # 筛选年度数据（fiscal_period == "FY"）
-    df_annual = df_financial[df_financial["fiscal_period"] == "FY"].copy()
-    
-    # 检查必要的指标是否存在
-    required_metrics = ["ocf", "icf", "fcf", "capex", "cash"]
-    available_metrics = df_annual["metric"].unique()
-    missing_metrics = [m for m in required_metrics if m not in available_metrics]
-    
-    if missing_metrics:
-        cashflow_report["errors"].append(
-            f"Missing required cashflow metrics: {missing_metrics}"
-        )
-        return cashflow_report,{} #!!!!!!!!!!!!!!!!!!!!
-    
-    # 按fiscal_year排序（升序，以便计算年度差值）
-    df_annual_sorted = df_annual.sort_values("fiscal_year", ascending=True)
-    years = sorted(df_annual_sorted["fiscal_year"].unique()) #提取年份(eg. 2020, 2021, 2022....)
-    
-    # 存储每年的现金余额，用于计算ΔCash
-    cash_by_year = {}
+    使用年度数据（10-K文件），计算每年的现金流变化
     
-    # 第一遍：收集每年的OCF, ICF, FCF, Cash值
-    for year in years:
-        year_data = df_annual_sorted[df_annual_sorted["fiscal_year"] == year].copy()
-        
-        # 如果有多个记录，按filed_date取最新的
-        year_data_sorted = year_data.sort_values("filed_date", ascending=False)
-        
-        # 获取各个指标的值
-        ocf_data = year_data_sorted[year_data_sorted["metric"] == "ocf"]
-        icf_data = year_data_sorted[year_data_sorted["metric"] == "icf"]
-        fcf_data = year_data_sorted[year_data_sorted["metric"] == "fcf"]
-        cash_data = year_data_sorted[year_data_sorted["metric"] == "cash"]
-        capex_data = year_data_sorted[year_data_sorted["metric"] == "capex"]
-        
-        if len(ocf_data) > 0 and len(icf_data) > 0 and len(fcf_data) > 0 and len(cash_data) > 0:
-            ocf_val = ocf_data.iloc[0]["value"]
-            icf_val = icf_data.iloc[0]["value"]
-            fcf_val = fcf_data.iloc[0]["value"]
-            cash_val = cash_data.iloc[0]["value"]
-            capex_val = capex_data.iloc[0]["value"]
-            
-            cash_by_year[year] = {
-                "ocf": ocf_val,
-                "icf": icf_val,
-                "fcf": fcf_val,
-                "cash": cash_val,
-                "capex": capex_val
-            } #洗完了每一年的数据： ocf, icf, fcf, cash, capex
-    df_cash_by_year = pd.DataFrame(cash_by_year)
-    # 第二遍：计算现金流平衡
-    for i, year in enumerate(years):
-        if year not in cash_by_year:
-            continue
-        # 提取每年现金流的数据
-        year_data = cash_by_year[year]
-        ocf = year_data["ocf"]
-        icf = year_data["icf"]
-        fcf = year_data["fcf"]
-        capex = year_data["capex"]
-        cash_current = year_data["cash"]
-        
-        # 计算现金流总和
-        # cashflow_sum = ocf + icf + fcf
-        cashflow_sum = ocf - abs(capex)
-        
-        # 计算ΔCash = Cash(t) - Cash(t-1)
-        if i == 0:
-            # 第一年没有上一年数据
-            cashflow_report["warnings"].append(
-                f"FY{year}: Cashflow balance check skipped - First year, no prior cash balance"
-            )
-            continue
-        
-        prev_year = years[i - 1]
-        if prev_year not in cash_by_year:
-            cashflow_report["warnings"].append(
-                f"FY{year}: Cashflow balance check skipped - Previous year ({prev_year}) data missing"
-            )
-            continue
-        
-        cash_prev = cash_by_year[prev_year]["cash"]
-        delta_cash = cash_current - cash_prev
-        
-        # 计算差异百分比
-        # 使用绝对值较大的作为分母，避免除零或极小值问题
-        denominator = max(abs(cashflow_sum), abs(fcf))
-        if denominator == 0:
-            # 如果两者都是0，认为是一致的，通过pass
-            cashflow_report["checks"].append(
-                f"FY{year}: Cashflow balance check passed (both values are zero)"
-            )
-            continue
-        
-        diff = abs(cashflow_sum - fcf)
-        diff_pct = (diff / denominator) * 100
-        
-        # 检查是否超过阈值
-        if diff_pct > cashflow_quality_threshold: #目前设定的是1%
-            cashflow_report["warnings"].append(
-                f"FY{year}: Cashflow balance check failed. "
-                f"OCF+ICF+FCF: ${cashflow_sum:,.0f}, ΔCash: ${delta_cash:,.0f}, "
-                f"Difference: ${diff:,.0f} ({diff_pct:.2f}%)"
-            )
-        else:
-            cashflow_report["checks"].append(
-                f"FY{year}: Cashflow balance check passed. "
-                f"OCF+ICF+FCF: ${cashflow_sum:,.0f}, ΔCash: ${delta_cash:,.0f}, "
-                f"Difference: ${diff:,.0f} ({diff_pct:.2f}%)"
-            )
+    Args:
+        df_financial: 标准化后的财务数据DataFrame
+        cik: CIK用于错误报告
     
-    return cashflow_report, df_cash_by_year
+    Returns:
+        (cashflow_report, df_cash_by_year)
+        df_cash_by_year: 每年的 ocf/icf/fcf/cash/capex（列是年份）
+    """
+    pivot = build_annual_pivot(df_financial)
+    df_results = _cashflow_results(pivot)
+    return quality_report_from_results(df_results, cik), _cash_by_year(pivot)
+
+
+def _cash_by_year(pivot):
+    """现金流相关指标按年份展开（行是指标、列是年份），只保留数据完整的年份"""
+    if len(pivot) == 0:
+        return pd.DataFrame()
+    df = pivot.reindex(columns=CASHFLOW_REQUIRED_METRICS)
+    df = df[df[["ocf", "icf", "fcf", "cash"]].notna().all(axis=1)]
+    return df.droplevel("cik").T if df.index.get_level_values("cik").nunique() == 1 else df.T
+
 
 def quality_check_financial_data(df_financial, cik):
     """
     执行基本的数据质量检查
     1%的threshold；
-    现金流计算还没完成,目前做的是按照1年的来，后面也可以改成按照一个季度的来算
+    现金流计算目前按年度来，后面也可以改成按照一个季度的来算
     Args:
         df_financial: 标准化后的财务数据DataFrame
         cik: CIK用于错误报告
-    其中这块会不会不太严谨，只选iloc[0]?
     
     Returns:
-        quality_report: 质量检查报告字典
+        quality_report: 质量检查报告字典，results 是结构化的检查结果表
     """
-    report = {
-        "cik": cik,
-        "checks": [],
-        "warnings": [],
-        "errors": [],
-    }
-    
-    # 检查1: Assets ≈ Liabilities + Equity
-    # 获取年度数据（fiscal_period == "FY"）
-    df_annual = df_financial[df_financial["fiscal_period"] == "FY"].copy()  #这块要确定是FY、fy还是fiscal_year（哦哦，不用了）
-    
-    for year in df_annual["fiscal_year"].unique():
-        year_data = df_annual[df_annual["fiscal_year"] == year]
-        
-        assets = year_data[year_data["metric"] == "assets"]["value"]  # dataframe of asset, liability, equity with their value
-        liabilities = year_data[year_data["metric"] == "liabilities"]["value"]
-        equity = year_data[year_data["metric"] == "equity"]["value"]
-        
-        if len(assets) > 0 and len(liabilities) > 0 and len(equity) > 0:  #这块会不会不太严谨，只选iloc[0]?
-            assets_val = assets.iloc[0]
-            liabilities_val = liabilities.iloc[0]
-            equity_val = equity.iloc[0]
-            balance = assets_val - (liabilities_val + equity_val)
-            balance_pct = abs(balance / assets_val * 100) if assets_val != 0 else 0
-            
-            if balance_pct > asset_quality_threshold:  # 超过1%偏差(在文件开头调整)
-                report["warnings"].append(
-                    f"FY{year}: Assets balance check failed. "
-                    f"Difference: ${balance:,.0f} ({balance_pct:.2f}%)"
-                )
-            else:
-                report["checks"].append(
-                    f"FY{year}: Assets balance check passed"
-                )
-    
-    # 检查2: OCF + ICF + FCF ≈ ΔCash
-    cashflow_report = check_cashflow_balance(df_financial, cik)
-    report["checks"].extend(cashflow_report["checks"])
-    report["warnings"].extend(cashflow_report["warnings"])
-    report["errors"].extend(cashflow_report["errors"])
-    
+    df_results = run_quality_checks(df_financial)
+    if "cik" not in df_financial.columns:
+        df_results["cik"] = cik
+    report = quality_report_from_results(df_results, cik)
+    report["results"] = df_results
     return report
 
-def get_financial_data_for_company(cik, years_back=5):
+def get_financial_data_for_company(cik, years_back=5, streaming=False, context=None):
     """
     完整的财务数据获取流程
     
     Args:
         cik: 10位CIK字符串
         years_back: 回溯年数
+        streaming: True时流式解析companyfacts（大公司省内存，多worker时有用）
+        context: company_context.CompanyContext；传了就用它共享的companyfacts（忽略streaming）
     
     Returns:
-        (df_financial, quality_report)
+        (df_financial, quality_report, cashflow_report, df_cash_by_year)
     """
+    if context is not None:
+        return process_company_facts(context.company_facts, cik, years_back)
+    if streaming:
+        # 1+2. 边下载边提取
+        df_financial = extract_financial_data_streaming(cik, years_back)
+        return check_financial_data(df_financial, cik)
+    
     # 1. 获取companyfacts
     company_facts = fetch_company_facts(cik)
     
-    # 2. 提取财务数据
-    df_financial = extract_financial_data(company_facts, years_back)
+    return process_company_facts(company_facts, cik, years_back)
+
+def process_company_facts(company_facts, cik, years_back=5):
+    """
+    companyfacts已经下载好之后的处理流程（提取 -> 标准化 -> 质量检查）
+    batch模式里下载和处理是分开调度的，所以单独拆出来
     
-    # 3. 标准化
-    df_standardized = standardize_financial_data(df_financial)
+    Returns:
+        (df_financial, quality_report, cashflow_report, df_cash_by_year)
+    """
+    # 2. 提取财务数据
+    with metrics.timer("extraction", cik) as t:
+        df_financial = extract_financial_data(company_facts, years_back)
+        t.rows = len(df_financial)
     
-    # 4. 质量检查
-    quality_report = quality_check_financial_data(df_standardized, cik)
+    return check_financial_data(df_financial, cik)
 
-    cashflow_report, df_cash_by_year = check_cashflow_balance(df_standardized,cik)
+def check_financial_data(df_financial, cik):
+    """
+    标准化 + 质量检查
+    
+    Returns:
+        (df_financial, quality_report, cashflow_report, df_cash_by_year)
+    """
+    with metrics.timer("quality_checks", cik) as t:
+        # 3. 标准化
+        df_standardized = standardize_financial_data(df_financial)
+        
+        # 4. 质量检查（透视一次，资产负债和现金流检查都用它）
+        pivot = build_annual_pivot(df_standardized)
+        df_results = run_quality_checks(df_standardized, pivot)
+        df_results["cik"] = cik
+        quality_report = quality_report_from_results(df_results, cik)
+        quality_report["results"] = df_results
+        
+        cashflow_report = quality_report_from_results(df_results[df_results["check"] == "cashflow"], cik)
+        df_cash_by_year = _cash_by_year(pivot)
+        t.rows = len(df_results)
     
     return df_standardized, quality_report, cashflow_report, df_cash_by_year
 
@@ -400,7 +624,7 @@ if __name__ == "__main__":
     #df_financial,_ = get_financial_data_for_company(cik_aapl, years_back=5)
     print(f"\nFinancial Data for CIK {cik_aapl}:")
     print(df_financial.head(20))
-    print(cashreport.head(10))
+    print(report["results"].head(10))
     print(each_yearcash.head(10))
     #df_financial.to_csv("df_financial.csv")
 
@@ -1,59 +1,248 @@
 import requests
 import json
 import pandas as pd
-from bs4 import BeautifulSoup
+import io
+import lxml.etree
+import lxml.html
+import multiprocessing
+import os
+import queue
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+import metrics
+from sec_client import sec_get, sec_stream
 from first_01 import get_sec_headers
-from task1_filings import get_filings_for_company
+from task1_filings import get_filings_for_company, check_context_years_back
+from task1_financial_data import FINANCIAL_METRICS
 #新建 task2_segment_geo.py - 抓取segment和geographic数据
 
 def fetch_10k_html(filing_url):
     """获取10-K HTML内容"""
-    resp = requests.get(filing_url, headers=get_sec_headers())
-    resp.raise_for_status()
-    return resp.text
+    with metrics.timer("html_fetch", metrics.cik_from_url(filing_url)) as t:
+        resp = sec_get(filing_url, headers=get_sec_headers())
+        resp.raise_for_status()
+        t.bytes = len(resp.content)
+        return resp.text
+
+# 查找Segment / Geographic表格用的关键词
+SEGMENT_KEYWORDS = [
+    "segment information",
+    "operating segments",
+    "reportable segments",
+]
+
+GEO_KEYWORDS = [
+    "geographic information",
+    "geographic revenue",
+    "revenue by geographic",
+    "revenue by region",
+]
+
+TABLE_KEYWORDS = {
+    "segment": SEGMENT_KEYWORDS,
+    "geographic": GEO_KEYWORDS,
+}
+
+# 可能是小标题的元素
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "p", "div"}
+
+def _own_string(el):
+    """
+    元素“自己的”文字：和BeautifulSoup的 .string 一样，
+    只有一个子元素时往下找，有多段内容时返回None
+    """
+    while True:
+        text = el.text or ""
+        if len(el) == 0:
+            return text
+        if len(el) == 1 and not text.strip() and not (el[0].tail or "").strip():
+            el = el[0]
+            continue
+        return None
+
+def _parse_html(html_content):
+    """用lxml解析HTML（str或bytes都可以），返回根节点；空文档返回None"""
+    if isinstance(html_content, str):
+        # 带 <?xml encoding=...?> 声明的str lxml不接受，统一转成bytes
+        html_content = html_content.encode("utf-8")
+    if not html_content.strip():
+        return None
+    parser = lxml.html.HTMLParser(encoding="utf-8", huge_tree=True)
+    try:
+        return lxml.html.document_fromstring(html_content, parser=parser)
+    except lxml.etree.ParserError:
+        return None
+
+class _TableMatcher:
+    """
+    按旧版 find_segment_table / find_geographic_table 的规则挑表格（BeautifulSoup版本的行为原样保留）：
+        1. 按关键词优先级，依次看文字包含该关键词的标题（h1-h6, p, div，按文档顺序），
+           取标题父元素里的第一个表格（parent.find("table")）
+        2. 都没有时，取文档里第一个文字包含任一关键词的表格
+    
+    元素按文档顺序喂进来：start() 在开始标签处记录顺序，end() 在结束标签处处理表格。
+    complete=True 表示树已经完整（locate_revenue_tables），标题在开始标签处就能判断；
+    complete=False 是边下载边解析（scan_10k_stream），标题要等结束标签、文字完整后再判断，
+    父元素里暂时还没有表格的标题，要等后面出现的第一个表格：在父元素里就是它，不在就说明父元素里没有
+    """
+
+    def __init__(self, complete):
+        self.complete = complete
+        self.order = {}  # 元素 -> 开始标签的序号（文档顺序）
+        self.hits = {kind: [] for kind in TABLE_KEYWORDS}  # [关键词序号, 标题序号, 关键词, 表格]
+        self.top_hits = {kind: 0 for kind in TABLE_KEYWORDS}  # 第一优先级关键词的标题数
+        self.waiting = []  # (hit, 标题父元素)：父元素里暂时还没有表格
+        self.open_headings = set()
+        self.ended = set()  # 已经读完的表格
+        self.fallback = {kind: None for kind in TABLE_KEYWORDS}  # (表格序号, 表格)
+        self.tables_scanned = 0
+
+    def start(self, el):
+        self.order[el] = len(self.order)
+        if el.tag == "table":
+            if self.waiting:
+                ancestors = set(el.iterancestors())
+                for hit, parent in self.waiting:
+                    # 标题之后的第一个表格：在父元素里就是要找的，不在说明父元素已经结束了
+                    hit[3] = el if parent in ancestors else None
+                self.waiting = []
+        elif self.complete:
+            self.heading(el)
+        else:
+            self.open_headings.add(el)
+
+    def end(self, el):
+        if el.tag == "table":
+            self.tables_scanned += 1
+            self.ended.add(el)
+            order = self.order[el]
+            table_text = None
+            for kind, keywords in TABLE_KEYWORDS.items():
+                found = self.fallback[kind]
+                if found is not None and found[0] < order:
+                    continue
+                if table_text is None:
+                    table_text = el.text_content().lower()
+                if any(keyword in table_text for keyword in keywords):
+                    self.fallback[kind] = (order, el)
+        elif not self.complete:
+            self.open_headings.discard(el)
+            self.heading(el)
+
+    def heading(self, el):
+        text = _own_string(el)
+        if not text:
+            return
+        text = text.lower()
+        parent = el.getparent()
+        table = None
+        for kind, keywords in TABLE_KEYWORDS.items():
+            for index, keyword in enumerate(keywords):
+                if keyword not in text:
+                    continue
+                if table is None and parent is not None:
+                    table = parent.find(".//table")
+                hit = [index, self.order[el], keyword, table]
+                if table is None and parent is not None and not self.complete:
+                    hit[3] = _PENDING
+                    self.waiting.append((hit, parent))
+                self.hits[kind].append(hit)
+                if index == 0:
+                    self.top_hits[kind] += 1
+
+    def _best_hit(self, kind, final=False):
+        """(是否已经确定, 最优的标题命中)；final=True 时还在等表格的标题按没找到算"""
+        best = None
+        for hit in sorted(self.hits[kind], key=lambda hit: (hit[0], hit[1])):
+            if hit[3] is _PENDING:
+                if final:
+                    continue
+                return False, best
+            if hit[3] is not None:
+                best = hit
+                break
+        if best is None or best[0] != 0:
+            return False, best  # 后面还可能出现优先级更高的关键词
+        if not self.complete:
+            if best[3] not in self.ended:
+                return False, best
+            # 还没结束的标题如果排在前面、文字又可能匹配（最多一个子元素），要等它
+            if any(self.order[el] < best[1] and len(el) < 2 for el in self.open_headings):
+                return False, best
+        return True, best
+
+    def done(self):
+        """两类表格都已经确定，后面的内容不会改变结果"""
+        if not all(self.top_hits.values()):
+            return False  # 只有第一优先级关键词的标题能提前确定
+        return all(self._best_hit(kind)[0] for kind in TABLE_KEYWORDS)
+
+    def result(self):
+        result = {}
+        for kind in TABLE_KEYWORDS:
+            _, best = self._best_hit(kind, final=True)
+            if best is not None:
+                result[kind] = (best[3], best[2])
+            elif self.fallback[kind] is not None:
+                result[kind] = (self.fallback[kind][1], f"{kind}_table")
+            else:
+                result[kind] = (None, None)
+        return result
+
+_PENDING = object()
+_MATCH_TAGS = ["table", *sorted(HEADING_TAGS)]
+
+def locate_revenue_tables(html_content):
+    """
+    一次解析、一次遍历，同时查找Segment和Geographic表格
+    
+    选表规则和旧版 find_segment_table / find_geographic_table 一样（见 _TableMatcher）：
+        先按关键词优先级找标题，取标题父元素里的第一个表格；找不到再取第一个文字包含关键词的表格
+    两类都确定后提前结束遍历
+    
+    Returns:
+        {
+            "segment": (table_element, section_name) 或 (None, None),
+            "geographic": (table_element, section_name) 或 (None, None),
+            "timing": {"bytes", "parse_seconds", "scan_seconds", "tables_scanned"},
+        }
+    """
+    t0 = time.perf_counter()
+    root = _parse_html(html_content)
+    t1 = time.perf_counter()
+    
+    matcher = _TableMatcher(complete=True)
+    if root is not None:
+        for event, el in lxml.etree.iterwalk(root, events=("start", "end"), tag=_MATCH_TAGS):
+            if event == "start":
+                matcher.start(el)
+            else:
+                matcher.end(el)
+                if matcher.done():
+                    break
+    
+    t2 = time.perf_counter()
+    result = matcher.result()
+    result["timing"] = {
+        "bytes": len(html_content),
+        "parse_seconds": t1 - t0,
+        "scan_seconds": t2 - t1,
+        "tables_scanned": matcher.tables_scanned,
+    }
+    return result
 
 def find_segment_table(html_content):
     """
     在10-K HTML中查找Segment Information表格
+    （只需要一类时用；两类都要的话直接用 locate_revenue_tables，只解析一次）
     
     Returns:
         (table_element, section_name) 或 (None, None)
     """
-    soup = BeautifulSoup(html_content, "html.parser")
-    
-    # 查找包含"Segment"关键词的section
-    segment_keywords = [
-        "segment information",
-        "operating segments",
-        "reportable segments",
-    ]
-    
-    # 方法1: 查找标题
-    for keyword in segment_keywords:
-        # 查找包含关键词的标题（h1-h6, p, div等）
-        headers = soup.find_all(
-            ["h1", "h2", "h3", "h4", "h5", "h6", "p", "div"],
-            string=re.compile(keyword, re.I)
-        )
-        
-        for header in headers:
-            # 在header附近查找table
-            parent = header.find_parent()
-            if parent:
-                table = parent.find("table")
-                if table:
-                    return table, keyword
-    
-    # 方法2: 直接查找包含"segment"的table
-    tables = soup.find_all("table")
-    for table in tables:
-        table_text = table.get_text().lower()
-        if any(keyword in table_text for keyword in segment_keywords):
-            return table, "segment_table"
-    
-    return None, None
+    return locate_revenue_tables(html_content)["segment"]
 
 def find_geographic_table(html_content):
     """
@@ -62,59 +251,68 @@ def find_geographic_table(html_content):
     Returns:
         (table_element, section_name) 或 (None, None)
     """
-    soup = BeautifulSoup(html_content, "html.parser")
-    
-    geo_keywords = [
-        "geographic information",
-        "geographic revenue",
-        "revenue by geographic",
-        "revenue by region",
-    ]
+    return locate_revenue_tables(html_content)["geographic"]
+
+def _table_rows(table):
+    if hasattr(table, "find_all"):  # BeautifulSoup元素
+        return table.find_all("tr")
+    return table.xpath(".//tr")
+
+def _row_cells(row):
+    if hasattr(row, "find_all"):
+        return row.find_all(["th", "td"])
+    return row.xpath(".//th|.//td")
+
+def _cell_text(cell, strip=False):
+    """和BeautifulSoup的 get_text(strip=...) 结果一致"""
+    if hasattr(cell, "get_text"):
+        return cell.get_text(strip=strip)
+    if strip:
+        return "".join(t.strip() for t in cell.itertext())
+    return cell.text_content()
+
+# 表格上方标题或表头里的单位说明，例如 "(in millions)"、"In thousands, except per share data"
+_TABLE_SCALE_RE = re.compile(r"\bin\s+(thousands|millions|billions)\b", re.I)
+TABLE_SCALES = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+
+def detect_table_scale(table, max_siblings=3):
+    """
+    表格数值的单位：先看表格自己的文字，再看前面几个兄弟元素（单位说明通常在表格上方）
     
-    # 方法1: 查找标题
-    for keyword in geo_keywords:
-        headers = soup.find_all(
-            ["h1", "h2", "h3", "h4", "h5", "h6", "p", "div"],
-            string=re.compile(keyword, re.I)
-        )
-        
-        for header in headers:
-            parent = header.find_parent()
-            if parent:
-                table = parent.find("table")
-                if table:
-                    return table, keyword
-    
-    # 方法2: 直接查找包含"geographic"的table
-    tables = soup.find_all("table")
-    for table in tables:
-        table_text = table.get_text().lower()
-        if any(keyword in table_text for keyword in geo_keywords):
-            return table, "geographic_table"
-    
-    return None, None
+    Returns:
+        乘数（1e3 / 1e6 / 1e9），数值乘以它是美元；找不到说明时返回None
+    """
+    if hasattr(table, "find_previous_siblings"):  # BeautifulSoup元素
+        siblings = table.find_previous_siblings(limit=max_siblings)
+    else:
+        siblings = list(table.itersiblings(lxml.etree.Element, preceding=True))[:max_siblings]
+    for el in [table, *siblings]:
+        m = _TABLE_SCALE_RE.search(_cell_text(el))
+        if m:
+            return TABLE_SCALES[m.group(1).lower()]
+    return None
 
 def parse_revenue_table(table, table_type="segment"):
     """
     解析revenue表格，提取逐年数据
     
     Args:
-        table: BeautifulSoup table元素
+        table: table元素（lxml或BeautifulSoup）
         table_type: "segment" 或 "geographic"
     
     Returns:
         DataFrame包含逐年revenue数据
     """
     # 提取所有行
-    rows = table.find_all("tr")
+    rows = _table_rows(table)
     if len(rows) < 2:
         return pd.DataFrame()
     
     # 尝试找到表头（包含年份）
     header_row = None
     for i, row in enumerate(rows[:5]):  # 检查前5行
-        cells = row.find_all(["th", "td"])
-        cell_texts = [cell.get_text(strip=True) for cell in cells]
+        cells = _row_cells(row)
+        cell_texts = [_cell_text(cell, strip=True) for cell in cells]
         # 检查是否包含年份（4位数字）
         if any(re.match(r"^\d{4}$", text) for text in cell_texts):
             header_row = i
@@ -124,12 +322,12 @@ def parse_revenue_table(table, table_type="segment"):
         return pd.DataFrame()
     
     # 提取年份列
-    header_cells = rows[header_row].find_all(["th", "td"])
+    header_cells = _row_cells(rows[header_row])
     years = []
     year_indices = []
     
     for idx, cell in enumerate(header_cells):
-        text = cell.get_text(strip=True)
+        text = _cell_text(cell, strip=True)
         if re.match(r"^\d{4}$", text):
             years.append(int(text))
             year_indices.append(idx)
@@ -140,12 +338,12 @@ def parse_revenue_table(table, table_type="segment"):
     # 提取数据行
     data_rows = []
     for row in rows[header_row + 1:]:
-        cells = row.find_all(["td", "th"])
+        cells = _row_cells(row)
         if len(cells) < max(year_indices) + 1:
             continue
         
         # 第一列通常是segment/region名称
-        name = cells[0].get_text(strip=True)
+        name = _cell_text(cells[0], strip=True)
         if not name or len(name) < 2:
             continue
         
@@ -153,11 +351,11 @@ def parse_revenue_table(table, table_type="segment"):
         row_data = {"name": name}
         for year, idx in zip(years, year_indices):
             if idx < len(cells):
-                value_text = cells[idx].get_text(strip=True)
+                value_text = _cell_text(cells[idx], strip=True)
                 # 清理数值（去除$、逗号等）
                 value_text = re.sub(r"[$,()]", "", value_text)
                 # 处理负数（括号表示）
-                if "(" in cells[idx].get_text() or value_text.startswith("-"):
+                if "(" in _cell_text(cells[idx]) or value_text.startswith("-"):
                     multiplier = -1
                 else:
                     multiplier = 1
@@ -179,84 +377,706 @@ def parse_revenue_table(table, table_type="segment"):
     df = pd.DataFrame(data_rows)
     return df
 
-def get_segment_geographic_data(cik, years_back=5):
+# ---------- Inline XBRL ----------
+# 2019年以后的10-K主文档都是inline XBRL：数字本身带着标签（ix:nonFraction），
+# context里写着维度（segment axis / geographic axis的member）和期间，scale写明了单位。
+# 直接流式读这些事实，比整棵DOM找表格、猜表头和单位既快又准；不是iXBRL的老文档再退回表格启发式
+IX_NS = "http://www.xbrl.org/2013/inlineXBRL"
+XBRLI_NS = "http://www.xbrl.org/2003/instance"
+XBRLDI_NS = "http://xbrl.org/2006/xbrldi"
+_IX_NON_FRACTION = f"{{{IX_NS}}}nonFraction"
+_XBRLI_CONTEXT = f"{{{XBRLI_NS}}}context"
+_XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+# 每类只认这一个维度，且context里只有这一个维度（多维交叉的是明细，不是分部合计）
+IXBRL_AXES = {
+    "segment": "us-gaap:StatementBusinessSegmentsAxis",
+    "geographic": "srt:StatementGeographicalAxis",
+}
+
+# 收入概念，按优先级（和companyfacts里revenue的候选标签一致）
+IXBRL_REVENUE_CONCEPTS = [f"us-gaap:{tag}" for tag in FINANCIAL_METRICS["revenue"]]
+
+# 年度期间的天数范围（10-K里也有季度数据，排除掉）
+ANNUAL_DAYS = (350, 380)
+
+_MEMBER_SUFFIX_RE = re.compile(r"(Segment)?Member$")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+def is_inline_xbrl(html_content):
+    """文档是否是inline XBRL（只看开头一段有没有ix命名空间）"""
+    head = html_content[:200000]
+    if isinstance(head, str):
+        return IX_NS in head
+    return IX_NS.encode() in head
+
+def _member_name(member):
+    """us-gaap/公司扩展的member QName -> 可读名称：aapl:GreaterChinaSegmentMember -> Greater China"""
+    local = member.split(":", 1)[-1]
+    local = _MEMBER_SUFFIX_RE.sub("", local) or local
+    return _CAMEL_RE.sub(" ", local)
+
+def _ix_number(text, fmt):
     """
-    获取公司的segment和geographic revenue数据
+    ix:nonFraction 的显示文字 -> 数值（还没乘scale）
+    ixt:fixed-zero / zerodash 之类显示成"—"的是0；comma-decimal格式小数点是逗号
+    """
+    fmt = (fmt or "").lower()
+    if "zero" in fmt or "dash" in fmt:
+        return 0.0
+    if "commadecimal" in fmt.replace("-", ""):
+        text = text.replace(".", "").replace(" ", "").replace(",", ".")
+    digits = re.sub(r"[^\d.]", "", text)
+    try:
+        return float(digits)
+    except ValueError:
+        return None  # 空的，或者是 "1.234.567" 这种和format对不上的
+
+def _local_name(tag):
+    """{ns}startDate（XML解析）/ xbrli:startdate（HTML解析器转小写、保留前缀） -> startdate"""
+    return tag.rsplit("}", 1)[-1].rsplit(":", 1)[-1].lower()
+
+def _ix_context(el):
+    """xbrli:context元素 -> {"dims": {axis: member}, "start": ..., "end": ...}（instant期间start是None）"""
+    dims = {}
+    dates = {}
+    for child in el.iter():
+        if not isinstance(child.tag, str):
+            continue
+        name = _local_name(child.tag)
+        if name == "explicitmember":
+            dims[child.get("dimension")] = (child.text or "").strip()
+        elif name in ("startdate", "enddate", "instant"):
+            dates[name] = (child.text or "").strip()
+    return {"dims": dims, "start": dates.get("startdate"), "end": dates.get("enddate") or dates.get("instant")}
+
+def _ix_fact(el):
+    """
+    ix:nonFraction元素 -> {"context", "unit", "value"（已乘scale、带符号）}
+    nil、读不出数字或者scale不是整数时返回None（只丢这一个事实）；HTML解析器会把属性名转成小写，两种都认
+    """
+    def attr(name):
+        value = el.get(name)
+        return el.get(name.lower()) if value is None else value
+    if el.get(_XSI_NIL) == "true" or el.get("xsi:nil") == "true":
+        return None
+    value = _ix_number("".join(el.itertext()), attr("format"))
+    if value is None:
+        return None
+    try:
+        value *= 10 ** int(attr("scale") or 0)
+    except ValueError:
+        return None
+    if attr("sign") == "-":
+        value = -value
+    return {"context": attr("contextRef"), "unit": attr("unitRef"), "value": value}
+
+def iter_ixbrl_facts(html_content, concepts=None):
+    """
+    流式读取inline XBRL文档里的数值事实和context
+    （iterparse只在这两种元素上回调，读完就清掉；不做HTML修复、不走整棵DOM找表格）
     
     Args:
-        cik: 10位CIK字符串
-        years_back: 回溯年数
+        html_content: 10-K主文档（str或bytes，必须是XHTML）
+        concepts: 只要这些概念（QName集合），None表示全部
+    
+    Yields:
+        ("context", id, {"dims": {axis: member}, "start": ..., "end": ...})
+        ("fact", name, {"context": ..., "unit": ..., "value": 已乘scale带符号的float})
+    
+    Raises:
+        lxml.etree.XMLSyntaxError: 文档不是合法XML（调用方退回HTML解析）
+    """
+    if isinstance(html_content, str):
+        html_content = html_content.encode("utf-8")
+    events = lxml.etree.iterparse(
+        io.BytesIO(html_content), events=("end",), tag=(_XBRLI_CONTEXT, _IX_NON_FRACTION),
+        huge_tree=True, recover=False, resolve_entities=False, no_network=True,
+    )
+    for _, el in events:
+        if el.tag == _XBRLI_CONTEXT:
+            yield "context", el.get("id"), _ix_context(el)
+            el.clear(keep_tail=True)
+            continue
+        
+        name = el.get("name")
+        if concepts is None or name in concepts:
+            fact = _ix_fact(el)
+            if fact is not None:
+                yield "fact", name, fact
+        # 嵌套在别的ix:nonFraction里的不能清（外层还没读完）
+        if el.getparent() is None or el.getparent().tag != _IX_NON_FRACTION:
+            el.clear(keep_tail=True)
+
+def ixbrl_revenue_frames(contexts, facts):
+    """
+    iXBRL收入事实 -> 分部/地区收入宽表
+    
+    每类（segment/geographic）：只看context里只有这一个维度、期间约一年的收入事实
+    （日期格式不对的context跳过），按 IXBRL_REVENUE_CONCEPTS 的优先级取第一个有数据的概念；
+    同一个事实在文档里出现多次（正文和附注各一次）只算一次
+    
+    Args:
+        contexts: {context_id: _ix_context 的结果}
+        facts: [(concept, _ix_fact 的结果), ...]
     
     Returns:
-        (df_segment, df_geographic, missing_reports)
+        {"segment": df或None, "geographic": df或None}
+        df 和 parse_revenue_table 一样是宽表（name, year_XXXX...），数值单位是美元（已乘scale），
+        多一列 member（原始member QName）、source_section（"ixbrl:<概念>"）和 scale（1.0）
     """
-    # 1. 获取所有10-K文件
-    df_filings = get_filings_for_company(cik, years_back)
-    df_10k = df_filings[df_filings["form"].isin(["10-K", "10-K/A"])].copy()
+    axis_kind = {axis: kind for kind, axis in IXBRL_AXES.items()}
+    rows = []
+    for concept, fact in facts:
+        context = contexts.get(fact["context"])
+        if context is None or len(context["dims"]) != 1 or not context["start"] or not context["end"]:
+            continue
+        (axis, member), = context["dims"].items()
+        if axis not in axis_kind:
+            continue
+        try:
+            days = (datetime.fromisoformat(context["end"]) - datetime.fromisoformat(context["start"])).days
+        except ValueError:
+            continue
+        if not ANNUAL_DAYS[0] <= days <= ANNUAL_DAYS[1]:
+            continue
+        rows.append((axis_kind[axis], concept, member, int(context["end"][:4]), fact["value"]))
+    
+    found = {kind: None for kind in IXBRL_AXES}
+    if rows:
+        df_facts = pd.DataFrame(rows, columns=["kind", "concept", "member", "year", "value"])
+        df_facts = df_facts.drop_duplicates(["kind", "concept", "member", "year"])
+        for kind, df_kind in df_facts.groupby("kind", sort=False):
+            present = set(df_kind["concept"])
+            concept = next(c for c in IXBRL_REVENUE_CONCEPTS if c in present)
+            df_kind = df_kind[df_kind["concept"] == concept]
+            df = df_kind.pivot(index="member", columns="year", values="value")
+            df = df[sorted(df.columns, reverse=True)]  # 和表格一样新年份在前
+            df.columns = [f"year_{year}" for year in df.columns]
+            # 保持文档里的出现顺序
+            df = df.loc[df_kind["member"].drop_duplicates()].reset_index()
+            df.insert(0, "name", df["member"].map(_member_name))
+            df["source_section"] = f"ixbrl:{concept}"
+            df["scale"] = 1.0
+            found[kind] = df
+    return found
+
+def extract_ixbrl_segment_geo(html_content):
+    """
+    从inline XBRL事实里直接取分部/地区收入（规则见 ixbrl_revenue_frames）
+    
+    Returns:
+        ({"segment": df或None, "geographic": df或None}, facts_scanned)
     
-    all_segment_data = []
-    all_geo_data = []
+    Raises:
+        lxml.etree.XMLSyntaxError: 文档不是合法XML
+    """
+    contexts = {}
+    facts = []
+    for kind, key, payload in iter_ixbrl_facts(html_content, set(IXBRL_REVENUE_CONCEPTS)):
+        if kind == "context":
+            contexts[key] = payload
+        else:
+            facts.append((key, payload))
+    return ixbrl_revenue_frames(contexts, facts), len(facts)
+
+def _segment_geo_result(ixbrl, locate, filing_date, filing_url, timing):
+    """
+    合并iXBRL和表格启发式的结果：iXBRL取到的类别直接用，没取到的再调用 locate() 找表格
+    
+    Args:
+        ixbrl: {"segment": df或None, "geographic": df或None}
+        locate: 返回 locate_revenue_tables 格式结果的函数（只在需要时调用）
+        timing: 已经累计的计时，会在里面加上表格部分
+    
+    Returns:
+        (df_segment, df_geo, missing_reports, timing)
+        两种来源的数值单位不同，都带 scale 列：数值乘以scale是美元（iXBRL是1.0，
+        表格按 detect_table_scale 识别，识别不到为None）
+    """
     missing_reports = []
+    found = {kind: None for kind in TABLE_KEYWORDS}
+    source = {}
+    for kind, df in ixbrl.items():
+        if df is not None:
+            df["filing_date"] = filing_date
+            df["filing_url"] = filing_url
+            found[kind] = df
+            source[kind] = "ixbrl"
     
-    for _, filing in df_10k.iterrows():
-        filing_url = filing["filing_url"]
-        filing_date = filing["filing_date"]
-        
-        try:
-            # 获取HTML
-            html_content = fetch_10k_html(filing_url)
-            
-            # 查找Segment表格
-            segment_table, segment_section = find_segment_table(html_content)
-            if segment_table:
-                df_segment = parse_revenue_table(segment_table, "segment")
-                if len(df_segment) > 0:
-                    df_segment["filing_date"] = filing_date
-                    df_segment["filing_url"] = filing_url
-                    df_segment["source_section"] = segment_section
-                    all_segment_data.append(df_segment)
+    t0 = time.perf_counter()
+    todo = [kind for kind in TABLE_KEYWORDS if found[kind] is None]
+    if todo:
+        located = locate()
+        for key in ("parse_seconds", "scan_seconds", "tables_scanned"):
+            timing[key] += located["timing"][key]
+        t0 = time.perf_counter()
+        for kind in todo:
+            table, section = located[kind]
+            df = None
+            if table is not None:
+                df = parse_revenue_table(table, kind)
+                if len(df) > 0:
+                    df["filing_date"] = filing_date
+                    df["filing_url"] = filing_url
+                    df["source_section"] = section
+                    df["scale"] = detect_table_scale(table)
+                    source[kind] = "table"
+                else:
+                    df = None
             else:
                 missing_reports.append({
                     "filing_date": filing_date,
-                    "type": "segment",
+                    "type": kind,
                     "url": filing_url,
                 })
+            found[kind] = df
+    
+    timing["table_parse_seconds"] = time.perf_counter() - t0
+    timing["source"] = source
+    return found["segment"], found["geographic"], missing_reports, timing
+
+def extract_segment_geo_from_html(html_content, filing_date, filing_url):
+    """
+    从一份10-K HTML中提取segment和geographic表格（只解析一次）
+    
+    inline XBRL文档直接读带标签的事实（extract_ixbrl_segment_geo）；
+    不是iXBRL、XML解析失败、或者iXBRL里没有对应维度的那一类，再用表格启发式找
+    
+    Returns:
+        (df_segment, df_geo, missing_reports, timing)
+        找不到或解析为空时对应的DataFrame为None；
+        timing见 locate_revenue_tables，多一项 source（每类用的是 "ixbrl" 还是 "table"）
+    """
+    timing = {"bytes": len(html_content), "parse_seconds": 0.0, "scan_seconds": 0.0,
+              "tables_scanned": 0, "ixbrl_facts": 0}
+    ixbrl = {}
+    if is_inline_xbrl(html_content):
+        t0 = time.perf_counter()
+        try:
+            ixbrl, timing["ixbrl_facts"] = extract_ixbrl_segment_geo(html_content)
+        except (lxml.etree.XMLSyntaxError, ValueError):
+            ixbrl = {}  # iXBRL读不了不影响表格启发式
+        timing["parse_seconds"] += time.perf_counter() - t0
+    return _segment_geo_result(ixbrl, lambda: locate_revenue_tables(html_content),
+                               filing_date, filing_url, timing)
+
+# ---------- 流式扫描 ----------
+# segment/geographic附注在Item 8的附注里，后面还有很多附注、附件、签名页。
+# 边下载边解析，两类表格都找到就不再往下读（关掉连接），大文档通常只需要读一部分
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 只对这些元素产生事件（td/tr/span之类占了元素的大多数，不用回调到Python）
+_STREAM_TAGS = ["table", *sorted(HEADING_TAGS), "xbrli:context", "ix:nonfraction"]
+
+class _StreamScanner:
+    """
+    HTMLPullParser的start/end事件增量处理：选表规则和 locate_revenue_tables 一样（_TableMatcher），
+    开始标签处记录文档顺序，标题和表格在结束标签处（文字完整后）判断；顺手收集读过的iXBRL context和收入事实
+    """
+
+    def __init__(self):
+        self.matcher = _TableMatcher(complete=False)
+        self.contexts = {}
+        self.facts = []
+        self._concepts = set(IXBRL_REVENUE_CONCEPTS)
+
+    def feed(self, events):
+        """处理一批事件；两类表格都已经确定时返回True（剩下的内容不用看了）"""
+        for event, el in events:
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue
+            if tag == "table" or tag in HEADING_TAGS:
+                if event == "start":
+                    self.matcher.start(el)
+                else:
+                    self.matcher.end(el)
+                    if self.matcher.done():
+                        return True
+            elif event != "end":
+                continue
+            elif tag == "xbrli:context":
+                self.contexts[el.get("id")] = _ix_context(el)
+                el.clear(keep_tail=True)
+            elif tag == "ix:nonfraction" and el.get("name") in self._concepts:
+                fact = _ix_fact(el)
+                if fact is not None:
+                    self.facts.append((el.get("name"), fact))
+        return False
+
+def scan_10k_stream(filing_url, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    边下载边解析10-K：响应体按块喂给 HTMLPullParser，选表规则和 locate_revenue_tables 一样，
+    两类表格都确定后不再往下读，直接关闭连接
+    
+    流式模式不用响应缓存（不查也不写）：提前停下时响应只读了一部分，写不进缓存，
+    如果查缓存，就只有碰巧读完过的文档能命中，重跑时哪些文档要重新下载取决于上次在哪里停下。
+    这里用省下的下载量换缓存——同一批10-K要反复处理时用非流式模式（整份下载、缓存）
+    
+    Args:
+        filing_url: 10-K主文档URL
+        chunk_size: 每次读多少字节
+    
+    Returns:
+        和 locate_revenue_tables 一样的dict，多一项 "ixbrl": (contexts, facts)（读过的部分里的）；
+        timing: bytes（实际读了多少字节，解压后）, parse_seconds（喂给解析器+打分，不含等网络的时间）,
+                scan_seconds（0，和解析合在一起）, tables_scanned, complete（是否读到了结尾）
+    """
+    scanner = _StreamScanner()
+    parser = lxml.etree.HTMLPullParser(events=("start", "end"), tag=_STREAM_TAGS, encoding="utf-8",
+                                       huge_tree=True)
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())  # 和 _parse_html 一样得到HtmlElement
+    bytes_read = 0
+    parse_seconds = 0.0
+    complete = False
+    with sec_stream(filing_url, headers=get_sec_headers(), use_cache=False) as stream:
+        while True:
+            chunk = stream.read(chunk_size)
+            t0 = time.perf_counter()
+            if not chunk:
+                complete = True
+                try:
+                    parser.close()
+                except lxml.etree.XMLSyntaxError:
+                    pass  # 空文档
+                scanner.feed(parser.read_events())
+                parse_seconds += time.perf_counter() - t0
+                break
+            bytes_read += len(chunk)
+            parser.feed(chunk)
+            stop = scanner.feed(parser.read_events())
+            parse_seconds += time.perf_counter() - t0
+            if stop:
+                break
+    
+    result = scanner.matcher.result()
+    result["ixbrl"] = (scanner.contexts, scanner.facts)
+    result["timing"] = {
+        "bytes": bytes_read,
+        "parse_seconds": parse_seconds,
+        "scan_seconds": 0.0,
+        "tables_scanned": scanner.matcher.tables_scanned,
+        "complete": complete,
+    }
+    return result
+
+def extract_segment_geo_stream(filing_url, filing_date):
+    """
+    流式版的 extract_segment_geo_from_html：下载和解析同时进行，找到两类表格就停
+    读过的部分里有iXBRL收入事实（分部/地区表格本身就是带标签的）时优先用事实
+    
+    Returns:
+        (df_segment, df_geo, missing_reports, timing)
+        timing["bytes"] 是实际读了的字节数，timing["complete"] 表示是否读完了整个文档
+    """
+    located = scan_10k_stream(filing_url)
+    timing = dict(located["timing"])
+    contexts, facts = located["ixbrl"]
+    timing["ixbrl_facts"] = len(facts)
+    ixbrl = ixbrl_revenue_frames(contexts, facts) if facts else {}
+    # 解析时间已经记在timing里了，补表格时不要再加一遍
+    tables = dict(located, timing={"parse_seconds": 0.0, "scan_seconds": 0.0, "tables_scanned": 0})
+    return _segment_geo_result(ixbrl, lambda: tables, filing_date, filing_url, timing)
+
+def _total_parse_seconds(timing):
+    """extract_segment_geo_* 返回的timing里的解析总时间"""
+    return timing["parse_seconds"] + timing["scan_seconds"] + timing["table_parse_seconds"]
+
+def record_parse_metrics(cik, result):
+    """
+    把一份10-K的解析时间记到 metrics 的 html_parse 阶段
+    （解析可能在进程池里跑，子进程里的计数传不回来，所以由拿到结果的一方按timing记）
+    """
+    df_segment, df_geo, _, timing = result
+    rows = sum(len(df) for df in (df_segment, df_geo) if df is not None)
+    metrics.record_stage("html_parse", _total_parse_seconds(timing), cik, rows=rows)
+
+def _list_10k_filings(cik, years_back, context=None):
+    """公司过去N年的10-K（含10-K/A），返回 [(filing_date, filing_url), ...]"""
+    if context is not None:
+        check_context_years_back(context, years_back)
+        return context.ten_k_filings()
+    df_filings = get_filings_for_company(cik, years_back)
+    if len(df_filings) == 0:
+        return []
+    df_10k = df_filings[df_filings["form"].isin(["10-K", "10-K/A"])]
+    return list(zip(df_10k["filing_date"], df_10k["filing_url"]))
+
+def _download_worker(task_queue, html_queue, years_back, stream=False):
+    """
+    下载阶段（线程）：从task_queue取任务，把下载好的HTML放进有界的html_queue
+    stream=True时边下载边解析（extract_segment_geo_stream），放进队列的是解析结果而不是HTML
+    
+    任务有两种：
+        ("company", cik[, context])：先取filings列表（有CompanyContext时用它的），再逐份下载该公司的10-K
+        ("filing", cik, filing_date, filing_url)：只下载一份
+    html_queue满了就会阻塞，解析跟不上时下载自动放慢，内存不会无限增长
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            html_queue.put(None)  # 告诉解析阶段这个线程结束了
+            return
+        if task[0] == "company":
+            cik = task[1]
+            try:
+                filings = _list_10k_filings(cik, years_back, task[2] if len(task) > 2 else None)
+            except Exception as e:
+                html_queue.put((cik, None, None, None, e))
+                continue
+        else:
+            cik = task[1]
+            filings = [(task[2], task[3])]
+        for filing_date, filing_url in filings:
+            try:
+                if stream:
+                    t0 = time.perf_counter()
+                    content = extract_segment_geo_stream(filing_url, filing_date)
+                    # 解析时间由 record_parse_metrics 记，剩下的是等网络的时间
+                    metrics.record_stage("html_fetch", time.perf_counter() - t0 - _total_parse_seconds(content[3]),
+                                         cik, nbytes=content[3]["bytes"])
+                else:
+                    content = fetch_10k_html(filing_url)
+                html_queue.put((cik, filing_date, filing_url, content, None))
+            except Exception as e:
+                html_queue.put((cik, filing_date, filing_url, None, e))
+
+def _parse_pool(parse_workers):
+    """
+    解析用的进程池。子进程是提交任务时才按需启动的，那时下载线程、限速器、指标线程都已经在跑，
+    直接fork会把别的线程持有的锁（日志、连接池、队列）原样带进子进程，可能卡死；
+    所以用forkserver启动（没有forkserver的平台用spawn）
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=parse_workers, mp_context=context)
+
+def run_segment_pipeline(tasks, years_back=5, parse_workers=None, download_workers=2, queue_size=None,
+                         stream=False):
+    """
+    下载和解析分成两个阶段同时进行：
+    下载线程 -> 有界队列 -> 进程池解析（CPU密集，绕开GIL）
+    下载前一份10-K的同时，之前下载好的在其他核上解析
+    
+    Args:
+        tasks: 下载任务列表，格式见 _download_worker
+        years_back: 回溯年数（"company" 任务用）
+        parse_workers: 解析进程数，默认CPU核数；0表示在当前进程里解析（不开进程池）
+        download_workers: 下载线程数（请求速率仍由 sec_client 的限速器控制）
+        queue_size: 下载队列长度，默认 parse_workers 的2倍
+        stream: 流式模式，下载线程边读边解析，找到两类表格就停止下载（不开进程池）
+    
+    Returns:
+        ({cik: (df_segment, df_geographic, missing_reports)}, stats)
+        stats["bytes"] 是实际读取的字节数；流式模式下 stats["stopped_early"] 是没读完就停下的份数
+    """
+    if stream:
+        parse_workers = 0
+    if parse_workers is None:
+        parse_workers = os.cpu_count() or 1
+    queue_size = queue_size or max(2, parse_workers * 2)
+    download_workers = max(1, min(download_workers, len(tasks)))
+    
+    collected = {}
+    stats = {"filings": 0, "bytes": 0, "parse_seconds": 0.0, "wall_seconds": 0.0, "stopped_early": 0}
+    start = time.perf_counter()
+    
+    def company(cik):
+        return collected.setdefault(cik, {"segment": [], "geo": [], "missing": []})
+    
+    def record_error(cik, filing_date, filing_url, error):
+        company(cik)["missing"].append({
+            "filing_date": filing_date,
+            "type": "error",
+            "url": filing_url,
+            "error": str(error),
+        })
+    
+    def record_result(cik, result):
+        df_segment, df_geo, missing, timing = result
+        entry = company(cik)
+        if df_segment is not None:
+            entry["segment"].append(df_segment)
+        if df_geo is not None:
+            entry["geo"].append(df_geo)
+        entry["missing"].extend(missing)
+        stats["filings"] += 1
+        stats["bytes"] += timing["bytes"]
+        stats["parse_seconds"] += _total_parse_seconds(timing)
+        record_parse_metrics(cik, result)
+        if not timing.get("complete", True):
+            stats["stopped_early"] += 1
+    
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+        company(task[1])
+    for _ in range(download_workers):
+        task_queue.put(None)
+    html_queue = queue.Queue(maxsize=queue_size)
+    # 进程池要在下载线程启动之前建好
+    executor = _parse_pool(parse_workers) if parse_workers > 0 else None
+    threads = [
+        threading.Thread(target=_download_worker, args=(task_queue, html_queue, years_back, stream), daemon=True)
+        for _ in range(download_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    
+    pending = {}  # future -> (cik, filing_date, filing_url)
+    
+    def collect(done):
+        for future in done:
+            cik, filing_date, filing_url = pending.pop(future)
+            try:
+                record_result(cik, future.result())
+            except Exception as e:
+                record_error(cik, filing_date, filing_url, e)
+    
+    try:
+        active_downloaders = download_workers
+        while active_downloaders or pending:
+            # 进程池里排队的任务太多时先等一部分解析完，避免HTML堆在内存里
+            if pending and (not active_downloaders or len(pending) >= queue_size):
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(done)
+                continue
             
-            # 查找Geographic表格
-            geo_table, geo_section = find_geographic_table(html_content)
-            if geo_table:
-                df_geo = parse_revenue_table(geo_table, "geographic")
-                if len(df_geo) > 0:
-                    df_geo["filing_date"] = filing_date
-                    df_geo["filing_url"] = filing_url
-                    df_geo["source_section"] = geo_section
-                    all_geo_data.append(df_geo)
+            item = html_queue.get()
+            if item is None:
+                active_downloaders -= 1
+                continue
+            cik, filing_date, filing_url, html_content, error = item
+            if error is not None:
+                record_error(cik, filing_date, filing_url, error)
+            elif stream:
+                record_result(cik, html_content)  # 下载线程已经解析好了
+            elif executor is None:
+                try:
+                    record_result(cik, extract_segment_geo_from_html(html_content, filing_date, filing_url))
+                except Exception as e:
+                    record_error(cik, filing_date, filing_url, e)
             else:
-                missing_reports.append({
-                    "filing_date": filing_date,
-                    "type": "geographic",
-                    "url": filing_url,
-                })
-        
-        except Exception as e:
-            missing_reports.append({
-                "filing_date": filing_date,
-                "type": "error",
-                "url": filing_url,
-                "error": str(e),
-            })
+                future = executor.submit(extract_segment_geo_from_html, html_content, filing_date, filing_url)
+                pending[future] = (cik, filing_date, filing_url)
+            
+            # 顺手收掉已经完成的
+            collect([future for future in list(pending) if future.done()])
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    results = {}
+    for cik, entry in collected.items():
+        # 合并所有数据
+        df_segment_final = pd.concat(entry["segment"], ignore_index=True) if entry["segment"] else pd.DataFrame()
+        df_geo_final = pd.concat(entry["geo"], ignore_index=True) if entry["geo"] else pd.DataFrame()
+        results[cik] = (df_segment_final, df_geo_final, entry["missing"])
+    
+    stats["wall_seconds"] = time.perf_counter() - start
+    return results, stats
+
+def get_segment_geographic_data(cik, years_back=5, parse_workers=0, download_workers=2, stream=False,
+                                context=None):
+    """
+    获取公司的segment和geographic revenue数据
+    
+    Args:
+        cik: 10位CIK字符串
+        years_back: 回溯年数
+        parse_workers: 解析进程数；默认0在当前进程解析（单个公司只有几份10-K，开进程池不划算）
+        download_workers: 同时下载10-K的线程数
+        stream: 边下载边解析，找到两类表格就不再往下读
+        context: company_context.CompanyContext；传了就用它的filings列表，不再请求submissions
+            （years_back 要和 context.years_back 一致，否则报ValueError）
     
-    # 合并所有数据
-    df_segment_final = pd.concat(all_segment_data, ignore_index=True) if all_segment_data else pd.DataFrame()
-    df_geo_final = pd.concat(all_geo_data, ignore_index=True) if all_geo_data else pd.DataFrame()
+    Returns:
+        (df_segment, df_geographic, missing_reports)
+    """
+    # 1. 获取所有10-K文件
+    tasks = [
+        ("filing", cik, filing_date, filing_url)
+        for filing_date, filing_url in _list_10k_filings(cik, years_back, context)
+    ]
+    if not tasks:
+        return pd.DataFrame(), pd.DataFrame(), []
     
-    return df_segment_final, df_geo_final, missing_reports
+    # 2. 下载 + 解析
+    results, _ = run_segment_pipeline(tasks, years_back, parse_workers, download_workers, stream=stream)
+    return results[cik]
+
+def get_segment_geographic_data_batch(ciks, years_back=5, parse_workers=None, download_workers=4, queue_size=None,
+                                      stream=False, contexts=None):
+    """
+    批量获取segment和geographic数据：下载线程按公司取任务，解析交给进程池，
+    吞吐量随CPU核数增长，直到碰到SEC的请求速率上限
+    
+    Args:
+        ciks: 10位CIK字符串列表
+        years_back: 回溯年数
+        parse_workers: 解析进程数，默认CPU核数
+        download_workers: 下载线程数
+        queue_size: 下载队列长度
+        stream: 流式模式（见 run_segment_pipeline）
+        contexts: {cik: CompanyContext}，有的公司直接用已经下载的filings列表
+    
+    Returns:
+        ({cik: (df_segment, df_geographic, missing_reports)}, stats)
+        stats: filings / bytes / parse_seconds（解析累计CPU时间）/ wall_seconds
+    """
+    contexts = contexts or {}
+    tasks = [("company", cik, contexts.get(cik)) for cik in ciks]
+    return run_segment_pipeline(tasks, years_back, parse_workers, download_workers, queue_size, stream)
+
+def _revenue_source(section):
+    """source_section -> 来源（"ixbrl" 或 "table"）"""
+    return "ixbrl" if str(section).startswith("ixbrl:") else "table"
+
+def _check_revenue_sums(df, df_annual_revenue, label, checks, warnings):
+    """
+    按 (filing_date, 来源) 分组，各年份的合计和total revenue比较（≤3%偏差）
+    
+    iXBRL和表格的数值单位不同，分开检查；按 scale 换算成美元后再比，不知道单位的表格不比较
+    """
+    df = df.copy()
+    df["_source"] = df["source_section"].map(_revenue_source) if "source_section" in df.columns else "table"
+    if "scale" not in df.columns:
+        df["scale"] = None
+    year_cols = [col for col in df.columns if col.startswith("year_")]
+    for (filing_date, source), group in df.groupby(["filing_date", "_source"], sort=False):
+        scale = pd.to_numeric(group["scale"], errors="coerce").dropna()
+        if len(scale) == 0:
+            warnings.append(f"{filing_date} ({source}): {label} table unit unknown, skipped")
+            continue
+        scale = scale.iloc[0]
+        for col in year_cols:
+            if group[col].isna().all():
+                continue
+            year = int(col.replace("year_", ""))
+            total = group[col].sum() * scale
+            
+            # 找到对应的total revenue
+            revenue_row = df_annual_revenue[df_annual_revenue["fiscal_year"] == year]
+            if len(revenue_row) > 0:
+                total_revenue = revenue_row["value"].iloc[0]
+                if total_revenue > 0:
+                    diff_pct = abs(total - total_revenue) / total_revenue * 100
+                    if diff_pct > 3:
+                        warnings.append(
+                            f"FY{year} ({source}): {label} sum differs from total revenue by {diff_pct:.2f}%"
+                        )
+                    else:
+                        checks.append(
+                            f"FY{year} ({source}): {label} validation passed ({diff_pct:.2f}% diff)"
+                        )
 
 def validate_segment_geo_data(df_segment, df_geo, df_financial):
     """
     验证segment和geographic数据质量
     
     检查：segment/geo sum必须接近total revenue（≤3%偏差）
+    iXBRL（美元）和表格（通常是百万或千）分开检查，按 scale 列换算单位
     """
     validation_report = {
         "segment_checks": [],
@@ -270,53 +1090,12 @@ def validate_segment_geo_data(df_segment, df_geo, df_financial):
         (df_financial["fiscal_period"] == "FY")
     ].copy()
     
-    # 验证segment数据
     if len(df_segment) > 0:
-        for filing_date in df_segment["filing_date"].unique():
-            segment_year = df_segment[df_segment["filing_date"] == filing_date]
-            # 计算各年份的segment sum
-            year_cols = [col for col in segment_year.columns if col.startswith("year_")]
-            for col in year_cols:
-                year = int(col.replace("year_", ""))
-                segment_sum = segment_year[col].sum()
-                
-                # 找到对应的total revenue
-                revenue_row = df_annual_revenue[df_annual_revenue["fiscal_year"] == year]
-                if len(revenue_row) > 0:
-                    total_revenue = revenue_row["value"].iloc[0]
-                    if total_revenue > 0:
-                        diff_pct = abs(segment_sum - total_revenue) / total_revenue * 100
-                        if diff_pct > 3:
-                            validation_report["warnings"].append(
-                                f"FY{year}: Segment sum differs from total revenue by {diff_pct:.2f}%"
-                            )
-                        else:
-                            validation_report["segment_checks"].append(
-                                f"FY{year}: Segment validation passed ({diff_pct:.2f}% diff)"
-                            )
-    
-    # 类似地验证geographic数据
+        _check_revenue_sums(df_segment, df_annual_revenue, "Segment",
+                            validation_report["segment_checks"], validation_report["warnings"])
     if len(df_geo) > 0:
-        for filing_date in df_geo["filing_date"].unique():
-            geo_year = df_geo[df_geo["filing_date"] == filing_date]
-            year_cols = [col for col in geo_year.columns if col.startswith("year_")]
-            for col in year_cols:
-                year = int(col.replace("year_", ""))
-                geo_sum = geo_year[col].sum()
-                
-                revenue_row = df_annual_revenue[df_annual_revenue["fiscal_year"] == year]
-                if len(revenue_row) > 0:
-                    total_revenue = revenue_row["value"].iloc[0]
-                    if total_revenue > 0:
-                        diff_pct = abs(geo_sum - total_revenue) / total_revenue * 100
-                        if diff_pct > 3:
-                            validation_report["warnings"].append(
-                                f"FY{year}: Geographic sum differs from total revenue by {diff_pct:.2f}%"
-                            )
-                        else:
-                            validation_report["geo_checks"].append(
-                                f"FY{year}: Geographic validation passed ({diff_pct:.2f}% diff)"
-                            )
+        _check_revenue_sums(df_geo, df_annual_revenue, "Geographic",
+                            validation_report["geo_checks"], validation_report["warnings"])
     
     return validation_report
 
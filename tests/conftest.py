@@ -0,0 +1,52 @@
+"""
+测试共用的fixture：本地SEC桩服务器（tests/sec_stub.py）+ 每个测试独立的工作目录
+
+sec_client 是进程级的全局状态（限速器、缓存、base URL、录制/回放），测试结束后恢复默认设置
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sec_client  # noqa: E402
+from sec_stub import StubHandler, start_server  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录里跑（.sec_cache、CSV等输出都写在这里）"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def sec_stub(workdir):
+    """
+    启动桩服务器，把 www.sec.gov / data.sec.gov 的请求都转到它上面
+
+    Returns:
+        桩服务器的base URL；StubHandler.inject / damage / requests 可以在测试里用
+    """
+    server, base = start_server()
+    StubHandler.inject = None
+    StubHandler.damage = None
+    StubHandler.requests = []
+    sec_client.set_base_url("https://www.sec.gov", base)
+    sec_client.set_base_url("https://data.sec.gov", base)
+    sec_client.configure_http(enabled=False)
+    sec_client.configure_rate_limit(1000, max_in_flight=16)
+    sec_client.configure_backoff(max_retries=5, base=0.01, max_delay=0.5)
+    sec_client.configure_concurrency()
+    yield base
+    server.shutdown()
+    server.server_close()
+    StubHandler.inject = None
+    StubHandler.damage = None
+    sec_client.reset_base_urls()
+    sec_client.configure_fixtures(None)
+    sec_client.configure_http()
+    sec_client.configure_rate_limit()
+    sec_client.configure_backoff()
+    sec_client.configure_concurrency()
@@ -0,0 +1,242 @@
+"""
+测试用的本地SEC桩服务器（http.server），接口路径和SEC一样，数据是合成的：
+    /files/company_tickers.json
+    /submissions/CIK##########.json
+    /api/xbrl/companyfacts/CIK##########.json
+    /api/xbrl/frames/us-gaap/{tag}/{unit}/{period}.json
+    /Archives/edgar/data/{cik}/{accession}/doc{year}{month}.htm
+
+支持ETag条件请求（304）和gzip；StubHandler.inject 可以注入429/503等响应，
+StubHandler.damage 可以让响应体只发一半就断开、或者发一段坏的gzip。
+record_and_replay() 把一个流程对着桩服务器录制一遍、再离线回放一遍
+"""
+import gzip
+import http.server
+import json
+import random
+import re
+import threading
+
+import sec_client
+from first_01 import TickerRegistry
+
+COMPANY_COUNT = 5
+YEARS = range(2016, 2026)
+
+FACT_TAGS = [
+    "Revenues", "OperatingIncomeLoss", "NetIncomeLoss", "EarningsPerShareBasic",
+    "Assets", "Liabilities", "StockholdersEquity",
+    "NetCashProvidedByUsedInOperatingActivities", "NetCashProvidedByUsedInInvestingActivities",
+    "NetCashProvidedByUsedInFinancingActivities", "PaymentsToAcquirePropertyPlantAndEquipment",
+    "CashAndCashEquivalentsAtCarryingValue",
+]
+
+
+def company_ciks():
+    return [1000 + i for i in range(COMPANY_COUNT)]
+
+
+def tickers():
+    return {str(i): {"cik_str": cik, "ticker": f"T{i}", "title": f"Company {i}"}
+            for i, cik in enumerate(company_ciks())}
+
+
+def submissions(cik):
+    forms, dates, accessions, documents = [], [], [], []
+    for year in reversed(YEARS):
+        for form, month in (("10-Q", 11), ("8-K", 9), ("10-Q", 8), ("10-Q", 5), ("10-K", 2)):
+            forms.append(form)
+            dates.append(f"{year}-{month:02d}-15")
+            accessions.append(f"{cik:010d}-{year % 100:02d}-{month:06d}")
+            documents.append(f"doc{year}{month:02d}.htm")
+    return {
+        "cik": str(cik),
+        "name": f"Company {cik}",
+        "filings": {
+            "recent": {"form": forms, "filingDate": dates, "accessionNumber": accessions,
+                       "primaryDocument": documents},
+            "files": [],
+        },
+    }
+
+
+def _fact_value(tag, cik, year):
+    rnd = random.Random(f"{tag}-{cik}-{year}")
+    if tag == "Assets":
+        return 300.0 * year
+    if tag == "Liabilities":
+        return 100.0 * year
+    if tag == "StockholdersEquity":
+        return 200.0 * year
+    if tag == "EarningsPerShareBasic":
+        return round(rnd.uniform(0.1, 10), 2)
+    return float(rnd.randint(1, 10 ** 6))
+
+
+def company_facts(cik):
+    us_gaap = {}
+    for tag in FACT_TAGS:
+        unit = "USD/shares" if tag.startswith("EarningsPerShare") else "USD"
+        records = []
+        for fy in YEARS:
+            for year in (fy, fy - 1):  # 10-K里同时有上一年的比较数
+                record = {
+                    "start": f"{year}-01-01", "end": f"{year}-12-31", "val": _fact_value(tag, cik, year),
+                    "accn": f"{cik:010d}-{(fy + 1) % 100:02d}-000002", "fy": fy, "fp": "FY", "form": "10-K",
+                    "filed": f"{fy + 1}-02-15",
+                }
+                if year == fy:
+                    record["frame"] = f"CY{year}"
+                records.append(record)
+            for quarter in (1, 2, 3):
+                records.append({
+                    "start": f"{fy}-01-01", "end": f"{fy}-{3 * quarter:02d}-30",
+                    "val": _fact_value(tag, cik, fy) / 4, "accn": f"{cik:010d}-{fy % 100:02d}-00000{quarter}",
+                    "fy": fy, "fp": f"Q{quarter}", "form": "10-Q", "filed": f"{fy}-{3 * quarter + 1:02d}-15",
+                })
+        us_gaap[tag] = {"label": tag, "description": tag, "units": {unit: records}}
+    return {"cik": cik, "entityName": f"Company {cik}", "facts": {"us-gaap": us_gaap}}
+
+
+def frame(tag, unit, period):
+    """frames API：只有 FACT_TAGS 里的标签有数据，其他返回None（404）"""
+    m = re.match(r"^CY(\d{4})(Q4I)?$", period)
+    if tag not in FACT_TAGS or not m:
+        return None
+    year = int(m.group(1))
+    instant = m.group(2) is not None
+    data = []
+    for cik in company_ciks():
+        row = {"accn": f"{cik:010d}-{(year + 1) % 100:02d}-000002", "cik": cik, "entityName": f"Company {cik}",
+               "loc": "US-CA", "end": f"{year}-12-31", "val": _fact_value(tag, cik, year)}
+        if not instant:
+            row["start"] = f"{year}-01-01"
+        data.append(row)
+    return {"taxonomy": "us-gaap", "tag": tag, "ccp": period, "uom": unit, "label": tag, "pts": len(data),
+            "data": data}
+
+
+def html_10k(cik, year):
+    padding = "<p>" + "lorem ipsum " * 200 + "</p>"
+    return f"""<html><body><h2>Item 1. Business</h2>{padding}
+<p>Segment Information</p><div><table>
+<tr><td></td><td>{year}</td><td>{year - 1}</td></tr>
+<tr><td>Americas</td><td>$100</td><td>90</td></tr>
+<tr><td>Europe</td><td>50</td><td>(40)</td></tr>
+</table></div>{padding}
+<div><p>Geographic Information (in millions)</p><table>
+<tr><td></td><td>{year}</td></tr>
+<tr><td>United States</td><td>120</td></tr>
+<tr><td>China</td><td>30</td></tr>
+</table></div>{padding}</body></html>"""
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    inject = None  # callable(path) -> (status, headers) 或 None（正常响应）
+    damage = None  # callable(path) -> "truncate" / "bad_gzip" 或 None（正常响应）
+    requests = []  # 收到的请求路径
+
+    def log_message(self, *args):
+        pass
+
+    def _empty(self, status, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        type(self).requests.append(self.path)
+        inject = type(self).inject
+        injected = inject(self.path) if inject is not None else None
+        if injected is not None:
+            self._empty(*injected)
+            return
+
+        body = self._body(self.path)
+        if body is None:
+            self._empty(404)
+            return
+        data = body.encode("utf-8")
+        etag = '"%08x"' % (hash(data) & 0xffffffff)
+        if self.headers.get("If-None-Match") == etag:
+            self._empty(304, {"ETag": etag})
+            return
+        gzipped = "gzip" in (self.headers.get("Accept-Encoding") or "")
+        if gzipped:
+            data = gzip.compress(data)
+        damage = type(self).damage
+        damage = damage(self.path) if damage is not None else None
+        if damage == "bad_gzip":
+            data, gzipped = b"not gzip at all", True
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.send_header("Content-Type", "text/html" if self.path.startswith("/Archives/") else "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if damage == "truncate":
+            # 按Content-Length说好的长度只发一半就断开
+            self.wfile.write(data[:len(data) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+    @staticmethod
+    def _body(path):
+        if path == "/files/company_tickers.json":
+            return json.dumps(tickers())
+        m = re.match(r"^/submissions/CIK(\d{10})\.json$", path)
+        if m:
+            return json.dumps(submissions(int(m.group(1))))
+        m = re.match(r"^/api/xbrl/companyfacts/CIK(\d{10})\.json$", path)
+        if m:
+            return json.dumps(company_facts(int(m.group(1))))
+        m = re.match(r"^/api/xbrl/frames/us-gaap/(\w+)/([\w-]+)/(\w+)\.json$", path)
+        if m:
+            data = frame(*m.groups())
+            return json.dumps(data) if data is not None else None
+        m = re.match(r"^/Archives/edgar/data/(\d+)/\d+/doc(\d{4})\d{2}\.htm$", path)
+        if m:
+            return html_10k(int(m.group(1)), int(m.group(2)))
+        return None
+
+
+def start_server():
+    """启动桩服务器，返回 (server, base_url)；用完调用 server.shutdown()"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def record_and_replay(corpus, run):
+    """
+    run() 录制一遍、回放一遍；回放不能再向服务器发请求、不能有找不到的响应
+
+    Returns:
+        (联网结果, 回放结果)
+    """
+    sec_client.configure_fixtures(str(corpus), mode="record")
+    try:
+        live = run()
+        sec_client.configure_fixtures(str(corpus), mode="replay")
+        requests_before = len(StubHandler.requests)
+        replayed = run()
+        report = sec_client.fixture_report()
+    finally:
+        sec_client.configure_fixtures(None)
+    assert len(StubHandler.requests) == requests_before
+    assert report["missing"] == 0
+    assert report["replayed"] > 0
+    return live, replayed
+
+
+def load_registry(workdir):
+    """force_refresh：不读本地ticker缓存，每次都经过 sec_get（录制/回放）"""
+    return TickerRegistry.load(cache_path=str(workdir / "company_tickers.json"), force_refresh=True)
@@ -0,0 +1,21 @@
+"""async_batch.run_batch：对着桩服务器录制一遍、离线回放一遍，结果要一样"""
+from async_batch import run_batch
+from sec_stub import load_registry, record_and_replay
+
+
+def test_run_batch_replay(sec_stub, workdir):
+    registry = load_registry(workdir)
+    df_companies = registry.to_frame().head(3)
+
+    def run():
+        results, failed, _ = run_batch(df_companies, years_back=5, rate=None, max_in_flight=4,
+                                       save_to_csv=False, include_segments=True)
+        return sorted(results, key=lambda r: r["cik"]), failed
+
+    (live_results, live_failed), (results, failed) = record_and_replay(workdir / "corpus", run)
+
+    assert len(live_results) == 3 and live_failed == []
+    assert [r["status"] for r in live_results] == ["success"] * 3
+    assert all(r["financial_records"] > 0 and r["filings_count"] > 0 for r in live_results)
+    assert results == live_results
+    assert failed == []
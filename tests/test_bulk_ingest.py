@@ -0,0 +1,58 @@
+"""bulk_ingest：用桩服务器的数据做一份小的 companyfacts.zip / submissions.zip，结果要和联网提取一样"""
+import json
+import zipfile
+
+import pytest
+
+from bulk_ingest import ingest_companyfacts_zip, ingest_submissions_zip
+from sec_stub import company_ciks, company_facts, submissions
+from task1_filings import get_filings_for_company
+from task1_financial_data import get_financial_data_for_company
+
+
+@pytest.fixture
+def bulk_zips(workdir):
+    ciks = company_ciks()[:3]
+    companyfacts_zip = workdir / "companyfacts.zip"
+    submissions_zip = workdir / "submissions.zip"
+    with zipfile.ZipFile(companyfacts_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        for cik in ciks:
+            zf.writestr(f"CIK{cik:010d}.json", json.dumps(company_facts(cik)))
+    with zipfile.ZipFile(submissions_zip, "w", zipfile.ZIP_DEFLATED) as zf:
+        for cik in ciks:
+            zf.writestr(f"CIK{cik:010d}.json", json.dumps(submissions(cik)))
+    return companyfacts_zip, submissions_zip, [f"{cik:010d}" for cik in ciks]
+
+
+def _fact_keys(df):
+    return sorted(df[["metric", "fiscal_year", "fiscal_period", "end_date", "value"]]
+                  .astype(str).itertuples(index=False, name=None))
+
+
+def test_bulk_ingest_matches_online(sec_stub, bulk_zips):
+    companyfacts_zip, submissions_zip, ciks = bulk_zips
+
+    df_financial, df_quality, failed = ingest_companyfacts_zip(str(companyfacts_zip), years_back=5, workers=0)
+    df_filings, failed_filings = ingest_submissions_zip(str(submissions_zip), years_back=5, workers=0)
+
+    assert failed == [] and failed_filings == []
+    assert sorted(df_financial["cik"].unique()) == ciks
+    assert len(df_quality) > 0
+    for cik in ciks:
+        online_financial = get_financial_data_for_company(cik, years_back=5)[0]
+        assert _fact_keys(df_financial[df_financial["cik"] == cik]) == _fact_keys(online_financial)
+        online_filings = get_filings_for_company(cik, years_back=5)
+        bulk_filings = df_filings[df_filings["cik"] == cik]
+        assert sorted(bulk_filings["accession_number"]) == sorted(online_filings["accession_number"])
+
+
+def test_bulk_ingest_reports_bad_members(workdir):
+    companyfacts_zip = workdir / "companyfacts.zip"
+    with zipfile.ZipFile(companyfacts_zip, "w") as zf:
+        zf.writestr("CIK0000001000.json", json.dumps(company_facts(1000)))
+        zf.writestr("CIK0000001001.json", "{not json")
+
+    df_financial, _, failed = ingest_companyfacts_zip(str(companyfacts_zip), years_back=5, workers=0)
+
+    assert set(df_financial["cik"]) == {"0000001000"}
+    assert [f["cik"] for f in failed] == ["0000001001"]
@@ -0,0 +1,40 @@
+"""company_context：一家公司的submissions只请求、只计时一次；years_back和context不一致时报错"""
+import pytest
+
+import metrics
+from company_context import CompanyContext
+from sec_stub import StubHandler
+from task1_filings import get_filings_for_company
+from task1_financial_data import get_financial_data_for_company
+from task2_segment_geo import get_segment_geographic_data
+
+CIK = "0000001000"
+
+
+def stage_count(stage):
+    return metrics.snapshot()["stages"].get(stage, {}).get("count", 0)
+
+
+def test_stages_share_one_submissions_fetch(sec_stub):
+    metrics.reset()
+    context = CompanyContext(CIK, years_back=5)
+
+    df_filings = get_filings_for_company(CIK, 5, context=context)
+    get_financial_data_for_company(CIK, 5, context=context)
+    get_segment_geographic_data(CIK, 5, context=context)
+
+    assert len(df_filings) > 0
+    submissions = [path for path in StubHandler.requests if path.startswith("/submissions/")]
+    assert submissions == [f"/submissions/CIK{CIK}.json"]
+    assert stage_count("submissions_fetch") == 1
+    assert stage_count("submissions_pages") == 1
+
+
+def test_years_back_must_match_context(sec_stub):
+    context = CompanyContext(CIK, years_back=5)
+
+    with pytest.raises(ValueError):
+        get_filings_for_company(CIK, 3, context=context)
+    with pytest.raises(ValueError):
+        get_segment_geographic_data(CIK, 10, context=context)
+    assert StubHandler.requests == []
@@ -0,0 +1,105 @@
+"""dataset_store：Parquet往返、按CIK分桶分区、按列/条件读取"""
+import os
+
+import pandas as pd
+import pytest
+
+from dataset_store import CIK_BUCKET_SIZE, DatasetWriter, load_financial, load_table
+
+
+def financial_rows(cik, years=(2022, 2023), metrics=("revenue", "assets")):
+    return pd.DataFrame([
+        {"metric": metric, "metric_name": metric.title(), "value": float(year * 10 + i), "unit": "USD",
+         "fiscal_year": year, "fiscal_period": "FY", "form": "10-K", "filed_date": f"{year + 1}-02-15",
+         "start_date": f"{year}-01-01" if metric == "revenue" else None, "end_date": f"{year}-12-31",
+         "frame": f"CY{year}", "Accession_Number": f"{cik}-{year}"}
+        for i, metric in enumerate(metrics) for year in years
+    ])
+
+
+def parquet_files(root, table):
+    found = []
+    for directory, _, files in os.walk(os.path.join(root, f"table={table}")):
+        found += [os.path.relpath(os.path.join(directory, f), root) for f in files]
+    return sorted(found)
+
+
+def test_financial_round_trip(tmp_path):
+    root = str(tmp_path / "ds")
+    df = financial_rows("0000000001")
+    with DatasetWriter(root) as writer:
+        writer.write("financial", df, cik="0000000001")
+
+    loaded = load_table("financial", root)
+
+    assert len(loaded) == len(df)
+    assert set(loaded["cik"]) == {"0000000001"}
+    assert str(loaded["metric"].dtype) == "category"
+    assert pd.api.types.is_datetime64_any_dtype(loaded["end_date"])
+    assert loaded["start_date"].isna().sum() == 2  # assets是时点指标，没有start
+    key = ["metric", "fiscal_year"]
+    expected = df.sort_values(key).reset_index(drop=True)
+    actual = loaded.assign(metric=loaded["metric"].astype(str)).sort_values(key).reset_index(drop=True)
+    assert list(actual["value"]) == list(expected["value"])
+    assert list(actual["Accession_Number"]) == list(expected["Accession_Number"])
+
+
+def test_partitioned_by_cik_bucket(tmp_path):
+    root = str(tmp_path / "ds")
+    low, high = "0000000001", f"{3 * CIK_BUCKET_SIZE + 5:010d}"
+    with DatasetWriter(root) as writer:
+        writer.write("financial", pd.concat([financial_rows(low).assign(cik=low),
+                                             financial_rows(high).assign(cik=high)]))
+
+    dirs = {os.path.dirname(path) for path in parquet_files(root, "financial")}
+    assert dirs == {os.path.join("table=financial", "cik_bucket=0"),
+                    os.path.join("table=financial", "cik_bucket=3")}
+    only_high = load_table("financial", root, ciks=[high])
+    assert set(only_high["cik"]) == {high}
+
+
+def test_flush_rows_controls_file_count(tmp_path):
+    root = str(tmp_path / "ds")
+    with DatasetWriter(root, flush_rows=4) as writer:
+        for i in range(5):
+            writer.write("financial", financial_rows(f"{i + 1:010d}"), cik=f"{i + 1:010d}")  # 每家4行
+        writer.flush()
+        assert len(parquet_files(root, "financial")) == 5  # 每次攒够4行就落一个文件
+
+    assert len(load_table("financial", root)) == 20
+
+
+def test_load_financial_filters_and_columns(tmp_path):
+    root = str(tmp_path / "ds")
+    with DatasetWriter(root) as writer:
+        writer.write("financial", financial_rows("0000000001"), cik="0000000001")
+        writer.write("financial", financial_rows("0000000002"), cik="0000000002")
+
+    df = load_financial(metrics="revenue", fiscal_years=[2023], columns=["cik", "value"], root=root)
+
+    assert list(df.columns) == ["cik", "value"]
+    assert sorted(df["cik"]) == ["0000000001", "0000000002"]
+    assert set(df["value"]) == {20230.0}
+
+
+def test_segment_table_is_stored_long(tmp_path):
+    root = str(tmp_path / "ds")
+    df_segment = pd.DataFrame({"name": ["Americas", "Europe"], "year_2023": [100.0, 50.0],
+                               "year_2022": [90.0, None], "filing_date": "2024-02-15",
+                               "filing_url": "u", "scale": 1e6})
+    with DatasetWriter(root) as writer:
+        writer.write("segment", df_segment, cik="0000000001")
+
+    loaded = load_table("segment", root).sort_values(["name", "fiscal_year"])
+
+    assert list(zip(loaded["name"], loaded["fiscal_year"], loaded["value"])) == [
+        ("Americas", 2022, 90.0), ("Americas", 2023, 100.0), ("Europe", 2023, 50.0)]
+    assert set(loaded["scale"]) == {1e6}
+
+
+def test_missing_table_and_unknown_table(tmp_path):
+    root = str(tmp_path / "ds")
+    assert len(load_table("quality", root)) == 0
+    with DatasetWriter(root) as writer:
+        with pytest.raises(ValueError):
+            writer.write("nope", financial_rows("0000000001"))
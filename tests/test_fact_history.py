@@ -0,0 +1,87 @@
+"""fact_history：重复事实收敛、重述历史、as-of查询"""
+import pandas as pd
+
+from fact_history import AsOfIndex, canonicalize_facts
+
+
+def fact(metric, value, end, filed, start=None, fy=None, fp="FY", form="10-K", cik=None):
+    row = {"metric": metric, "metric_name": metric.title(), "unit": "USD", "value": value,
+           "start_date": start, "end_date": end, "filed_date": filed, "Accession_Number": f"acc-{filed}",
+           "form": form, "fiscal_year": fy or int(filed[:4]), "fiscal_period": fp, "frame": None}
+    if cik is not None:
+        row["cik"] = cik
+    return row
+
+
+def revenue_2023():
+    return [
+        fact("revenue", 100.0, "2023-12-31", "2024-02-15", start="2023-01-01", fy=2023),
+        fact("revenue", 100.0, "2023-12-31", "2025-02-15", start="2023-01-01", fy=2024),  # 比较数，值没变
+        fact("revenue", 95.0, "2023-12-31", "2025-06-01", start="2023-01-01", fy=2024, form="10-K/A"),  # 重述
+        fact("revenue", 95.0, "2023-12-31", "2026-02-15", start="2023-01-01", fy=2025),
+    ]
+
+
+def test_history_keeps_original_and_restatements():
+    df_latest, df_history = canonicalize_facts(pd.DataFrame(revenue_2023()))
+
+    assert list(df_history["value"]) == [100.0, 95.0]
+    assert list(df_history["filed_date"]) == ["2024-02-15", "2025-06-01"]
+    assert df_history["known_until"].iloc[0] == "2025-06-01"
+    assert pd.isna(df_history["known_until"].iloc[1])  # 最新的值，还没被取代
+    assert list(df_history["revision"]) == [0, 1]
+    assert list(df_history["fiscal_year"]) == [2023, 2023]  # 取第一次报告时的fy
+
+    assert len(df_latest) == 1
+    latest = df_latest.iloc[0]
+    assert latest["value"] == 95.0
+    assert latest["revisions"] == 1
+    assert latest["first_filed_date"] == "2024-02-15"
+    assert latest["form"] == "10-K/A"
+
+
+def test_quarter_and_ytd_are_different_facts():
+    rows = [fact("revenue", 30.0, "2024-06-30", "2024-08-01", start="2024-04-01", fp="Q2", form="10-Q"),
+            fact("revenue", 55.0, "2024-06-30", "2024-08-01", start="2024-01-01", fp="Q2", form="10-Q")]
+
+    df_latest, df_history = canonicalize_facts(pd.DataFrame(rows))
+
+    assert len(df_latest) == 2 and len(df_history) == 2
+
+
+def test_as_of_value_follows_restatement():
+    _, df_history = canonicalize_facts(pd.DataFrame(revenue_2023()))
+    index = AsOfIndex(df_history)
+
+    def value(as_of):
+        return index.value("revenue", "2023-12-31", as_of=as_of, start_date="2023-01-01")
+
+    assert value("2024-02-14") is None  # 还没报告
+    assert value("2024-02-15") == 100.0
+    assert value("2025-05-31") == 100.0
+    assert value("2025-06-01") == 95.0
+    assert index.value("revenue", "2022-12-31", as_of="2026-01-01", start_date="2022-01-01") is None
+
+
+def test_as_of_snapshot_across_companies():
+    rows = [fact("assets", 300.0, "2023-12-31", "2024-02-15", cik="A"),
+            fact("assets", 310.0, "2023-12-31", "2024-09-01", form="10-K/A", cik="A"),
+            fact("assets", 500.0, "2023-12-31", "2024-03-01", cik="B"),
+            fact("revenue", 100.0, "2023-12-31", "2024-02-15", start="2023-01-01", cik="A")]
+    _, df_history = canonicalize_facts(pd.DataFrame(rows))
+    index = AsOfIndex(df_history)
+
+    snapshot = index.as_of("2024-03-01", metric="assets")
+
+    assert dict(zip(snapshot["cik"], snapshot["value"])) == {"A": 300.0, "B": 500.0}
+    assert list(index.as_of("2024-02-20", metric="assets")["cik"]) == ["A"]  # B 还没报告
+    assert index.value("assets", "2023-12-31", as_of="2025-01-01", cik="A") == 310.0
+    assert index.value("assets", "2023-12-31", as_of="2025-01-01", cik="C") is None
+    assert len(index) == 3
+
+
+def test_empty_input():
+    df_latest, df_history = canonicalize_facts(pd.DataFrame(columns=list(fact("x", 0, "2024-01-01", "2024-01-01"))))
+
+    assert len(df_latest) == 0 and len(df_history) == 0
+    assert len(AsOfIndex(df_history).as_of("2024-01-01")) == 0
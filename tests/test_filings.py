@@ -0,0 +1,83 @@
+"""task1_filings：submissions分页的选择、拼接和筛选（回溯期超过 filings.recent 时）"""
+from datetime import date
+
+from task1_filings import (fetch_submission_pages, filings_from_submissions, merge_submission_columns,
+                           submission_pages_needed)
+
+THIS_YEAR = date.today().year
+
+
+def block(*filings):
+    """[(form, filing_date), ...] -> 和 filings.recent 一样的列式dict"""
+    return {
+        "form": [form for form, _ in filings],
+        "filingDate": [filed for _, filed in filings],
+        "accessionNumber": [f"0000000001-{filed[2:4]}-{i:06d}" for i, (_, filed) in enumerate(filings)],
+        "primaryDocument": [f"doc{i}.htm" for i in range(len(filings))],
+    }
+
+
+def submissions(recent, pages):
+    """pages: {文件名: (filingFrom, filingTo)}"""
+    files = [{"name": name, "filingFrom": start, "filingTo": end} for name, (start, end) in pages.items()]
+    return {"cik": "1", "filings": {"recent": recent, "files": files}}
+
+
+PAGES = {
+    "CIK0000000001-submissions-001.json": (f"{THIS_YEAR - 4}-01-01", f"{THIS_YEAR - 2}-12-31"),
+    "CIK0000000001-submissions-002.json": (f"{THIS_YEAR - 9}-01-01", f"{THIS_YEAR - 6}-12-31"),
+    "CIK0000000001-submissions-003.json": (f"{THIS_YEAR - 20}-01-01", f"{THIS_YEAR - 12}-12-31"),
+}
+
+
+def test_only_pages_overlapping_the_look_back_are_needed():
+    data = submissions(block(), PAGES)
+
+    assert submission_pages_needed(data, years_back=1) == []
+    assert submission_pages_needed(data, years_back=5) == ["CIK0000000001-submissions-001.json"]
+    assert submission_pages_needed(data, years_back=10) == ["CIK0000000001-submissions-001.json",
+                                                             "CIK0000000001-submissions-002.json"]
+
+
+def test_page_without_filing_to_is_kept():
+    data = submissions(block(), {"CIK0000000001-submissions-001.json": (None, None)})
+
+    assert submission_pages_needed(data, years_back=1) == ["CIK0000000001-submissions-001.json"]
+
+
+def test_pages_are_loaded_in_files_order():
+    data = submissions(block(), PAGES)
+    loaded = []
+
+    def load_page(name):
+        loaded.append(name)
+        return {"name": name}
+
+    pages = fetch_submission_pages(data, years_back=30, max_workers=3, load_page=load_page)
+
+    assert [page["name"] for page in pages] == list(PAGES)
+    assert sorted(loaded) == sorted(PAGES)
+
+
+def test_merge_fills_columns_missing_from_a_page():
+    recent = block(("10-K", f"{THIS_YEAR}-02-01"))
+    page = block(("10-Q", f"{THIS_YEAR - 3}-05-01"), ("10-K", f"{THIS_YEAR - 3}-02-01"))
+    del page["primaryDocument"]
+
+    merged = merge_submission_columns({"filings": {"recent": recent}}, [page])
+
+    assert merged["form"] == ["10-K", "10-Q", "10-K"]
+    assert merged["primaryDocument"] == ["doc0.htm", None, None]
+
+
+def test_filings_include_paged_history_within_the_look_back():
+    recent = block(("10-Q", f"{THIS_YEAR}-05-01"), ("8-K", f"{THIS_YEAR}-03-01"))
+    page = block(("10-K", f"{THIS_YEAR - 3}-02-01"), ("10-K", f"{THIS_YEAR - 7}-02-01"))
+    data = submissions(recent, {"CIK0000000001-submissions-001.json": (f"{THIS_YEAR - 7}-01-01",
+                                                                       f"{THIS_YEAR - 3}-12-31")})
+
+    df = filings_from_submissions(data, "0000000001", years_back=5, pages=[page])
+
+    assert list(zip(df["form"], df["filing_date"])) == [("10-Q", f"{THIS_YEAR}-05-01"),
+                                                        ("10-K", f"{THIS_YEAR - 3}-02-01")]
+    assert df["filing_url"].str.contains("/Archives/edgar/data/").all()
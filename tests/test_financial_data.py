@@ -0,0 +1,58 @@
+"""task1_financial_data 的事实提取：单位选择、候选标签之间的取舍"""
+from datetime import date
+
+from task1_financial_data import build_fact_frame
+
+FILED = date.today().replace(day=1).isoformat()
+
+
+def fact(value, end, start=None, fp="FY", form="10-K"):
+    record = {"val": value, "end": end, "fy": int(end[:4]), "fp": fp, "form": form, "filed": FILED,
+              "accn": "0000000001-00-000001"}
+    if start is not None:
+        record["start"] = start
+    return record
+
+
+def test_usd_preferred_within_a_tag():
+    df = build_fact_frame([
+        ("revenue", "Revenues", {"EUR": [fact(90.0, "2024-12-31", "2024-01-01")],
+                                 "USD": [fact(100.0, "2024-12-31", "2024-01-01")]}),
+    ])
+
+    assert list(df["unit"]) == ["USD"]
+    assert list(df["value"]) == [100.0]
+
+
+def test_tag_priority_beats_unit_of_a_lower_priority_tag():
+    # Revenues 只报了EUR，排在后面的 SalesRevenueNet 有USD：按标签优先级取 Revenues
+    df = build_fact_frame([
+        ("revenue", "Revenues", {"EUR": [fact(90.0, "2024-12-31", "2024-01-01")]}),
+        ("revenue", "SalesRevenueNet", {"USD": [fact(100.0, "2024-12-31", "2024-01-01")]}),
+    ])
+
+    assert list(df["metric_name"]) == ["Revenues"]
+    assert list(df["unit"]) == ["EUR"]
+
+
+def test_lower_priority_tag_fills_missing_periods():
+    df = build_fact_frame([
+        ("revenue", "Revenues", {"USD": [fact(100.0, "2024-12-31", "2024-01-01")]}),
+        ("revenue", "SalesRevenueNet", {"USD": [fact(99.0, "2024-12-31", "2024-01-01"),
+                                                fact(80.0, "2023-12-31", "2023-01-01")]}),
+    ])
+
+    by_end = dict(zip(df["end_date"], df["metric_name"]))
+    assert by_end == {"2024-12-31": "Revenues", "2023-12-31": "SalesRevenueNet"}
+
+
+def test_quarter_and_year_to_date_with_same_end_date_are_separate_periods():
+    # 同一份10-Q里截止日相同的单季度数和年初至今累计数，分别来自两个标签，都要保留
+    df = build_fact_frame([
+        ("revenue", "Revenues", {"USD": [fact(30.0, "2024-06-30", "2024-04-01", fp="Q2", form="10-Q")]}),
+        ("revenue", "SalesRevenueNet", {"USD": [fact(55.0, "2024-06-30", "2024-01-01", fp="Q2", form="10-Q"),
+                                                fact(29.0, "2024-06-30", "2024-04-01", fp="Q2", form="10-Q")]}),
+    ])
+
+    by_start = {start: (name, value) for start, name, value in zip(df["start_date"], df["metric_name"], df["value"])}
+    assert by_start == {"2024-04-01": ("Revenues", 30.0), "2024-01-01": ("SalesRevenueNet", 55.0)}
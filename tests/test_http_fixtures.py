@@ -0,0 +1,62 @@
+"""
+http_fixtures 的录制/回放：流程入口先对着桩服务器联网跑并录制，再离线回放，
+回放不能再向服务器发请求、不能有找不到的响应，结果要和联网时完全一样
+"""
+import pandas as pd
+
+from benchmark import record_corpus, run_benchmark
+from main import process_company
+from sec_stub import StubHandler, load_registry, record_and_replay
+from task2_segment_geo import get_segment_geographic_data
+
+CIK = "0000001000"
+
+
+def normalized(df):
+    """下载线程完成的先后不固定，行和年份列的顺序不作比较"""
+    df = df[sorted(df.columns)]
+    return df.sort_values(["filing_date", "name"]).reset_index(drop=True)
+
+
+def test_process_company_replay(sec_stub, workdir):
+    def run():
+        return process_company("T0", years_back=5, save_to_csv=False, registry=load_registry(workdir))
+
+    live, replayed = record_and_replay(workdir / "corpus", run)
+
+    assert len(live["financial"]) > 0
+    assert len(live["filings"]) > 0
+    pd.testing.assert_frame_equal(replayed["financial"], live["financial"])
+    pd.testing.assert_frame_equal(replayed["filings"], live["filings"])
+
+
+def test_segment_geographic_replay(sec_stub, workdir):
+    def run():
+        return get_segment_geographic_data(CIK, years_back=5, parse_workers=0)
+
+    (live_segment, live_geo, live_missing), (segment, geo, missing) = record_and_replay(workdir / "corpus", run)
+
+    assert len(live_segment) > 0 and len(live_geo) > 0
+    pd.testing.assert_frame_equal(normalized(segment), normalized(live_segment))
+    pd.testing.assert_frame_equal(normalized(geo), normalized(live_geo))
+    assert sorted(map(str, missing)) == sorted(map(str, live_missing))
+    # 地区表格上方写着 "(in millions)"，分部表格没有单位说明
+    assert set(geo["scale"]) == {1e6}
+    assert segment["scale"].isna().all()
+
+
+def test_benchmark_replay(sec_stub, workdir):
+    corpus = workdir / "bench_corpus"
+    manifest = record_corpus(str(corpus), ["T0", "T1"], years_back=5, include_segments=True)
+    requests_before = len(StubHandler.requests)
+
+    result = run_benchmark(str(corpus), repeat=2)
+
+    assert len(StubHandler.requests) == requests_before
+    assert manifest["responses"] > 0
+    assert result["fixtures_missing"] == 0
+    stages = result["stages"]
+    assert stages["process_company"]["items"] == 2
+    assert stages["segment_geo"]["items"] == 2
+    assert stages["process_company"]["fact_rows"] > 0
+    assert stages["segment_geo"]["geo_rows"] > 0
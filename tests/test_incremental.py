@@ -0,0 +1,116 @@
+"""incremental：EDGAR每日索引解析、按台账找出有新filing的公司"""
+import pandas as pd
+
+from incremental import find_changed_companies, latest_filings_from_index, parse_form_index
+from job_ledger import JobLedger
+
+FORM_IDX = """Description:           Daily Index of EDGAR Dissemination Feed by Form Type
+Last Data Received:    November 1, 2024
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+Form Type   Company Name                                                  CIK         Date Filed  File Name
+---------------------------------------------------------------------------------------------------------------------------------------------
+10-K        APPLE INC                                                     320193      20241101    edgar/data/320193/0000320193-24-000123.txt
+10-Q/A      SOME CO  INC                                                  1000        20241101    edgar/data/1000/0000001000-24-000007.txt
+SC 13G      BIG HOLDER LP                                                 2000        20241101    edgar/data/2000/0000002000-24-000001.txt
+"""
+
+MASTER_IDX = """Description:           Daily Index of EDGAR Dissemination Feed
+Last Data Received:    November 4, 2024
+
+CIK|Company Name|Form Type|Date Filed|File Name
+--------------------------------------------------------------------------------
+320193|APPLE INC|8-K|20241104|edgar/data/320193/0000320193-24-000130.txt
+320193|APPLE INC|10-Q|20241104|edgar/data/320193/0000320193-24-000131.txt
+3000|OTHER CO|10-K|2024-11-04|edgar/data/3000/0000003000-24-000002.txt
+"""
+
+
+def write(path, text):
+    path.write_text(text, encoding="latin-1")
+    return str(path)
+
+
+def test_parse_form_index(tmp_path):
+    df = parse_form_index(write(tmp_path / "form.20241101.idx", FORM_IDX))
+
+    assert df.to_dict("records") == [
+        {"cik": "0000320193", "form": "10-K", "filing_date": "2024-11-01",
+         "accession_number": "0000320193-24-000123"},
+        {"cik": "0000001000", "form": "10-Q/A", "filing_date": "2024-11-01",
+         "accession_number": "0000001000-24-000007"},
+    ]
+
+
+def test_parse_master_index(tmp_path):
+    df = parse_form_index(write(tmp_path / "master.20241104.idx", MASTER_IDX))
+
+    assert list(df["form"]) == ["10-Q", "10-K"]
+    assert list(df["cik"]) == ["0000320193", "0000003000"]
+    assert list(df["filing_date"]) == ["2024-11-04", "2024-11-04"]
+
+
+def test_latest_filing_per_cik_across_index_files(tmp_path):
+    paths = [write(tmp_path / "form.20241101.idx", FORM_IDX), write(tmp_path / "master.20241104.idx", MASTER_IDX)]
+
+    df = latest_filings_from_index(paths).set_index("cik")
+
+    assert df.loc["0000320193", "accession_number"] == "0000320193-24-000131"
+    assert len(df) == 3
+
+
+def companies(*ciks):
+    return pd.DataFrame({"ticker": [f"T{c}" for c in ciks], "cik": [f"{c:010d}" for c in ciks],
+                         "company_name": [f"Company {c}" for c in ciks]})
+
+
+def ledger_with(tmp_path, done):
+    """done: {cik: (last_accession, last_filing_date)}，都登记成成功"""
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    for cik, (accession, filing_date) in done.items():
+        ledger.start(f"{cik:010d}", f"T{cik}", f"Company {cik}")
+        filings = None
+        if accession is not None:
+            filings = pd.DataFrame({"filing_date": [filing_date], "accession_number": [accession]})
+        ledger.finish(f"{cik:010d}", 1, filings)
+    return ledger
+
+
+def test_changed_companies_from_index(tmp_path):
+    index = write(tmp_path / "form.20241101.idx", FORM_IDX)
+    ledger = ledger_with(tmp_path, {
+        320193: ("0000320193-24-000001", "2024-08-01"),  # 有新10-K
+        1000: ("0000001000-24-000007", "2024-11-01"),  # 索引里就是上次那份
+        4000: (None, None),  # 成功过，但窗口里没有10-K/10-Q，索引里也没有
+    })
+    ledger.start("0000005000", "T5000", "Company 5000")
+    ledger.fail("0000005000", "boom")
+
+    df_changed, filings_by_cik = find_changed_companies(companies(320193, 1000, 4000, 5000, 6000), ledger, index)
+
+    assert sorted(df_changed["cik"]) == ["0000005000", "0000006000", "0000320193"]
+    assert filings_by_cik == {}
+
+
+def test_changed_companies_from_submissions(sec_stub, tmp_path):
+    # 桩服务器上每家公司最新的一份是 2025-11-15 的10-Q
+    ledger = ledger_with(tmp_path, {
+        1000: ("0000001000-25-000011", "2025-11-15"),
+        1001: ("0000001001-25-000008", "2025-08-15"),
+        1002: (None, None),
+    })
+
+    df_changed, filings_by_cik = find_changed_companies(companies(1000, 1001, 1002, 1003), ledger, max_in_flight=4)
+
+    assert sorted(df_changed["cik"]) == ["0000001001", "0000001002", "0000001003"]
+    assert sorted(filings_by_cik) == ["0000001000", "0000001001", "0000001002"]  # 没做过的公司不用查
+    assert df_changed.set_index("cik").loc["0000001001", "last_filing_date"] == "2025-08-15"
+
+
+def test_done_company_without_filings_is_not_reprocessed(sec_stub, tmp_path):
+    ledger = ledger_with(tmp_path, {1000: (None, None)})
+
+    df_changed, _ = find_changed_companies(companies(1000), ledger, years_back=0)  # 窗口里没有filing
+
+    assert len(df_changed) == 0
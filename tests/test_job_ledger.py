@@ -0,0 +1,82 @@
+"""job_ledger：断点续跑、失败重试、finish_job 等数据集落盘后再登记成功"""
+import pandas as pd
+
+from dataset_store import DatasetWriter, load_table
+from job_ledger import JobLedger, finish_job
+
+COMPANIES = pd.DataFrame({
+    "ticker": ["A", "B", "C", "C2"],
+    "cik": ["0000000001", "0000000002", "0000000003", "0000000003"],
+    "company_name": ["A Inc", "B Inc", "C Inc", "C Inc"],
+})
+
+
+def filings(*dates):
+    return pd.DataFrame({"filing_date": list(dates), "accession_number": [f"acc-{d}" for d in dates]})
+
+
+def test_resume_skips_successful_companies(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    ledger = JobLedger(path)
+    for _, row in COMPANIES.head(3).iterrows():
+        ledger.start(row["cik"], row["ticker"], row["company_name"])
+    ledger.finish("0000000001", 10, filings("2024-02-15", "2024-11-01", "2024-05-01"))
+    ledger.fail("0000000002", RuntimeError("boom"))
+    ledger.close()  # C 一直是running：模拟处理到一半进程被kill
+
+    ledger = JobLedger(path)
+    assert sorted(ledger.pending(COMPANIES)["cik"]) == ["0000000002", "0000000003"]
+    assert list(ledger.pending(COMPANIES, retry_failed=True)["cik"]) == ["0000000002"]
+    assert ledger.summary() == {"success": 1, "failed": 1, "running": 1}
+    row = ledger.to_frame("success").iloc[0]
+    assert row["last_accession"] == "acc-2024-11-01"
+    assert row["filings_count"] == 3
+    assert ledger.failures() == [{"ticker": "B", "cik": "0000000002", "company_name": "B Inc", "error": "boom"}]
+
+
+def test_restart_counts_attempts_and_clears_error(tmp_path):
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    ledger.start("0000000002", "B", "B Inc")
+    ledger.fail("0000000002", "boom")
+    ledger.start("0000000002", "B", "B Inc")
+    ledger.finish("0000000002", 5)
+
+    row = ledger.to_frame().iloc[0]
+    assert row["attempts"] == 2
+    assert row["status"] == "success"
+    assert row["error"] is None
+    assert row["financial_records"] == 5
+
+
+def test_finish_job_waits_for_dataset_flush(tmp_path):
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    root = str(tmp_path / "ds")
+    df = pd.DataFrame({"metric": ["revenue"], "value": [1.0], "fiscal_year": [2023], "fiscal_period": ["FY"]})
+    writer = DatasetWriter(root)
+    ledger.start("0000000001", "A", "A Inc")
+    ledger.start("0000000002", "B", "B Inc")
+
+    writer.write("financial", df, cik="0000000001")
+    finish_job(ledger, "0000000001", 1, dataset_writer=writer)
+    finish_job(ledger, "0000000002", 0, dataset_writer=writer)  # 没写数据，直接登记
+    writer.flush()
+
+    # A 的数据还在缓冲里，不能登记成功
+    assert set(ledger.to_frame("success")["cik"]) == {"0000000002"}
+    assert len(load_table("financial", root)) == 0
+
+    writer.checkpoint()
+
+    assert set(ledger.to_frame("success")["cik"]) == {"0000000001", "0000000002"}
+    assert list(load_table("financial", root)["cik"]) == ["0000000001"]
+    writer.close()
+
+
+def test_finish_job_without_writer_is_immediate(tmp_path):
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    ledger.start("0000000001", "A", "A Inc")
+
+    finish_job(ledger, "0000000001", 3, filings("2024-02-15"))
+
+    assert ledger.results() == [{"ticker": "A", "cik": "0000000001", "company_name": "A Inc",
+                                 "status": "success", "financial_records": 3, "filings_count": 1}]
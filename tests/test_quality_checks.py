@@ -0,0 +1,106 @@
+"""质量检查（年度透视表）：资产负债平衡、OCF+ICF+FCF ≈ ΔCash、多公司面板"""
+import pandas as pd
+
+from task1_financial_data import build_annual_pivot, quality_check_financial_data, run_quality_checks
+
+
+def annual_rows(cik, year, filed=None, **values):
+    filed = filed or f"{year + 1}-02-15"
+    return [{"cik": cik, "metric": metric, "value": value, "fiscal_year": year, "fiscal_period": "FY",
+             "end_date": f"{year}-12-31", "filed_date": filed} for metric, value in values.items()]
+
+
+def company(cik, cash_by_year, cashflow=(50.0, -20.0, -10.0), assets=300.0, liabilities=100.0, equity=200.0):
+    """cash_by_year: {year: 期末现金}；每年 OCF/ICF/FCF 相同"""
+    ocf, icf, fcf = cashflow
+    rows = []
+    for year, cash in cash_by_year.items():
+        rows += annual_rows(cik, year, ocf=ocf, icf=icf, fcf=fcf, capex=-5.0, cash=cash,
+                            assets=assets, liabilities=liabilities, equity=equity)
+    return rows
+
+
+def results_for(rows, check):
+    df = run_quality_checks(pd.DataFrame(rows))
+    return df[df["check"] == check].set_index(["cik", "fiscal_year"])
+
+
+def test_cashflow_compares_sum_of_activities_with_change_in_cash():
+    # 20 = 50 - 20 - 10，2023 年现金正好多了20；2024 年只多了10
+    df = results_for(company("A", {2022: 100.0, 2023: 120.0, 2024: 130.0}), "cashflow")
+
+    assert df.loc[("A", 2022), "status"] == "skipped"
+    assert df.loc[("A", 2023), "status"] == "pass"
+    assert df.loc[("A", 2023), "lhs"] == 20.0
+    assert df.loc[("A", 2023), "rhs"] == 20.0
+    assert df.loc[("A", 2024), "status"] == "warning"
+    assert df.loc[("A", 2024), "diff"] == 10.0
+    assert df.loc[("A", 2024), "diff_pct"] == 50.0
+
+
+def test_cashflow_skips_year_after_a_gap():
+    rows = company("A", {2021: 100.0, 2022: 120.0, 2023: 140.0})
+    rows = [r for r in rows if not (r["fiscal_year"] == 2022 and r["metric"] == "fcf")]
+
+    df = results_for(rows, "cashflow")
+
+    assert 2022 not in df.loc["A"].index  # 本年数据不全的年份不出结果
+    assert df.loc[("A", 2023), "status"] == "skipped"
+    assert "Previous year (2022) data missing" in df.loc[("A", 2023), "message"]
+
+
+def test_missing_cashflow_metric_is_an_error():
+    rows = [r for r in company("A", {2022: 100.0, 2023: 120.0}) if r["metric"] != "capex"]
+
+    df = run_quality_checks(pd.DataFrame(rows))
+
+    errors = df[df["status"] == "error"]
+    assert list(errors["check"]) == ["cashflow"]
+    assert "capex" in errors["message"].iloc[0]
+
+
+def test_balance_sheet_threshold():
+    rows = company("A", {2023: 100.0}) + company("B", {2023: 100.0}, equity=150.0)
+
+    df = results_for(rows, "balance_sheet")
+
+    assert df.loc[("A", 2023), "status"] == "pass"
+    assert df.loc[("B", 2023), "status"] == "warning"
+    assert df.loc[("B", 2023), "diff"] == 50.0
+
+
+def test_panel_does_not_carry_cash_across_companies():
+    rows = company("A", {2022: 100.0, 2023: 120.0}) + company("B", {2023: 5000.0, 2024: 5020.0})
+
+    df = results_for(rows, "cashflow")
+
+    assert df.loc[("B", 2023), "status"] == "skipped"  # B 的第一年，不能拿 A 的2023现金当上一年
+    assert df.loc[("A", 2023), "status"] == "pass"
+    assert df.loc[("B", 2024), "status"] == "pass"
+
+
+def test_pivot_takes_latest_period_then_latest_filing():
+    rows = annual_rows("A", 2023, filed="2024-02-15", cash=100.0)
+    rows += annual_rows("A", 2023, filed="2025-02-15", cash=110.0)  # 重述
+    comparative = annual_rows("A", 2023, cash=90.0)[0]
+    comparative["end_date"] = "2022-12-31"  # 2023年10-K里带的上一年比较数
+    comparative["filed_date"] = "2026-01-01"
+    rows.append(comparative)
+
+    pivot = build_annual_pivot(pd.DataFrame(rows))
+
+    assert pivot.loc[("A", 2023), "cash"] == 110.0
+
+
+def test_report_dict_matches_results():
+    rows = company("A", {2022: 100.0, 2023: 120.0, 2024: 130.0})
+    for r in rows:
+        del r["cik"]
+
+    report = quality_check_financial_data(pd.DataFrame(rows), "0000000001")
+
+    assert report["errors"] == []
+    assert len(report["checks"]) == 3 + 1  # 3年资产负债 + 2023现金流
+    assert len(report["warnings"]) == 2  # 2022跳过 + 2024不平
+    assert report["checks"][0].startswith("FY2024")  # 资产负债检查按年份倒序
+    assert set(report["results"]["cik"]) == {"0000000001"}
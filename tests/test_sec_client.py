@@ -0,0 +1,120 @@
+"""sec_client 的限流重试（Retry-After、指数退避）和AIMD在途数控制，对着会返回429的桩服务器跑"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import sec_client
+from sec_stub import StubHandler
+
+SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{:010d}.json"
+
+
+def test_retry_after_is_honoured(sec_stub):
+    calls = []
+
+    def throttle_twice(path):
+        calls.append(time.monotonic())
+        return (429, {"Retry-After": "1"}) if len(calls) <= 2 else None
+
+    StubHandler.inject = throttle_twice
+    retries = sec_client.http_stats()["retries"]
+
+    resp = sec_client.sec_get(SUBMISSIONS_URL.format(1000))
+
+    assert resp.status_code == 200
+    assert resp.json()["cik"] == "1000"
+    assert len(calls) == 3
+    assert sec_client.http_stats()["retries"] - retries == 2
+    # 每次重试前至少等了Retry-After
+    assert calls[1] - calls[0] >= 1.0
+    assert calls[2] - calls[1] >= 1.0
+    report = sec_client.concurrency_report()
+    assert report["throttled"] == 2
+    assert report["limit"] < report["max_limit"]
+
+
+def test_exhausted_retries_return_last_response(sec_stub):
+    sec_client.configure_backoff(max_retries=2, base=0.01, max_delay=0.05)
+    StubHandler.inject = lambda path: (503, {})
+
+    resp = sec_client.sec_get(SUBMISSIONS_URL.format(1001))
+
+    assert resp.status_code == 503
+    assert len(StubHandler.requests) == 3  # 第一次 + 2次重试
+    with pytest.raises(requests.HTTPError):
+        resp.raise_for_status()
+
+
+def test_aimd_backs_off_when_server_throttles_concurrency(sec_stub):
+    """服务器最多同时处理4个请求，多出来的返回429：所有请求最终都成功，在途上限降到服务器能承受的水平"""
+    sec_client.configure_backoff(max_retries=8, base=0.05, max_delay=1.0)
+    controller = sec_client.configure_concurrency(initial=16, cooldown=0.2)
+    lock = threading.Lock()
+    active = {"now": 0}
+    original = StubHandler.do_GET
+
+    def limited_get(handler):
+        with lock:
+            active["now"] += 1
+            over = active["now"] > 4
+        try:
+            if over:
+                handler._empty(429)
+                return
+            time.sleep(0.02)
+            original(handler)
+        finally:
+            with lock:
+                active["now"] -= 1
+
+    StubHandler.do_GET = limited_get
+    try:
+        urls = [SUBMISSIONS_URL.format(2000 + i) for i in range(120)]
+        with ThreadPoolExecutor(16) as executor:
+            statuses = list(executor.map(lambda url: sec_client.sec_get(url).status_code, urls))
+    finally:
+        StubHandler.do_GET = original
+
+    assert statuses == [200] * len(urls)
+    report = controller.report()
+    assert report["throttled"] > 0
+    assert report["decreases"] > 0
+    assert report["lowest_limit"] <= 4
+    assert report["limit"] < 16
+
+
+def test_mid_body_disconnect_is_retried_and_releases_the_slot(sec_stub):
+    controller = sec_client.configure_concurrency(initial=4)
+    damaged = []
+
+    def truncate_first(path):
+        if not damaged:
+            damaged.append(path)
+            return "truncate"
+        return None
+
+    StubHandler.damage = truncate_first
+
+    resp = sec_client.sec_get(SUBMISSIONS_URL.format(1002))
+
+    assert resp.status_code == 200
+    assert resp.json()["cik"] == "1002"
+    assert len(StubHandler.requests) == 2
+    report = controller.report()
+    assert report["in_flight"] == 0
+    assert report["errors"] == 1
+
+
+def test_unexpected_error_still_releases_the_slot(sec_stub):
+    controller = sec_client.configure_concurrency(initial=2)
+    StubHandler.damage = lambda path: "bad_gzip"
+
+    for _ in range(3):  # 名额漏掉的话，第3次会一直卡在acquire
+        with pytest.raises(requests.exceptions.ContentDecodingError):
+            sec_client.sec_get(SUBMISSIONS_URL.format(1003))
+
+    assert controller.report()["in_flight"] == 0
+    assert len(StubHandler.requests) == 3  # 解压失败不是临时错误，不重试
@@ -0,0 +1,70 @@
+"""task2_segment_geo：iXBRL里个别事实/context有问题时只跳过那一条，其他照常提取"""
+from task2_segment_geo import extract_segment_geo_from_html
+
+CONTEXT = """<xbrli:context id="{id}"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">1</xbrli:identifier>
+<xbrli:segment><xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">{member}</xbrldi:explicitMember>
+</xbrli:segment></xbrli:entity><xbrli:period><xbrli:startDate>{start}</xbrli:startDate>
+<xbrli:endDate>2023-12-31</xbrli:endDate></xbrli:period></xbrli:context>"""
+
+FACT = """<ix:nonFraction name="us-gaap:Revenues" contextRef="{context}" unitRef="usd" decimals="-6"
+scale="{scale}" format="ixt:num-dot-decimal">{text}</ix:nonFraction>"""
+
+
+def ixbrl_10k(contexts, facts):
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"
+ xmlns:xbrli="http://www.xbrl.org/2003/instance" xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+ xmlns:us-gaap="http://fasb.org/us-gaap/2023" xmlns:acme="http://acme.example/2023"><body>
+<ix:header><ix:resources>{"".join(CONTEXT.format(**c) for c in contexts)}</ix:resources></ix:header>
+<p>Segment revenue: {"".join(FACT.format(**f) for f in facts)}</p>
+<div><p>Geographic Information (in millions)</p><table>
+<tr><td></td><td>2023</td></tr>
+<tr><td>United States</td><td>120</td></tr>
+<tr><td>China</td><td>30</td></tr>
+</table></div></body></html>"""
+
+
+GOOD_CONTEXTS = [
+    {"id": "c1", "member": "acme:AmericasSegmentMember", "start": "2023-01-01"},
+    {"id": "c2", "member": "acme:EuropeSegmentMember", "start": "2023-01-01"},
+]
+
+
+def extract(html):
+    df_segment, df_geo, missing, timing = extract_segment_geo_from_html(html, "2024-02-15", "https://example/10k.htm")
+    return df_segment, df_geo, timing
+
+
+def test_ixbrl_segments_and_table_geography():
+    html = ixbrl_10k(GOOD_CONTEXTS, [{"context": "c1", "scale": "6", "text": "100"},
+                                      {"context": "c2", "scale": "6", "text": "50"}])
+
+    df_segment, df_geo, timing = extract(html)
+
+    assert timing["source"] == {"segment": "ixbrl", "geographic": "table"}
+    assert list(df_segment["name"]) == ["Americas", "Europe"]
+    assert list(df_segment["year_2023"]) == [100e6, 50e6]
+    assert list(df_geo["name"]) == ["United States", "China"]
+
+
+def test_bad_scale_skips_only_that_fact():
+    html = ixbrl_10k(GOOD_CONTEXTS, [{"context": "c1", "scale": "6", "text": "100"},
+                                      {"context": "c2", "scale": "millions", "text": "50"}])
+
+    df_segment, df_geo, timing = extract(html)
+
+    assert timing["source"]["segment"] == "ixbrl"
+    assert list(df_segment["name"]) == ["Americas"]
+    assert df_geo is not None
+
+
+def test_malformed_context_date_skips_only_that_context():
+    contexts = GOOD_CONTEXTS + [{"id": "c3", "member": "acme:AsiaSegmentMember", "start": "2023-13-45"}]
+    html = ixbrl_10k(contexts, [{"context": "c1", "scale": "6", "text": "100"},
+                                {"context": "c3", "scale": "6", "text": "70"},
+                                {"context": "c2", "scale": "6", "text": "1.234.5"}])  # 读不出数字
+
+    df_segment, df_geo, timing = extract(html)
+
+    assert list(df_segment["name"]) == ["Americas"]
+    assert list(df_geo["name"]) == ["United States", "China"]
@@ -0,0 +1,120 @@
+"""work_queue：租约领取、过期回收、次数用完记失败、先完成的worker算数"""
+import time
+
+import pandas as pd
+
+from work_queue import WorkQueue
+
+COMPANIES = pd.DataFrame({
+    "cik": [f"{i:010d}" for i in range(1, 6)],
+    "ticker": [f"T{i}" for i in range(1, 6)],
+    "company_name": [f"Company {i}" for i in range(1, 6)],
+})
+
+
+def open_queue(tmp_path, worker_id=None):
+    return WorkQueue(str(tmp_path / "queue.sqlite"), worker_id)
+
+
+def status_of(queue, cik):
+    return queue.to_frame().set_index("cik").loc[cik]
+
+
+def test_workers_lease_disjoint_batches(tmp_path):
+    coordinator = open_queue(tmp_path)
+    assert coordinator.enqueue(COMPANIES) == 5
+    assert coordinator.enqueue(COMPANIES) == 0  # 已经在队列里的不重复放
+    a, b = open_queue(tmp_path, "a"), open_queue(tmp_path, "b")
+
+    batch_a = a.lease(batch_size=3)
+    batch_b = b.lease(batch_size=3)
+
+    assert list(batch_a["cik"]) == list(COMPANIES["cik"][:3])
+    assert list(batch_b["cik"]) == list(COMPANIES["cik"][3:])
+    assert len(a.lease()) == 0
+    assert coordinator.summary() == {"leased": 5}
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    open_queue(tmp_path).enqueue(COMPANIES.head(1))
+    a, b = open_queue(tmp_path, "a"), open_queue(tmp_path, "b")
+
+    a.lease(lease_seconds=-1)  # a 领了之后失联，租约已经过期
+    reclaimed = b.lease()
+
+    assert list(reclaimed["cik"]) == ["0000000001"]
+    row = status_of(b, "0000000001")
+    assert row["worker"] == "b"
+    assert row["attempts"] == 2
+
+
+def test_heartbeat_keeps_the_lease(tmp_path):
+    open_queue(tmp_path).enqueue(COMPANIES.head(1))
+    a, b = open_queue(tmp_path, "a"), open_queue(tmp_path, "b")
+    a.register()
+
+    a.lease(lease_seconds=-1)
+    assert a.heartbeat(lease_seconds=300) == 1
+
+    assert len(b.lease()) == 0
+    assert status_of(a, "0000000001")["lease_expires"] > time.time()
+
+
+def test_reclaim_expired_fails_after_max_attempts(tmp_path):
+    coordinator = open_queue(tmp_path)
+    coordinator.enqueue(COMPANIES.head(2))
+    worker = open_queue(tmp_path, "a")
+    worker.lease(lease_seconds=-1)
+    worker.lease(lease_seconds=-1)  # 同一批又领了一次（attempts=2）
+
+    assert coordinator.reclaim_expired(max_attempts=2) == (0, 2)
+
+    failed = coordinator.to_frame("failed")
+    assert len(failed) == 2
+    assert failed["error"].str.contains("lease expired 2 times").all()
+    assert len(worker.lease(max_attempts=2)) == 0
+
+
+def test_first_successful_finish_wins(tmp_path):
+    coordinator = open_queue(tmp_path)
+    coordinator.enqueue(COMPANIES.head(1))
+    a, b = open_queue(tmp_path, "a"), open_queue(tmp_path, "b")
+    a.register()
+    b.register()
+    a.lease(lease_seconds=-1)
+    b.lease()  # a 的租约过期，b 重领
+
+    a.finish("0000000001", 10, pd.DataFrame({"filing_date": ["2024-01-01"]}))
+    b.finish("0000000001", 99)
+    b.fail("0000000001", "late failure")
+
+    row = status_of(coordinator, "0000000001")
+    assert row["status"] == "success"
+    assert row["worker"] == "a"
+    assert row["financial_records"] == 10
+    assert row["error"] is None
+    completed = coordinator.workers().set_index("worker_id")["completed"]
+    assert completed.to_dict() == {"a": 1, "b": 0}
+
+
+def test_unregister_returns_leases(tmp_path):
+    coordinator = open_queue(tmp_path)
+    coordinator.enqueue(COMPANIES.head(2))
+    worker = open_queue(tmp_path, "a")
+    worker.register()
+    worker.lease()
+
+    worker.unregister()
+
+    df = coordinator.to_frame()
+    assert set(df["status"]) == {"pending"}
+    assert set(df["attempts"]) == {0}
+    assert coordinator.remaining() == 2
+
+
+def test_rate_share_counts_live_workers(tmp_path):
+    a, b = open_queue(tmp_path, "a"), open_queue(tmp_path, "b")
+    a.register()
+    assert a.rate_share(10.0) == 10.0
+    b.register()
+    assert a.rate_share(10.0) == 5.0
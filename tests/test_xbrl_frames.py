@@ -0,0 +1,23 @@
+"""xbrl_frames.fetch_cross_section：对着桩服务器的frames接口录制一遍、离线回放一遍"""
+import pandas as pd
+
+from sec_stub import StubHandler, company_ciks
+from xbrl_frames import fetch_cross_section
+
+
+def test_cross_section_replay(sec_stub, workdir):
+    corpus = workdir / "frames"
+    live, live_missing = fetch_cross_section("CY2023", record_dir=str(corpus))
+    requests_before = len(StubHandler.requests)
+
+    df, missing = fetch_cross_section("CY2023", fixture_dir=str(corpus))
+
+    assert len(StubHandler.requests) == requests_before
+    assert missing == live_missing
+    pd.testing.assert_frame_equal(df, live)
+    revenue = df[df["metric"] == "revenue"]
+    assert sorted(revenue["cik"]) == [f"{cik:010d}" for cik in company_ciks()]
+    # 每家公司取优先级最高的标签（桩服务器只有 Revenues）
+    assert set(revenue["metric_name"]) == {"Revenues"}
+    # 资产负债表指标用时点frame（CY2023Q4I）
+    assert (df.loc[df["metric"] == "assets", "frame"] == "CY2023Q4I").all()
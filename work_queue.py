@@ -0,0 +1,481 @@
+"""
+多机分片：基于租约（lease）的共享任务队列（SQLite）
+
+一个coordinator把要处理的CIK放进队列，任意多个worker（可以在不同机器上）从队列里领任务：
+- 租约：worker一次领 batch_size 家公司，每家公司带一个到期时间；worker活着就定期心跳续租，
+  挂掉之后租约过期，任务自动回到可领取状态，被别的worker重新领走
+  （同一家公司租约过期 max_attempts 次就记为失败，避免一家公司反复把worker搞崩）
+- 全局速率：SEC的限速是按客户端身份算的，不是按机器。coordinator把全局速率写进队列，
+  每个worker心跳时数一下还活着的worker，只用 全局速率 / worker数 的份额；
+  新worker注册后先等一个心跳间隔再发请求，让已有的worker先降速，所以加机器不会超过全局速率，
+  只是把解析（CPU）分摊到更多机器上
+
+队列文件放在所有节点都能访问的路径上（共享盘）。SQLite在网络文件系统上的锁不一定可靠，
+机器多时可以换成一个小的队列服务，只要实现 WorkQueue 同样的方法
+（enqueue / lease / heartbeat / start / finish / fail / summary）
+
+用法:
+    python final_step.py --role coordinator --queue /shared/queue.sqlite --rate 10
+    python final_step.py --role worker --queue /shared/queue.sqlite     # 每台机器各跑一个
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import pandas as pd
+
+# 一次领多少家公司
+LEASE_BATCH_SIZE = 16
+# 租约时长（秒）；心跳会不断续租，只有worker失联时才会过期
+LEASE_SECONDS = 300
+# 心跳间隔（秒）
+HEARTBEAT_INTERVAL = 15
+# 超过这么久没心跳的worker算失联，不再占速率份额
+WORKER_TIMEOUT = 60
+# 同一家公司最多领几次（租约过期也算一次）
+MAX_ATTEMPTS = 3
+
+WORK_COLUMNS = [
+    "cik", "ticker", "company_name", "status", "worker", "lease_expires", "attempts",
+    "started_at", "finished_at", "error", "financial_records", "filings_count",
+]
+
+
+class WorkQueue:
+    """
+    Args:
+        path: SQLite文件路径（所有节点共享）
+        worker_id: worker的标识；coordinator不用传
+
+    status: pending（等待领取）/ leased（某个worker正在处理）/ success / failed
+    """
+
+    def __init__(self, path, worker_id=None):
+        self.path = path
+        self.worker_id = worker_id
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # 自动提交；需要原子性的地方自己 BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS work (
+                cik TEXT PRIMARY KEY,
+                ticker TEXT,
+                company_name TEXT,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT,
+                financial_records INTEGER,
+                filings_count INTEGER
+            )"""
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_work_status ON work(status, lease_expires)")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                host TEXT,
+                pid INTEGER,
+                started_at REAL,
+                heartbeat_at REAL,
+                rate REAL,
+                completed INTEGER DEFAULT 0
+            )"""
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _transaction(self, fn):
+        """在一个写事务里执行 fn(db)（BEGIN IMMEDIATE：多个节点同时领任务时不会领到同一家）"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    # ---------- coordinator ----------
+
+    def enqueue(self, df_companies, retry_failed=False):
+        """
+        把公司放进队列（已经在队列里的不重复放）
+
+        Args:
+            df_companies: 包含 cik / ticker / company_name 的DataFrame
+            retry_failed: True时把失败的公司重新放回pending
+
+        Returns:
+            新加入的公司数
+        """
+        rows = [
+            (row["cik"], row["ticker"], row["company_name"])
+            for row in df_companies.drop_duplicates("cik").to_dict("records")
+        ]
+
+        def run(db):
+            before = db.execute("SELECT COUNT(*) FROM work").fetchone()[0]
+            db.executemany("INSERT OR IGNORE INTO work (cik, ticker, company_name) VALUES (?, ?, ?)", rows)
+            if retry_failed:
+                db.execute("""UPDATE work SET status = 'pending', attempts = 0, worker = NULL,
+                                  lease_expires = NULL, error = NULL
+                              WHERE status = 'failed'""")
+            return db.execute("SELECT COUNT(*) FROM work").fetchone()[0] - before
+        return self._transaction(run)
+
+    def set_global_rate(self, rate):
+        """全局请求速率（所有worker加起来），worker心跳时读取"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('global_rate', ?)", (str(rate),))
+
+    def global_rate(self):
+        """coordinator设置的全局速率，还没设置时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM config WHERE key = 'global_rate'").fetchone()
+        return float(row[0]) if row else None
+
+    def reclaim_expired(self, max_attempts=MAX_ATTEMPTS):
+        """
+        处理过期的租约：次数没用完的放回pending，用完的记为失败
+
+        Returns:
+            (放回pending的数量, 记为失败的数量)
+        """
+        now = time.time()
+
+        def run(db):
+            failed = db.execute(
+                """UPDATE work SET status = 'failed', finished_at = ?,
+                       error = 'lease expired ' || attempts || ' times (worker ' || COALESCE(worker, '?') || ' lost)'
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, now, max_attempts),
+            ).rowcount
+            requeued = db.execute(
+                """UPDATE work SET status = 'pending', worker = NULL, lease_expires = NULL
+                   WHERE status = 'leased' AND lease_expires < ?""",
+                (now,),
+            ).rowcount
+            return requeued, failed
+        return self._transaction(run)
+
+    def reset(self):
+        """清空队列（从头开始跑）"""
+        def run(db):
+            db.execute("DELETE FROM work")
+            db.execute("DELETE FROM workers")
+        self._transaction(run)
+
+    # ---------- worker ----------
+
+    def register(self):
+        """登记worker（心跳表里一行）"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                """INSERT OR REPLACE INTO workers (worker_id, host, pid, started_at, heartbeat_at, completed)
+                   VALUES (?, ?, ?, ?, ?, 0)""",
+                (self.worker_id, socket.gethostname(), os.getpid(), now, now),
+            )
+
+    def unregister(self):
+        """worker正常退出：删掉心跳，还没处理的租约立刻放回pending，份额让给别的worker"""
+        def run(db):
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            db.execute("""UPDATE work SET status = 'pending', worker = NULL, lease_expires = NULL,
+                              attempts = MAX(attempts - 1, 0)
+                          WHERE status = 'leased' AND worker = ?""", (self.worker_id,))
+        self._transaction(run)
+
+    def live_workers(self, timeout=WORKER_TIMEOUT):
+        """最近 timeout 秒内有心跳的worker数"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (time.time() - timeout,)
+            ).fetchone()[0]
+
+    def rate_share(self, global_rate, timeout=WORKER_TIMEOUT):
+        """这个worker的速率份额：全局速率 / 活着的worker数"""
+        return global_rate / max(self.live_workers(timeout), 1)
+
+    def heartbeat(self, lease_seconds=LEASE_SECONDS, rate=None):
+        """
+        心跳：更新worker的心跳时间，给手上所有租约续期
+
+        Returns:
+            续期的租约数
+        """
+        now = time.time()
+
+        def run(db):
+            db.execute("UPDATE workers SET heartbeat_at = ?, rate = COALESCE(?, rate) WHERE worker_id = ?",
+                       (now, rate, self.worker_id))
+            return db.execute(
+                "UPDATE work SET lease_expires = ? WHERE status = 'leased' AND worker = ?",
+                (now + lease_seconds, self.worker_id),
+            ).rowcount
+        return self._transaction(run)
+
+    def lease(self, batch_size=LEASE_BATCH_SIZE, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """
+        领一批任务（pending的，或者租约已经过期的）
+
+        Returns:
+            DataFrame: cik / ticker / company_name；没有可领的任务时为空
+        """
+        now = time.time()
+
+        def run(db):
+            # 过期且次数用完的先记失败，不再领
+            db.execute(
+                """UPDATE work SET status = 'failed', finished_at = ?,
+                       error = 'lease expired ' || attempts || ' times (worker ' || COALESCE(worker, '?') || ' lost)'
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, now, max_attempts),
+            )
+            rows = db.execute(
+                """SELECT cik, ticker, company_name FROM work
+                   WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                   ORDER BY rowid LIMIT ?""",
+                (now, batch_size),
+            ).fetchall()
+            db.executemany(
+                """UPDATE work SET status = 'leased', worker = ?, lease_expires = ?,
+                       attempts = attempts + 1, started_at = ?, error = NULL
+                   WHERE cik = ?""",
+                [(self.worker_id, now + lease_seconds, now, row[0]) for row in rows],
+            )
+            return rows
+        rows = self._transaction(run)
+        return pd.DataFrame(rows, columns=["cik", "ticker", "company_name"])
+
+    # 下面三个方法和 JobLedger 一样，worker直接把队列当台账传给 run_batch
+
+    def start(self, cik, ticker, company_name):
+        """领任务时已经登记过了，这里不用再做什么"""
+
+    def finish(self, cik, financial_records, df_filings=None):
+        """登记成功（租约过期后被别的worker重领的情况下，先完成的那个算数）"""
+        filings_count = len(df_filings) if df_filings is not None else 0
+        now = time.time()
+
+        def run(db):
+            updated = db.execute(
+                """UPDATE work SET status = 'success', worker = ?, finished_at = ?, lease_expires = NULL,
+                       error = NULL, financial_records = ?, filings_count = ?
+                   WHERE cik = ? AND status != 'success'""",
+                (self.worker_id, now, financial_records, filings_count, cik),
+            ).rowcount
+            if updated:
+                db.execute("UPDATE workers SET completed = completed + 1 WHERE worker_id = ?", (self.worker_id,))
+        self._transaction(run)
+
+    def fail(self, cik, error):
+        """登记失败（已经被别的worker做成功的不覆盖）"""
+        with self._lock:
+            self._db.execute(
+                """UPDATE work SET status = 'failed', worker = ?, finished_at = ?, lease_expires = NULL, error = ?
+                   WHERE cik = ? AND status != 'success'""",
+                (self.worker_id, time.time(), str(error), cik),
+            )
+
+    # ---------- 查询 ----------
+
+    def to_frame(self, status=None):
+        """队列内容（可按status过滤）"""
+        query = f"SELECT {', '.join(WORK_COLUMNS)} FROM work"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return pd.DataFrame(rows, columns=WORK_COLUMNS)
+
+    def workers(self):
+        """worker列表（心跳时间、当前速率份额、完成数）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT worker_id, host, pid, started_at, heartbeat_at, rate, completed FROM workers"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=["worker_id", "host", "pid", "started_at", "heartbeat_at", "rate", "completed"])
+
+    def summary(self):
+        """各状态的公司数"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall()
+        return dict(rows)
+
+    def remaining(self):
+        """还没结束（pending + leased）的公司数"""
+        summary = self.summary()
+        return summary.get("pending", 0) + summary.get("leased", 0)
+
+    def results(self):
+        """成功的公司，格式和 batch_processing_results.csv 一致"""
+        df = self.to_frame("success")
+        return df[["ticker", "cik", "company_name", "status", "financial_records", "filings_count"]].to_dict("records")
+
+    def failures(self):
+        """失败的公司，格式和 batch_processing_failed.csv 一致"""
+        df = self.to_frame("failed")
+        return df[["ticker", "cik", "company_name", "error"]].to_dict("records")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def new_worker_id():
+    """host-pid-随机后缀"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class _Heartbeat(threading.Thread):
+    """后台心跳：续租 + 按活着的worker数重新算速率份额，调整本进程的限速器"""
+
+    def __init__(self, queue, global_rate, lease_seconds, interval, on_rate):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.global_rate = global_rate
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.on_rate = on_rate
+        self.rate = None
+        self._stop_event = threading.Event()
+
+    def beat(self):
+        self.global_rate = self.queue.global_rate() or self.global_rate
+        rate = self.queue.rate_share(self.global_rate)
+        self.queue.heartbeat(self.lease_seconds, rate)
+        if rate != self.rate:
+            self.rate = rate
+            self.on_rate(rate)
+        return rate
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.beat()
+            except sqlite3.Error as e:
+                print(f"⚠️ heartbeat failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_worker(queue_path, worker_id=None, years_back=5, max_in_flight=8, batch_size=LEASE_BATCH_SIZE,
+               lease_seconds=LEASE_SECONDS, heartbeat_interval=HEARTBEAT_INTERVAL,
+               include_segments=False, dataset_writer=None, wait_for_rate=60):
+    """
+    worker：循环领任务、用 async_batch 并发处理，直到队列里没有剩余任务
+
+    Args:
+        queue_path: 共享队列文件
+        worker_id: 默认 host-pid-随机后缀
+        years_back: 回溯年数
+        max_in_flight: 本机同时在途的请求数上限
+        batch_size: 一次领几家公司
+        lease_seconds: 租约时长
+        heartbeat_interval: 心跳间隔（秒）
+        include_segments: 是否抓segment/geographic
+        dataset_writer: DatasetWriter；传了就写本机的列式数据集
+        wait_for_rate: coordinator还没设置全局速率时最多等多久（秒）
+
+    Returns:
+        (results, failed, stats)，只包含这个worker处理的公司
+    """
+    import sec_client
+    from async_batch import run_batch
+
+    queue = WorkQueue(queue_path, worker_id or new_worker_id())
+    deadline = time.monotonic() + wait_for_rate
+    global_rate = queue.global_rate()
+    while global_rate is None and time.monotonic() < deadline:
+        time.sleep(1)
+        global_rate = queue.global_rate()
+    if global_rate is None:
+        raise RuntimeError(f"no global rate in {queue_path}; start the coordinator first")
+
+    others = queue.live_workers(heartbeat_interval * 2)
+    queue.register()
+    # 整个worker共用一个限速器，心跳时按份额调整速率（不要每批重新建，否则每批开头都有一次突发）
+    limiter = sec_client.configure_rate_limit(global_rate, max_in_flight=max_in_flight)
+    heartbeat = _Heartbeat(queue, global_rate, lease_seconds, heartbeat_interval, on_rate=limiter.set_rate)
+    rate = heartbeat.beat()
+    if others:
+        # 等已有的worker在下一次心跳里降到新的份额，再开始发请求
+        time.sleep(heartbeat_interval)
+        rate = heartbeat.beat()
+    print(f"Worker {queue.worker_id}: {queue.live_workers()} live workers, rate share {rate:.2f} req/s")
+    heartbeat.start()
+
+    results = []
+    failed = []
+    start = time.monotonic()
+    try:
+        while True:
+            batch = queue.lease(batch_size, lease_seconds)
+            if len(batch) == 0:
+                if dataset_writer is not None:
+                    # 写数据集时，公司的数据落盘后才登记成功（finish_job）；领不到新任务了，把缓冲都写掉
+                    dataset_writer.checkpoint()
+                if queue.remaining() == 0:
+                    break
+                time.sleep(heartbeat_interval)  # 别的worker手上还有租约，等它们完成或过期
+                continue
+            batch_results, batch_failed, _ = run_batch(
+                batch, years_back=years_back, rate=None, max_in_flight=max_in_flight,
+                include_segments=include_segments, dataset_writer=dataset_writer, ledger=queue,
+            )
+            results.extend(batch_results)
+            failed.extend(batch_failed)
+    finally:
+        try:
+            if dataset_writer is not None:
+                dataset_writer.checkpoint()  # 等待中的登记要在关闭队列之前完成
+        finally:
+            heartbeat.stop()
+            queue.unregister()
+            queue.close()
+
+    elapsed = time.monotonic() - start
+    return results, failed, {
+        "worker_id": queue.worker_id,
+        "requests": limiter.request_count,
+        "elapsed_seconds": elapsed,
+        "achieved_rate": limiter.request_count / elapsed if elapsed > 0 else 0.0,
+        "rate_share": heartbeat.rate,
+    }
+
+
+def run_coordinator(queue_path, df_companies, global_rate, retry_failed=False, restart=False,
+                    poll_interval=HEARTBEAT_INTERVAL, wait=True):
+    """
+    coordinator：把公司放进队列、设置全局速率，然后（wait=True时）盯着进度，
+    定期回收过期租约，直到所有公司都结束
+
+    Returns:
+        WorkQueue（已经结束时可以直接取 results() / failures()）
+    """
+    queue = WorkQueue(queue_path)
+    if restart:
+        queue.reset()
+    queue.set_global_rate(global_rate)
+    added = queue.enqueue(df_companies, retry_failed=retry_failed)
+    print(f"Queue {queue_path}: {added} companies added, {queue.summary()}, global rate {global_rate} req/s")
+    while wait and queue.remaining() > 0:
+        time.sleep(poll_interval)
+        requeued, expired = queue.reclaim_expired()
+        if requeued or expired:
+            print(f"Reclaimed {requeued} expired leases ({expired} gave up)")
+        print(f"  {queue.summary()}, {queue.live_workers()} live workers")
+    return queue
@@ -0,0 +1,165 @@
+"""
+横截面抓取：XBRL frames API
+https://data.sec.gov/api/xbrl/frames/us-gaap/{tag}/{unit}/{period}.json
+
+需要"某个指标在某个期间所有公司的值"（例如CY2023的Revenues）时，
+不用下载每家公司完整的companyfacts（约1万次请求），
+每个 候选标签 x 期间 一次请求就够了（一个期间约30次）。
+同一个指标有多个候选标签时，每家公司取优先级最高的那个标签的值（和 resolve_metric_tags 一致）。
+
+frames按日历期间对齐（SEC把财年期末在日历期间前后30天内的值都归到这个frame），
+每家公司每个frame只有一个值（最新提交的那次）；原始数据里没有 fy / fp / form / filed，
+这里 fiscal_year / fiscal_period 用日历期间填，form / filed_date 留空
+"""
+import json
+import os
+import re
+import pandas as pd
+from sec_client import sec_get
+from first_01 import get_sec_headers
+from task1_financial_data import FINANCIAL_METRICS, TAG_TO_METRIC, FACT_COLUMNS
+
+FRAMES_URL = "https://data.sec.gov/api/xbrl/frames/{taxonomy}/{tag}/{unit}/{period}.json"
+
+# 时点（资产负债表）指标要用 CY2023Q4I 这样的instant期间
+INSTANT_METRICS = {"assets", "liabilities", "equity", "cash"}
+
+# frames URL里的单位写法；companyfacts里是 USD/shares
+FRAME_UNITS = {"eps": "USD-per-shares"}
+DEFAULT_FRAME_UNIT = "USD"
+
+_PERIOD_RE = re.compile(r"^CY(\d{4})(Q[1-4])?I?$")
+
+
+def frame_period(period, metric_key):
+    """
+    "CY2023" / "CY2023Q1" -> 这个指标实际请求的期间
+    时点指标：年度取Q4期末（CY2023Q4I），季度取季末（CY2023Q1I）
+    """
+    m = _PERIOD_RE.match(period)
+    if not m:
+        raise ValueError(f"Invalid frame period: {period} (expected CY2023 or CY2023Q1)")
+    year, quarter = m.groups()
+    if metric_key in INSTANT_METRICS:
+        return f"CY{year}{quarter or 'Q4'}I"
+    return f"CY{year}{quarter or ''}"
+
+
+def fixture_path(fixture_dir, tag, unit, period, taxonomy="us-gaap"):
+    return os.path.join(fixture_dir, f"{taxonomy}_{tag}_{unit}_{period}.json")
+
+
+def fetch_frame(tag, unit, period, taxonomy="us-gaap", fixture_dir=None):
+    """
+    取一个frame
+
+    Args:
+        tag / unit / period: 例如 "Revenues", "USD", "CY2023"
+        fixture_dir: 从这个目录读录好的JSON（{taxonomy}_{tag}_{unit}_{period}.json），不发请求
+
+    Returns:
+        frame JSON（dict）；SEC没有这个frame（404）时返回None
+    """
+    if fixture_dir is not None:
+        path = fixture_path(fixture_dir, tag, unit, period, taxonomy)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    url = FRAMES_URL.format(taxonomy=taxonomy, tag=tag, unit=unit, period=period)
+    resp = sec_get(url, headers=get_sec_headers())
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+def frame_records(frame, metric_key, metric_name, period=None):
+    """
+    一个frame的JSON -> extract_financial_data 格式的DataFrame（多一列cik）
+
+    Args:
+        frame: fetch_frame 的返回值
+        metric_key / metric_name: FINANCIAL_METRICS 里的键和候选标签
+        period: 调用方要的期间（"CY2023"）；时点指标请求的是 CY2023Q4I，
+                fiscal_period 按这里填成FY，和同期的流量指标对得上
+    """
+    data = frame.get("data", [])
+    if not data:
+        return pd.DataFrame(columns=["cik"] + FACT_COLUMNS)
+    m = _PERIOD_RE.match(period or frame["ccp"])
+    year, quarter = m.groups()
+    df_data = pd.DataFrame.from_records(data, columns=["accn", "cik", "start", "end", "val"])
+    return pd.DataFrame({
+        "cik": df_data["cik"].astype("int64").astype(str).str.zfill(10),
+        "metric": metric_key,
+        "metric_name": metric_name,
+        "value": df_data["val"],
+        "unit": frame.get("uom", "").replace("-per-", "/"),
+        "fiscal_year": int(year),
+        "fiscal_period": quarter or "FY",
+        "form": None,
+        "filed_date": None,
+        "start_date": df_data["start"],
+        "end_date": df_data["end"],
+        "frame": frame["ccp"],
+        "Accession_Number": df_data["accn"],
+    })
+
+
+def fetch_cross_section(period, metrics=None, fixture_dir=None, record_dir=None):
+    """
+    所有公司某个期间的财务指标
+
+    Args:
+        period: "CY2023"（年度）或 "CY2023Q1"（季度）
+        metrics: 只要这些指标（FINANCIAL_METRICS的键），None表示全部
+        fixture_dir: 用录好的frame文件代替请求（测试用）
+        record_dir: 把请求到的frame原样存到这个目录（之后可以当fixture_dir用）
+
+    Returns:
+        (df, missing)
+        df 的列是 cik + FACT_COLUMNS，metric_name 是每家公司选中的标签；
+        missing 是SEC没有数据的 [(metric, tag, period), ...]
+    """
+    metrics = metrics or list(FINANCIAL_METRICS)
+    frames = []
+    missing = []
+    for metric_key in metrics:
+        unit = FRAME_UNITS.get(metric_key, DEFAULT_FRAME_UNIT)
+        metric_period = frame_period(period, metric_key)
+        for tag in FINANCIAL_METRICS[metric_key]:
+            frame = fetch_frame(tag, unit, metric_period, fixture_dir=fixture_dir)
+            if frame is None:
+                missing.append((metric_key, tag, metric_period))
+                continue
+            if record_dir is not None:
+                os.makedirs(record_dir, exist_ok=True)
+                with open(fixture_path(record_dir, tag, unit, metric_period), "w", encoding="utf-8") as f:
+                    json.dump(frame, f)
+            frames.append(frame_records(frame, metric_key, tag, period))
+
+    if not frames:
+        return pd.DataFrame(columns=["cik"] + FACT_COLUMNS), missing
+    df = pd.concat(frames, ignore_index=True)
+    # 每家公司每个指标只保留优先级最高的标签
+    priority = df["metric_name"].map(lambda tag: TAG_TO_METRIC[tag][1])
+    best = priority.groupby([df["cik"], df["metric"]]).transform("min")
+    return df[priority == best].reset_index(drop=True), missing
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="用frames API抓所有公司某个期间的财务指标")
+    parser.add_argument("period", nargs="?", default="CY2023", help="CY2023 / CY2023Q1")
+    parser.add_argument("--fixtures", default=None, help="从录好的frame文件读取，不发请求")
+    parser.add_argument("--record", default=None, help="把请求到的frame存到这个目录")
+    args = parser.parse_args()
+    period = args.period
+    df, missing = fetch_cross_section(period, fixture_dir=args.fixtures, record_dir=args.record)
+    print(f"{period}: {len(df)} records, {df['cik'].nunique()} companies")
+    print(df.groupby("metric").size())
+    for metric_key, tag, metric_period in missing:
+        print(f"  missing: {metric_key} ({tag} {metric_period})")
+    df.to_csv(f"frames_{period}.csv", index=False)